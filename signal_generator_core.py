@@ -0,0 +1,3650 @@
+"""
+Headless core of the FPGA stimulus generator: signal generators and streams, fixed-point
+quantizers, .hex/.mem/.bin codecs, the stage-cached pipeline and batch jobs.
+
+Imports only numpy (and the standard library); scipy is imported on first use (FIR design,
+.mat export). The Tk GUI in signal_generator_gui.py is built on top of this module.
+"""
+import math
+import os
+import threading
+import collections
+import time
+import functools
+import contextlib
+from fractions import Fraction
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 公开接口：signal_generator_gui 以 from signal_generator_core import * 再导出这些名字
+__all__ = [
+    'StageProfiler', 'profiling', 'instrumented', 'format_stage_stats', 'generate_sine', 'generate_square',
+    'LFSR_TAPS', 'lfsr_jump', 'lfsr_state_at', 'lfsr_bits', 'lfsr_run', 'generate_prbs',
+    'generate_white_noise', 'FIR_CACHE_SIZE', 'FIR_CACHE_DIR', 'FIR_WINDOW', 'set_fir_cache_dir',
+    'clear_fir_cache', 'cached_firwin', 'design_bandlimit_fir', 'FIR_FFT_MIN_TAPS', 'StreamingFIR',
+    'float_to_signed_twos', 'QUANT_CHUNK', 'uint_dtype', 'quantize_signed', 'quantize_unsigned',
+    'value_range', 'reconstruct_signed', 'reconstruct_unsigned', 'quantize_reconstruct', 'save_hex',
+    'uints_to_bytes', 'byte_columns', 'save_bin', 'save_raw_csv', 'save_raw_mat', 'hex_encode', 'hex_rows',
+    'hex_decode', 'make_hex_lines', 'DEFAULT_BLOCK_SIZE', 'SignalStream', 'SineStream', 'dds_sine_lut',
+    'NCOStream', 'fill_periodic', 'SQUARE_MAX_DENOMINATOR', 'SQUARE_TABLE_MAX', 'SquareStream', 'PRBSStream',
+    'WhiteNoiseStream', 'MultiChannelStream', 'MULTISINE_MAX_PERIOD', 'MULTISINE_BANK_BLOCK',
+    'parse_float_list', 'multisine_phases', 'multisine_period', 'MultisineStream', 'generate_multisine',
+    'JobCancelled', 'iter_quantized', 'export_quantized_stream', 'EXPORT_WINDOW_BYTES', 'write_quantized',
+    'QuantizedWriter', 'channel_paths', 'write_quantized_channels', 'MappedSamples', 'load_samples',
+    'EnvelopePyramid', 'QuantizedEnvelope', 'WELCH_WINDOWS', 'WELCH_SEGMENT_BATCH', 'FILE_BLOCK_BYTES',
+    'welch_window', 'WelchPSD', 'ErrorStats', 'iter_file_blocks', 'FIXED_FIR_ROUNDING', 'sign_extend',
+    'wrap_signed', 'shift_round', 'quantize_coefficients', 'load_coefficients', 'FixedPointFIR',
+    'export_fixed_fir', 'ADAPTIVE_ALGORITHMS', 'FDAF_POWER_SMOOTHING', 'FDAF_REGULARIZATION',
+    'AdaptiveFilter', 'save_adaptive_weights', 'PIPELINE_CACHE_BYTES', 'stage_key', 'StageCache',
+    'SignalPipeline', 'BATCH_DEFAULTS', 'stimulus_name', 'job_seed', 'CHANNEL_INHERITED', 'channel_jobs',
+    'job_stream', 'FIR_SIM_FIELDS', 'job_fixed_fir', 'fir_output_path', 'load_spec', 'load_jobs',
+    'prepare_jobs', 'run_job', 'run_batch', 'PARAM_FIELDS', 'SIGNAL_TYPES', 'OUTPUT_FIELDS',
+    'SPEC_FILE_FORMATS', 'spec_fields', 'expand_spec', 'StageNode', 'PLAN_STAGES', 'BatchPlan',
+    'OutputWriter', 'run_plan_group', 'run_spec'
+]
+
+# json / hashlib / secrets / tracemalloc / scipy 只在用到时导入，保持冷启动导入开销接近 numpy 本身
+
+# ---------------------------------------------------------------------------
+# Per-stage instrumentation
+# ---------------------------------------------------------------------------
+
+# 当前线程正在使用的 StageProfiler；为 None 时被 @instrumented 包装的函数直接调用原函数
+_PROFILER = None
+
+
+class StageProfiler:
+    """
+    Wall time, sample count and peak traced allocation per pipeline stage.
+
+    Stages nest: ``self_seconds`` excludes the time spent in inner stages (so the stages of
+    an export add up to its wall time), ``seconds`` includes it. A stage entered again
+    inside itself (a multi-channel stream reading its channels) is counted once, at the
+    outer level. peak_bytes is the largest allocation above the stage's starting point,
+    traced with tracemalloc when memory=True.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        if memory:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+        self.thread = threading.get_ident()
+        self.stats = {}
+        self.started = time.perf_counter()
+        self.wall = None
+        self._stack = []
+
+    def enter(self, stage):
+        if any(f[0] == stage for f in self._stack):
+            return None
+        # [stage, start time, time in inner stages, traced bytes at start, peak traced bytes]
+        frame = [stage, time.perf_counter(), 0.0, 0, 0]
+        if self.memory:
+            current, peak = self._tracemalloc.get_traced_memory()
+            # reset_peak() is global; fold the peak so far into the enclosing stages first
+            for f in self._stack:
+                f[4] = max(f[4], peak)
+            self._tracemalloc.reset_peak()
+            frame[3] = frame[4] = current
+        self._stack.append(frame)
+        return frame
+
+    def exit(self, frame, samples):
+        stage, t0, inner, mem0, peak = frame
+        elapsed = time.perf_counter() - t0
+        self._stack.pop()
+        if self.memory:
+            peak = max(peak, self._tracemalloc.get_traced_memory()[1])
+        if self._stack:
+            self._stack[-1][2] += elapsed
+            self._stack[-1][4] = max(self._stack[-1][4], peak)
+        st = self.stats.get(stage)
+        if st is None:
+            st = self.stats[stage] = {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0,
+                                      'samples': 0, 'peak_bytes': 0}
+        st['calls'] += 1
+        st['seconds'] += elapsed
+        st['self_seconds'] += elapsed - inner
+        st['samples'] += int(samples)
+        if self.memory:
+            st['peak_bytes'] = max(st['peak_bytes'], int(peak - mem0))
+
+    def summary(self):
+        """{'wall_seconds': ..., 'stages': {stage: {...}}} (JSON-serializable)."""
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+        return {'wall_seconds': wall, 'stages': {k: dict(v) for k, v in self.stats.items()}}
+
+
+@contextlib.contextmanager
+def profiling(memory=False):
+    """
+    Record @instrumented stages called from this thread while the block runs.
+
+    memory=True also traces allocations (tracemalloc), which slows Python-level code
+    noticeably; without it the cost is two perf_counter() calls per stage call.
+    """
+    global _PROFILER
+    prof = StageProfiler(memory)
+    previous = _PROFILER
+    started_tracing = memory and not prof._tracemalloc.is_tracing()
+    if started_tracing:
+        prof._tracemalloc.start()
+    _PROFILER = prof
+    try:
+        yield prof
+    finally:
+        prof.wall = time.perf_counter() - prof.started
+        _PROFILER = previous
+        if started_tracing:
+            prof._tracemalloc.stop()
+
+
+def instrumented(stage, count=None):
+    """
+    Decorator: record each call as ``stage`` while profiling() is active in the calling
+    thread. count(result, args) returns the number of samples handled (default len(result)).
+    Disabled, the wrapper costs one global lookup.
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            prof = _PROFILER
+            if prof is None or prof.thread != threading.get_ident():
+                return func(*args, **kwargs)
+            frame = prof.enter(stage)
+            if frame is None:
+                return func(*args, **kwargs)
+            samples = 0
+            try:
+                result = func(*args, **kwargs)
+                samples = count(result, args) if count is not None else len(result)
+                return result
+            finally:
+                prof.exit(frame, samples)
+        return inner
+    return wrap
+
+
+def _arg_size(result, args):
+    return np.size(args[0])
+
+
+def _line_count(result, args):
+    lines = args[0]
+    if isinstance(lines, (bytes, bytearray, memoryview)):
+        return bytes(lines).count(b'\n')
+    return len(lines)
+
+
+def format_stage_stats(summary):
+    """One-line text for the status bar, e.g. 'generate 0.42 s (11 MS/s) | write 0.20 s | peak 36 MB'."""
+    stages = summary.get('stages', {})
+    parts = []
+    for stage, st in sorted(stages.items(), key=lambda kv: -kv[1]['self_seconds']):
+        t = st['self_seconds']
+        text = '%s %.3g s' % (stage, t)
+        if st['samples'] and t > 0:
+            text += ' (%.3g MS/s)' % (st['samples'] / t / 1e6)
+        parts.append(text)
+    peak = max([st['peak_bytes'] for st in stages.values()] + [0])
+    if peak:
+        parts.append('peak %.1f MB' % (peak / 2.0 ** 20))
+    parts.append('total %.3g s' % summary.get('wall_seconds', 0.0))
+    return ' | '.join(parts)
+
+
+def _random_seed():
+    """Fresh 63-bit seed from the OS for random signals without a user seed."""
+    import secrets
+    return secrets.randbits(63)
+
+
+def generate_sine(num_samples, amplitude, frequency, phase, sample_rate):
+    t = np.arange(num_samples) / float(sample_rate)
+    return amplitude * np.sin(2 * np.pi * frequency * t + phase)
+
+
+def generate_square(num_samples, amplitude, frequency, duty, sample_rate):
+    """+/-amplitude square/pulse wave, high for the first `duty` of each cycle (see SquareStream)."""
+    return SquareStream(num_samples, amplitude, frequency, duty, sample_rate).read_all()
+
+
+# 支持的 LFSR taps（zero-based bit indices）—常用的最大长度多项式 taps
+# Expanded taps table (zero-based bit indices). These are common maximal-length taps.
+LFSR_TAPS = {
+    5:  [4, 1],    # x^5 + x^2 + 1
+    7:  [6, 5],    # x^7 + x^6 + 1
+    9:  [8, 4],    # x^9 + x^5 + 1
+    11: [10, 8],   # x^11 + x^9 + 1
+    13: [12, 11, 10, 7],  # x^13 + x^12 + x^11 + x^8 + 1
+    15: [14, 13],  # x^15 + x^14 + 1
+    17: [16, 13],  # x^17 + x^14 + 1
+    19: [18, 5],   # x^19 + x^6 + 1
+    23: [22, 17],  # x^23 + x^18 + 1
+    29: [28, 1],   # x^29 + x^2 + 1
+    31: [30, 27],  # x^31 + x^28 + 1
+}
+
+# 位并行生成时单次 XOR 的最大块长（必须是 2 的幂）
+_LFSR_MAX_BLOCK = 1 << 18
+
+
+def _lfsr_mask(taps):
+    mask = 0
+    for t in taps:
+        mask |= (1 << t)
+    return mask
+
+
+def _lfsr_initial_state(order, seed):
+    # 初始化寄存器：使用 seed 的低 order 位，若为 None 或 0 则使用全 1（避免全 0 锁死）
+    if seed is None or int(seed) == 0:
+        return (1 << order) - 1
+    reg = int(seed) & ((1 << order) - 1)
+    return reg if reg != 0 else 1
+
+
+def _lfsr_step(reg, mask, order):
+    """Advance the Fibonacci register by one bit (bit 0 is the output bit)."""
+    fb = bin(reg & mask).count('1') & 1
+    # 右移并在最高位写入反馈
+    reg = (reg >> 1) | (fb << (order - 1))
+    # 防止意外进入全零状态
+    if reg == 0:
+        reg = (1 << order) - 1
+    return reg
+
+
+def _gf2_mulmod(a, b, poly, order):
+    """Multiply two GF(2) polynomials (bit-packed ints) modulo ``poly`` of degree ``order``."""
+    res = 0
+    while b:
+        if b & 1:
+            res ^= a
+        b >>= 1
+        a <<= 1
+        if (a >> order) & 1:
+            a ^= poly
+    return res
+
+
+def lfsr_jump(reg, order, taps, steps):
+    """
+    Return the register state ``steps`` clocks after ``reg`` in O(order^2 * log(steps)).
+
+    Uses x^steps mod p(x), p(x) = x^order + sum(x^t for t in taps): the state after k clocks
+    is the XOR of the states after j < order clocks for every x^j present in the remainder.
+    Only valid once the register is past the all-zero reset (see lfsr_state_at).
+    """
+    steps = int(steps)
+    if steps <= 0:
+        return reg
+    mask = _lfsr_mask(taps)
+    poly = (1 << order) | mask
+    # x^steps mod p(x) by square-and-multiply
+    r, base, k = 1, 2, steps
+    while k:
+        if k & 1:
+            r = _gf2_mulmod(r, base, poly, order)
+        base = _gf2_mulmod(base, base, poly, order)
+        k >>= 1
+    out = 0
+    s = reg
+    for j in range(order):
+        if (r >> j) & 1:
+            out ^= s
+        s = _lfsr_step(s, mask, order)
+    return out
+
+
+def lfsr_state_at(order, seed, offset=0):
+    """Register state just before output bit ``offset`` of the sequence started from ``seed``."""
+    taps = LFSR_TAPS[order]
+    mask = _lfsr_mask(taps)
+    reg = _lfsr_initial_state(order, seed)
+    # 全零复位只可能发生在前 order 步之内，之后序列是纯线性的，可以直接跳跃
+    head = min(int(offset), order)
+    for _ in range(head):
+        reg = _lfsr_step(reg, mask, order)
+    return lfsr_jump(reg, order, taps, int(offset) - head)
+
+
+def lfsr_bits(order, seed, num_bits, start=0):
+    """
+    Return bits ``start .. start+num_bits-1`` of the LFSR sequence as a uint8 0/1 array.
+
+    Bit-for-bit identical to clocking the register one step at a time, but the bulk is
+    produced block-wise: the sequence also obeys p(x)^B = p(x^B) for B = 2^j, i.e.
+    s[k + order*B] = XOR(s[k + t*B] for t in taps), so B new bits come from one vectorized
+    XOR of len(taps) slices. B doubles as the known prefix grows.
+    """
+    num_bits = int(num_bits)
+    if num_bits <= 0:
+        return np.empty(0, dtype=np.uint8)
+    reg = lfsr_state_at(order, seed, start)
+    return lfsr_run(reg, order, num_bits, start)[0]
+
+
+def lfsr_run(reg, order, num_bits, start=0):
+    """
+    Clock ``num_bits`` output bits out of register state ``reg``.
+
+    ``start`` is the position of ``reg`` in the sequence (only the first ``order`` positions
+    need the scalar path). Returns (bits, reg_after) so a caller can continue block by block.
+    """
+    taps = LFSR_TAPS[order]
+    mask = _lfsr_mask(taps)
+    num_bits = int(num_bits)
+    start = int(start)
+    out = np.empty(max(num_bits, 0), dtype=np.uint8)
+    # 前 order 步逐位生成（覆盖可能的全零复位），之后没有复位
+    pos = 0
+    while pos < num_bits and start + pos < order:
+        out[pos] = reg & 1
+        reg = _lfsr_step(reg, mask, order)
+        pos += 1
+    if pos >= num_bits:
+        return out, reg
+    # work buffer: the current register contents followed by the bits still to produce
+    total = order + (num_bits - pos)
+    buf = np.empty(total, dtype=np.uint8)
+    buf[:order] = (reg >> np.arange(order)) & 1
+    known = order
+    block = 1
+    while known < total:
+        while order * block * 2 <= known and block * 2 <= _LFSR_MAX_BLOCK:
+            block *= 2
+        n = min(block, total - known)
+        lo = known - (order - taps[0]) * block
+        acc = buf[lo:lo + n].copy()
+        for t in taps[1:]:
+            lo = known - (order - t) * block
+            np.bitwise_xor(acc, buf[lo:lo + n], out=acc)
+        buf[known:known + n] = acc
+        known += n
+    out[pos:] = buf[:num_bits - pos]
+    # the last `order` bits of the buffer are the register contents after these bits
+    tail = np.packbits(buf[num_bits - pos:], bitorder='little').tobytes()
+    return out, int.from_bytes(tail, 'little')
+
+
+def generate_prbs(num_samples, amplitude, seed=None, order=None, mode='lfsr', start=0):
+    """
+    生成 PRBS 序列。
+
+    参数:
+      - num_samples: 采样点数
+      - amplitude: ±振幅映射到 bit 为 0/1 映射为 -amp/+amp
+      - seed: 整数种子（作为 LFSR 的初始状态或 RNG 种子）
+      - order: LFSR 阶（如 7, 15, 31）；如果为 None，则回退到 RNG 模式
+      - mode: 'lfsr' 或 'rng'，优先使用 lfsr 当 order 有效
+      - start: LFSR 序列的起始偏移（跳跃到序列中间，O(log start)）
+
+    返回浮点数组（长度 num_samples），值为 ±amplitude
+    """
+    # normalize mode
+    mode = (mode or '').lower()
+    use_lfsr = (mode == 'lfsr') and (order in LFSR_TAPS)
+    if use_lfsr:
+        out = lfsr_bits(order, seed, num_samples, start=start).view(np.int8)
+        return amplitude * (2 * out - 1)
+
+    # 回退到 RNG 模式（与之前实现兼容）
+    rng = np.random.default_rng(seed)
+    bits = rng.integers(0, 2, size=num_samples)
+    return amplitude * (2 * bits - 1)
+
+
+def generate_white_noise(num_samples, amplitude, sample_rate, lowcut, highcut, fir_order, seed=None,
+                         phase='zero', method='auto'):
+    """
+    Generate band-limited white Gaussian noise. Try to use scipy.signal.firwin to design a
+    linear-phase FIR and apply it with StreamingFIR. If scipy is not available or filter
+    design fails, fall back to raw Gaussian noise (WhiteNoiseStream.filter_mode says which).
+
+    lowcut, highcut in Hz. If lowcut <= 0 and highcut >= fs/2 -> return raw noise.
+    phase: 'zero' (group delay compensated) or 'linear' (causal); method: 'auto', 'direct', 'fft'.
+    Identical to concatenating the blocks of WhiteNoiseStream with the same seed.
+    """
+    return WhiteNoiseStream(num_samples, amplitude, sample_rate, lowcut, highcut, fir_order,
+                            seed=seed, phase=phase, method=method).read_all()
+
+
+# FIR 设计缓存：内存 LRU（条目数上限）+ 可选磁盘目录（跨会话/批处理进程复用）
+FIR_CACHE_SIZE = 32
+FIR_CACHE_DIR = os.environ.get('SIGGEN_FIR_CACHE') or None
+FIR_WINDOW = 'hamming'
+_FIR_CACHE = collections.OrderedDict()
+_FIR_CACHE_LOCK = threading.Lock()
+_firwin = None
+
+
+def _get_firwin():
+    """Import scipy.signal.firwin once; False when scipy is not available."""
+    global _firwin
+    if _firwin is None:
+        try:
+            from scipy.signal import firwin
+            _firwin = firwin
+        except Exception:
+            _firwin = False
+    return _firwin
+
+
+def set_fir_cache_dir(path):
+    """Enable (path) or disable (None) the on-disk FIR cache; batch workers inherit it."""
+    global FIR_CACHE_DIR
+    FIR_CACHE_DIR = path or None
+    if path:
+        os.makedirs(path, exist_ok=True)
+        os.environ['SIGGEN_FIR_CACHE'] = path
+    else:
+        os.environ.pop('SIGGEN_FIR_CACHE', None)
+
+
+def clear_fir_cache():
+    """Drop the in-memory FIR cache (the on-disk store is left alone)."""
+    with _FIR_CACHE_LOCK:
+        _FIR_CACHE.clear()
+
+
+def _fir_cache_path(key):
+    import hashlib
+    name = hashlib.sha1(repr(key).encode('ascii')).hexdigest()
+    return os.path.join(FIR_CACHE_DIR, 'fir_%s.npy' % name)
+
+
+def cached_firwin(numtaps, cutoff, pass_zero=True, window=FIR_WINDOW):
+    """
+    firwin(numtaps, cutoff, pass_zero=..., window=...) through the LRU and on-disk caches.
+
+    cutoff is normalized to Nyquist, so the sample rate is already part of the key and one
+    design serves every (fs, band) with the same ratios. The returned array is shared and
+    read-only. Returns None when scipy is not available.
+    """
+    cut = tuple(float(c) for c in np.atleast_1d(cutoff))
+    key = (int(numtaps), cut, bool(pass_zero), str(window))
+    with _FIR_CACHE_LOCK:
+        taps = _FIR_CACHE.get(key)
+        if taps is not None:
+            _FIR_CACHE.move_to_end(key)
+            return taps
+    path = _fir_cache_path(key) if FIR_CACHE_DIR else None
+    taps = None
+    if path and os.path.exists(path):
+        try:
+            taps = np.load(path)
+            if taps.shape != (key[0],):
+                taps = None
+        except Exception:
+            taps = None
+    if taps is None:
+        firwin = _get_firwin()
+        if not firwin:
+            return None
+        taps = np.asarray(firwin(key[0], cut if len(cut) > 1 else cut[0], pass_zero=pass_zero,
+                                 window=window), dtype=float)
+        if path:
+            # write-then-rename so parallel batch workers never read a partial file
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            try:
+                with open(tmp, 'wb') as f:
+                    np.save(f, taps)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+    taps.setflags(write=False)
+    with _FIR_CACHE_LOCK:
+        _FIR_CACHE[key] = taps
+        _FIR_CACHE.move_to_end(key)
+        while len(_FIR_CACHE) > FIR_CACHE_SIZE:
+            _FIR_CACHE.popitem(last=False)
+    return taps
+
+
+# FIR 设计（首次调用还包括 scipy 的导入）单独计时，样本数记为 0
+@instrumented('design', lambda taps, args: 0)
+def design_bandlimit_fir(sample_rate, lowcut, highcut, fir_order):
+    """Return firwin taps for the lowcut/highcut band, or None when no filtering applies."""
+    fs = float(sample_rate)
+    # sanitize
+    lowf = max(0.0, float(lowcut))
+    highf = float(highcut)
+    nyq = fs / 2.0
+    if highf <= 0 or highf <= lowf:
+        return None
+    if lowf <= 0 and highf >= nyq - 1e-9:
+        return None
+
+    numtaps = max(3, int(round(fir_order)))
+    # ensure numtaps is odd for Type I linear phase
+    if numtaps % 2 == 0:
+        numtaps += 1
+
+    # designed via scipy firwin (cached); None if scipy not available
+    try:
+        if lowf <= 0:
+            # lowpass
+            cutoff = min(max(highf / nyq, 1e-6), 0.9999)
+            return cached_firwin(numtaps, cutoff)
+        elif highf >= nyq - 1e-9:
+            # highpass
+            cutoff = min(max(lowf / nyq, 1e-6), 0.9999)
+            return cached_firwin(numtaps, cutoff, pass_zero=False)
+        else:
+            # bandpass
+            wn = [max(lowf/nyq, 1e-6), min(highf/nyq, 0.9999)]
+            if wn[1] <= wn[0]:
+                return None
+            return cached_firwin(numtaps, wn, pass_zero=False)
+    except Exception:
+        return None
+
+
+# auto 模式下从该抽头数起使用 FFT overlap-save
+FIR_FFT_MIN_TAPS = 256
+
+
+class StreamingFIR:
+    """
+    Block FIR filter that carries its state (the last len(taps)-1 inputs, the FIR form of
+    lfilter's zi) from one process() call to the next.
+
+    method:
+      - 'direct': np.convolve over history + block; every output is one full-length dot
+        product, so the result does not depend on how the input is split.
+      - 'fft': overlap-save with a fixed FFT size (``nfft``, default 8x the taps rounded up
+        to a power of two); O(log nfft) work per sample instead of O(len(taps)).
+      - 'auto': 'fft' from FIR_FFT_MIN_TAPS taps on, else 'direct'.
+    Output is causal (linear phase, delay = group_delay samples for symmetric taps).
+    """
+
+    def __init__(self, taps, method='auto', nfft=None):
+        self.taps = np.asarray(taps, dtype=float).ravel()
+        ntaps = len(self.taps)
+        if method == 'auto':
+            method = 'fft' if ntaps >= FIR_FFT_MIN_TAPS else 'direct'
+        if method not in ('direct', 'fft'):
+            raise ValueError("method must be 'auto', 'direct' or 'fft'")
+        self.method = method
+        if method == 'fft':
+            if nfft is None:
+                nfft = 1 << int(math.ceil(math.log2(max(8 * ntaps, 1024))))
+            if nfft < ntaps:
+                raise ValueError('nfft must be at least the number of taps')
+            self.nfft = int(nfft)
+            self.hop = self.nfft - ntaps + 1
+            self._spectrum = np.fft.rfft(self.taps, self.nfft)
+        else:
+            self.nfft = None
+            self.hop = DEFAULT_BLOCK_SIZE
+        self.reset()
+
+    @property
+    def group_delay(self):
+        return (len(self.taps) - 1) // 2
+
+    def reset(self):
+        self._hist = np.zeros(len(self.taps) - 1)
+
+    def _push_history(self, xx):
+        self._hist = xx[len(xx) - len(self._hist):].copy()
+
+    @instrumented('filter')
+    def process(self, x):
+        x = np.asarray(x, dtype=float)
+        if x.size == 0:
+            return x.copy()
+        nhist = len(self._hist)
+        if self.method == 'direct':
+            xx = np.concatenate((self._hist, x))
+            self._push_history(xx)
+            return np.convolve(xx, self.taps, mode='valid')
+        out = np.empty(x.size)
+        for i in range(0, x.size, self.hop):
+            seg = x[i:i + self.hop]
+            xx = np.concatenate((self._hist, seg))
+            y = np.fft.irfft(np.fft.rfft(xx, self.nfft) * self._spectrum, self.nfft)
+            out[i:i + seg.size] = y[nhist:nhist + seg.size]
+            self._push_history(xx)
+        return out
+
+    def describe(self):
+        if self.method == 'fft':
+            return '%d-tap FIR, FFT overlap-save (nfft %d)' % (len(self.taps), self.nfft)
+        return '%d-tap FIR, direct' % len(self.taps)
+
+
+def float_to_signed_twos(value, total_bits):
+    mask = (1 << total_bits) - 1
+    return int(value) & mask
+
+
+# 量化按块进行：临时缓冲只有 QUANT_CHUNK 个样本（常驻缓存），结果直接写入 out
+QUANT_CHUNK = 1 << 16
+
+
+def uint_dtype(total_bits):
+    """Smallest unsigned dtype that holds total_bits-wide codes (uint8 .. uint64)."""
+    for dt in (np.uint8, np.uint16, np.uint32):
+        if total_bits <= 8 * np.dtype(dt).itemsize:
+            return np.dtype(dt)
+    return np.dtype(np.uint64)
+
+
+def _quant_out(values, total_bits, out, compact):
+    if out is None:
+        out = np.empty(np.shape(values), dtype=uint_dtype(total_bits) if compact else np.uint64)
+    elif out.shape != np.shape(values):
+        raise ValueError('out has shape %r, expected %r' % (out.shape, np.shape(values)))
+    return out
+
+
+@instrumented('quantize')
+def quantize_signed(values, total_bits, frac_bits, out=None, compact=False):
+    """
+    Round to Q(total_bits - frac_bits).frac_bits, saturate, and return two's-complement codes.
+
+    Works in QUANT_CHUNK blocks with reused scratch buffers and writes into ``out``
+    (any unsigned array of the right shape). The default result is uint64; compact=True
+    returns the smallest dtype for total_bits. Codes are the same either way.
+    """
+    values = np.asarray(values)
+    out = _quant_out(values, total_bits, out, compact)
+    scale = 2 ** frac_bits
+    max_int = 2 ** (total_bits - 1) - 1
+    min_int = -2 ** (total_bits - 1)
+    # convert to unsigned representation (two's complement) for storage
+    mask = (1 << total_bits) - 1
+    flat, oflat = values.reshape(-1), out.reshape(-1)
+    fbuf = np.empty(min(QUANT_CHUNK, flat.size), dtype=(flat[:0] * scale).dtype)
+    ibuf = np.empty(fbuf.size, dtype=np.int64)
+    for i in range(0, flat.size, QUANT_CHUNK):
+        blk = flat[i:i + QUANT_CHUNK]
+        f, n = fbuf[:blk.size], ibuf[:blk.size]
+        np.multiply(blk, scale, out=f)
+        np.round(f, out=f)
+        np.copyto(n, f, casting='unsafe')
+        np.clip(n, min_int, max_int, out=n)
+        np.bitwise_and(n, mask, out=n)
+        np.copyto(oflat[i:i + blk.size], n, casting='unsafe')
+    return out
+
+
+@instrumented('quantize')
+def quantize_unsigned(values, total_bits, vmin=None, span=None, out=None, compact=False):
+    """
+    Shift to a non-negative range and scale to the full unsigned range of total_bits.
+
+    Codes are round((x - vmin) / span * (2^N - 1)), span = max - vmin. vmin / span may be
+    given when quantizing a block of a longer signal; by default both come from one chunked
+    min/max pass over ``values``.
+    out / compact as for quantize_signed.
+    """
+    values = np.asarray(values)
+    out = _quant_out(values, total_bits, out, compact)
+    flat, oflat = values.reshape(-1), out.reshape(-1)
+    if vmin is None or span is None:
+        lo, hi = value_range(flat)
+        if vmin is None:
+            vmin = lo
+        if span is None:
+            # max(x - vmin) == max(x) - vmin, float subtraction is monotonic
+            span = hi - vmin
+    if span == 0:
+        out[...] = 0
+        return out
+    scale = (2 ** total_bits - 1) / float(span)
+    fbuf = np.empty(min(QUANT_CHUNK, flat.size), dtype=(flat[:0] - vmin).dtype)
+    for i in range(0, flat.size, QUANT_CHUNK):
+        blk = flat[i:i + QUANT_CHUNK]
+        f = fbuf[:blk.size]
+        np.subtract(blk, vmin, out=f)
+        np.multiply(f, scale, out=f)
+        np.round(f, out=f)
+        np.copyto(oflat[i:i + blk.size], f, casting='unsafe')
+    return out
+
+
+def value_range(values, chunk=QUANT_CHUNK):
+    """(min, max) in a single pass: each chunk is reduced twice while it is still in cache."""
+    flat = np.asarray(values).reshape(-1)
+    lo = hi = None
+    for i in range(0, flat.size, chunk):
+        blk = flat[i:i + chunk]
+        bmin, bmax = blk.min(), blk.max()
+        lo = bmin if lo is None else np.minimum(lo, bmin)
+        hi = bmax if hi is None else np.maximum(hi, bmax)
+    if lo is None:
+        raise ValueError('zero-size array has no range')
+    return lo, hi
+
+
+@instrumented('reconstruct')
+def reconstruct_signed(uints, total_bits, frac_bits):
+    """Interpret two's-complement bit patterns and scale back to float (Q format)."""
+    ui = np.asarray(uints).astype(np.int64)
+    sign_mask = 1 << (total_bits - 1)
+    wrap = (ui & sign_mask) != 0
+    if wrap.any():
+        ui = np.where(wrap, ui - (1 << total_bits), ui)
+    return ui / float(2 ** frac_bits)
+
+
+@instrumented('reconstruct')
+def reconstruct_unsigned(uints, total_bits, vmin, vmax):
+    """Map unsigned codes 0..2^N-1 linearly back onto [vmin, vmax]."""
+    return (np.asarray(uints).astype(float) / (2 ** total_bits - 1)) * (vmax - vmin) + vmin
+
+
+def quantize_reconstruct(values, total_bits, frac_bits, unsigned=False, vmin=None, span=None):
+    """
+    Value of each sample after quantize -> reconstruct (what the quantized preview draws).
+
+    Unsigned scaling uses vmin / span, the range of the whole signal (default: of values).
+    The map is monotonic non-decreasing, so it commutes with min and max.
+    """
+    values = np.asarray(values, dtype=float)
+    if not unsigned:
+        u = quantize_signed(values, total_bits, frac_bits, compact=True)
+        return reconstruct_signed(u, total_bits, frac_bits)
+    if vmin is None or span is None:
+        if values.size == 0:
+            return values.copy()
+        lo, hi = value_range(values)
+        vmin, span = lo, hi - lo
+    u = quantize_unsigned(values, total_bits, vmin=vmin, span=span, compact=True)
+    return reconstruct_unsigned(u, total_bits, vmin, vmin + (span if span != 0 else 1.0))
+
+
+@instrumented('write', _line_count)
+def save_hex(lines, path):
+    """Write hex text: either a list of line strings or the buffer returned by hex_encode."""
+    if isinstance(lines, (bytes, bytearray)):
+        if os.linesep == '\n':
+            with open(path, 'wb') as f:
+                f.write(lines)
+            return
+        text = lines.decode('ascii')
+    elif isinstance(lines, str):
+        text = lines
+    else:
+        text = ''.join(v + '\n' for v in lines)
+    # 文本模式一次写入（保留平台换行符，与逐行写入结果一致）
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+@instrumented('format', _arg_size)
+def uints_to_bytes(uints, total_bits, byteorder='big'):
+    """
+    Pack unsigned samples into a fixed-width byte buffer, (total_bits + 7) // 8 bytes each.
+
+    Same bytes as int(v).to_bytes(bytes_per, byteorder) per sample; odd widths such as
+    24 bits (3 bytes, no native dtype) need no padding. See byte_columns.
+    """
+    return byte_columns(uints, total_bits, byteorder).tobytes()
+
+
+def _code_array(uints, min_bytes):
+    """1-D unsigned view of uints; signed/float input or dtypes narrower than min_bytes -> uint64."""
+    u = np.asarray(uints).ravel()
+    if u.dtype.kind != 'u' or u.dtype.itemsize < min(min_bytes, 8):
+        u = u.astype(np.uint64)
+    return u
+
+
+@instrumented('format', _arg_size)
+def byte_columns(uints, total_bits, byteorder='big', out=None):
+    """
+    uints_to_bytes as an (n, bytes_per) uint8 array; with ``out`` (e.g. rows of a memmap)
+    the bytes are written there and out is returned.
+
+    Built one byte plane at a time (shift + truncating cast into column j), which is
+    several times faster than reversing/slicing the rows of a uint8 view.
+    """
+    if byteorder not in ('big', 'little'):
+        raise ValueError("byteorder must be 'big' or 'little'")
+    bytes_per = (total_bits + 7) // 8
+    u = _code_array(uints, bytes_per)
+    width = u.dtype.itemsize
+    if u.size and bytes_per < width and int(u.max()) >> (8 * bytes_per):
+        raise OverflowError('sample does not fit in %d bytes' % bytes_per)
+    if out is None:
+        out = np.empty((u.size, bytes_per), dtype=np.uint8)
+    for j in range(bytes_per):
+        # byte k of the sample (0 = least significant) goes to column j
+        k = bytes_per - 1 - j if byteorder == 'big' else j
+        if k >= width:
+            # wider than the array dtype: upper bytes are zero padding
+            out[:, j] = 0
+        else:
+            np.copyto(out[:, j], u >> (8 * k) if k else u, casting='unsafe')
+    return out
+
+
+@instrumented('write', _arg_size)
+def save_bin(uints, total_bits, path, byteorder='big'):
+    buf = uints_to_bytes(uints, total_bits, byteorder)
+    with open(path, 'wb') as f:
+        f.write(buf)
+
+
+@instrumented('write')
+def save_raw_csv(values, path):
+    # Save floating point values as one value per line CSV
+    np.savetxt(path, np.asarray(values), delimiter=',', fmt='%.18e')
+
+
+@instrumented('write')
+def save_raw_mat(values, sample_rate, path):
+    # Try to use scipy.io.savemat; if unavailable, fallback to numpy savez
+    try:
+        from scipy import io as spio
+        spio.savemat(path, {'samples': np.asarray(values), 'sample_rate': float(sample_rate)})
+    except Exception:
+        # fallback to npz
+        np.savez(path, samples=np.asarray(values), sample_rate=float(sample_rate))
+
+
+# ASCII lookup tables for the vectorized hex codec
+_HEX_DIGITS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+_HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+_HEX_VALUES[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+_HEX_VALUES[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+_HEX_VALUES[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+# bytes removed by str.strip() on an ASCII line
+_HEX_SPACE = np.zeros(256, dtype=bool)
+_HEX_SPACE[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+
+@instrumented('format', _arg_size)
+def hex_encode(uints, total_bits):
+    """
+    Format samples as fixed-width upper-case hex lines ('\\n' terminated) in one ASCII buffer.
+
+    The output equals ''.join('{:0NX}\\n'.format(v) ...). See hex_rows.
+    """
+    return hex_rows(uints, total_bits).tobytes()
+
+
+@instrumented('format', _arg_size)
+def hex_rows(uints, total_bits, newline=b'\n', out=None):
+    """
+    hex_encode as an (n, hex_digits + len(newline)) uint8 array of ASCII rows; with ``out``
+    the rows are written there (e.g. a memmap of the output file) and out is returned.
+
+    Each digit column is one nibble plane (shift, mask) mapped through the 16-entry
+    lookup table, most significant nibble first.
+    """
+    hex_digits = (total_bits + 3) // 4
+    u = _code_array(uints, (hex_digits + 1) // 2)
+    width = u.dtype.itemsize
+    if u.size and hex_digits < 2 * width and int(u.max()) >> (4 * hex_digits):
+        raise OverflowError('sample does not fit in %d hex digits' % hex_digits)
+    if out is None:
+        out = np.empty((u.size, hex_digits + len(newline)), dtype=np.uint8)
+    nib = np.empty(u.size, dtype=np.uint8)
+    for j in range(hex_digits):
+        k = hex_digits - 1 - j
+        if k >= 2 * width:
+            out[:, j] = ord('0')
+            continue
+        np.copyto(nib, u >> (4 * k) if k else u, casting='unsafe')
+        nib &= 0xF
+        np.take(_HEX_DIGITS, nib, out=out[:, j])
+    out[:, hex_digits:] = np.frombuffer(newline, dtype=np.uint8)
+    return out
+
+
+@instrumented('parse')
+def hex_decode(data, total_bits):
+    """
+    Parse .hex/.mem text (bytes or str) into a uint64 array, one sample per non-blank line.
+
+    Same rules as the line-by-line reader: surrounding whitespace is stripped, an optional
+    0x/0X prefix is dropped, digits above (total_bits + 3) // 4 are trimmed from the left and
+    short lines are zero-padded. Tokens are located and decoded with whole-buffer numpy ops.
+    """
+    if isinstance(data, str):
+        data = data.encode('ascii', errors='replace')
+    # universal newlines, as in text-mode reading
+    data = bytes(data).replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    hex_digits = (total_bits + 3) // 4
+    arr = np.frombuffer(data, dtype=np.uint8)
+    fast = _hex_decode_fixed(arr, hex_digits)
+    if fast is not None:
+        return fast
+    pos = np.flatnonzero(~_HEX_SPACE[arr])
+    if pos.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    # line number of every non-blank byte; token = first..last non-blank byte of a line
+    line_of = np.cumsum(arr == 10)[pos]
+    brk = np.flatnonzero(np.diff(line_of)) + 1
+    first = np.concatenate(([0], brk))
+    last = np.concatenate((brk, [pos.size])) - 1
+    start = pos[first]
+    end = pos[last] + 1
+    # optional 0x / 0X prefix
+    has_prefix = ((end - start) >= 2) & (arr[start] == ord('0'))
+    nxt = arr[np.minimum(start + 1, arr.size - 1)]
+    has_prefix &= (nxt == ord('x')) | (nxt == ord('X'))
+    body = start + 2 * has_prefix
+    # keep at most hex_digits trailing digits, zero-pad the rest
+    body = np.maximum(body, end - hex_digits)
+    width = end - body
+    n = start.size
+    nib = np.zeros((n, hex_digits), dtype=np.uint8)
+    total = int(width.sum())
+    if total:
+        row = np.repeat(np.arange(n), width)
+        k = np.arange(total) - np.repeat(np.cumsum(width) - width, width)
+        vals = _HEX_VALUES[arr[np.repeat(body, width) + k]]
+        bad = np.flatnonzero(vals == 255)
+        if bad.size:
+            r = row[bad[0]]
+            ln = data[start[r]:end[r]].decode('ascii', errors='replace')
+            raise ValueError(f'Invalid hex line: {ln}')
+        nib[row, np.repeat(hex_digits - width, width) + k] = vals
+    return _nibbles_to_uints(nib)
+
+
+def _hex_decode_fixed(arr, hex_digits):
+    """Fast path of hex_decode for files whose lines all have the same length (our own exports).
+
+    Returns None when the buffer does not have that shape so the general parser can take over.
+    """
+    nl = np.flatnonzero(arr[:4096] == 10)
+    if nl.size == 0 or nl[0] == 0:
+        return None
+    width = int(nl[0])
+    if arr.size % (width + 1) == 0:
+        lines = arr.reshape(-1, width + 1)
+    elif (arr.size + 1) % (width + 1) == 0:
+        # last line without trailing newline
+        lines = np.append(arr, np.uint8(10)).reshape(-1, width + 1)
+    else:
+        return None
+    if not (lines[:, width] == 10).all():
+        return None
+    tok = lines[:, :width]
+    prefixed = (tok[:, 0] == ord('0')) & ((tok[:, 1] | 0x20) == ord('x')) if width >= 2 else None
+    if prefixed is not None and prefixed.any():
+        if not prefixed.all():
+            return None
+        tok = tok[:, 2:]
+    # trim higher digits / zero-pad
+    tok = tok[:, max(0, tok.shape[1] - hex_digits):]
+    vals = _HEX_VALUES[tok]
+    if vals.size and vals.max() == 255:
+        if _HEX_SPACE[lines[:, :width]].any():
+            # embedded/padding whitespace: let the general parser strip it
+            return None
+        r = int(np.flatnonzero((vals == 255).any(axis=1))[0])
+        ln = lines[r, :width].tobytes().decode('ascii', errors='replace')
+        raise ValueError(f'Invalid hex line: {ln}')
+    if vals.shape[1] < hex_digits:
+        nib = np.zeros((vals.shape[0], hex_digits), dtype=np.uint8)
+        nib[:, hex_digits - vals.shape[1]:] = vals
+        vals = nib
+    return _nibbles_to_uints(vals)
+
+
+def _nibbles_to_uints(nib):
+    """Combine an (n, digits) array of nibble values (most significant first) into uint64."""
+    n, digits = nib.shape
+    if digits > 16:
+        # wider than uint64: only the low 16 digits can be represented
+        nib = nib[:, digits - 16:]
+        digits = 16
+    if digits % 2:
+        nib = np.concatenate((np.zeros((n, 1), dtype=np.uint8), nib), axis=1)
+        digits += 1
+    le = np.zeros((n, 8), dtype=np.uint8)
+    le[:, :digits // 2] = ((nib[:, 0::2] << 4) | nib[:, 1::2])[:, ::-1]
+    return le.view('<u8').ravel().astype(np.uint64, copy=False)
+
+
+@instrumented('format')
+def make_hex_lines(uints, total_bits):
+    return hex_encode(uints, total_bits).decode('ascii').splitlines()
+
+
+# 流式生成/导出的默认块长（样本数）
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+
+class SignalStream:
+    """
+    Block-wise signal source producing ``num_samples`` samples in total.
+
+    read(count) returns the next block; iterating yields blocks of ``block_size``. Subclasses
+    implement _generate(start, count) and keep whatever state crosses block boundaries
+    (sample index, LFSR register, RNG, filter history), so the concatenated blocks are
+    identical to one read_all() call whatever the block size. reset() rewinds to sample 0
+    and replays the same samples. The base class produces zeros.
+    """
+
+    def __init__(self, num_samples, offset=0.0, block_size=DEFAULT_BLOCK_SIZE):
+        self.num_samples = max(0, int(num_samples))
+        self.offset = float(offset)
+        self.block_size = max(1, int(block_size))
+        self.position = 0
+
+    def __len__(self):
+        return self.num_samples
+
+    def __iter__(self):
+        while self.position < self.num_samples:
+            yield self.read()
+
+    def _generate(self, start, count):
+        return np.zeros(count)
+
+    def _reset_state(self):
+        pass
+
+    def reset(self):
+        self.position = 0
+        self._reset_state()
+
+    @instrumented('generate')
+    def read(self, count=None):
+        if count is None:
+            count = self.block_size
+        count = max(0, min(int(count), self.num_samples - self.position))
+        block = self._generate(self.position, count)
+        self.position += count
+        return block + self.offset
+
+    def read_all(self):
+        return self.read(self.num_samples - self.position)
+
+
+class SineStream(SignalStream):
+    def __init__(self, num_samples, amplitude, frequency, phase, sample_rate, **kw):
+        super().__init__(num_samples, **kw)
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.phase = phase
+        self.sample_rate = float(sample_rate)
+
+    def _generate(self, start, count):
+        t = np.arange(start, start + count) / self.sample_rate
+        return self.amplitude * np.sin(2 * np.pi * self.frequency * t + self.phase)
+
+
+def dds_sine_lut(lut_bits, lut_width, quarter_wave=True):
+    """
+    Signed sine ROM with 2**lut_bits entries of lut_width bits (full scale 2**(lut_width-1) - 1).
+
+    quarter_wave=True builds the 2**(lut_bits-2)-entry quarter table sampled at half-step
+    phases, sin(2*pi*(k + 0.5) / depth), and expands it with the usual ROM addressing (mirror
+    the index in quadrants 1/3, negate in quadrants 2/3), so the returned full table gives
+    exactly what a quarter-wave ROM outputs. quarter_wave=False samples sin(2*pi*k / depth).
+    """
+    depth = 1 << int(lut_bits)
+    full_scale = (1 << (int(lut_width) - 1)) - 1
+    if not quarter_wave:
+        return np.round(np.sin(2 * np.pi * np.arange(depth) / depth) * full_scale).astype(np.int64)
+    if lut_bits < 2:
+        raise ValueError('quarter-wave LUT needs at least 2 address bits')
+    q = depth >> 2
+    quarter = np.round(np.sin(2 * np.pi * (np.arange(q) + 0.5) / depth) * full_scale).astype(np.int64)
+    addr = np.arange(depth)
+    quadrant = addr >> (int(lut_bits) - 2)
+    idx = addr & (q - 1)
+    idx = np.where(quadrant & 1, q - 1 - idx, idx)
+    return np.where(quadrant & 2, -quarter[idx], quarter[idx])
+
+
+class NCOStream(SignalStream):
+    """
+    DDS/NCO sine: integer phase accumulator + sine LUT, as in the FPGA.
+
+    phase[n] = (POW + n * FTW) mod 2**acc_bits with FTW = round(f / fs * 2**acc_bits) and
+    POW = round(phase / 2pi * 2**acc_bits); the LUT address is the top lut_bits of the phase
+    (truncation, no dither). codes(start, count) returns the signed LUT words; the float
+    output is amplitude * code / 2**(lut_width-1), so with amplitude 1 a Q(lut_width-1)
+    export (Total bits = lut_width, Fractional bits = lut_width-1) reproduces the codes.
+    The phase at any block start is computed exactly, so blocks never drift.
+    """
+
+    def __init__(self, num_samples, amplitude, frequency, phase, sample_rate, acc_bits=32, lut_bits=10,
+                 lut_width=16, quarter_wave=True, **kw):
+        super().__init__(num_samples, **kw)
+        self.acc_bits = int(acc_bits)
+        self.lut_bits = int(lut_bits)
+        self.lut_width = int(lut_width)
+        if not (1 <= self.lut_bits <= self.acc_bits <= 64):
+            raise ValueError('need 1 <= LUT bits <= accumulator bits <= 64')
+        if not (2 <= self.lut_width <= 53):
+            raise ValueError('LUT width must be 2..53 bits')
+        self.amplitude = amplitude
+        self.sample_rate = float(sample_rate)
+        mod = 1 << self.acc_bits
+        self.ftw = int(round(float(frequency) / self.sample_rate * mod)) % mod
+        self.pow = int(round(float(phase) / (2 * np.pi) * mod)) % mod
+        self.quarter_wave = bool(quarter_wave)
+        self.lut = dds_sine_lut(self.lut_bits, self.lut_width, self.quarter_wave)
+        # uint32 arithmetic wraps mod 2**32 (enough for acc_bits <= 32), else uint64
+        self._dtype = np.uint32 if self.acc_bits <= 32 else np.uint64
+
+    @property
+    def actual_frequency(self):
+        """Output frequency actually produced by the tuning word."""
+        return self.ftw * self.sample_rate / float(1 << self.acc_bits)
+
+    def describe(self):
+        return 'DDS: %d-bit accumulator, %d-entry %s LUT x %d bit, f = %.6g Hz' % (
+            self.acc_bits, 1 << self.lut_bits, 'quarter-wave' if self.quarter_wave else 'full',
+            self.lut_width, self.actual_frequency)
+
+    def codes(self, start, count):
+        mod = 1 << self.acc_bits
+        p0 = (self.pow + int(start) * self.ftw) % mod
+        dt = self._dtype
+        ph = np.arange(count, dtype=dt)
+        ph *= dt(self.ftw)
+        ph += dt(p0)
+        if self.acc_bits < 8 * np.dtype(dt).itemsize:
+            ph &= dt(mod - 1)
+        ph >>= dt(self.acc_bits - self.lut_bits)
+        return self.lut[ph]
+
+    def _generate(self, start, count):
+        return self.codes(start, count) * (self.amplitude / float(1 << (self.lut_width - 1)))
+
+
+def fill_periodic(table, start, count):
+    """Samples start..start+count of the periodic sequence whose period is ``table``."""
+    P = table.size
+    pos = start % P
+    out = np.empty(count, dtype=table.dtype)
+    k = min(count, P)
+    out[:k] = np.concatenate((table[pos:], table[:pos]))[:k]
+    # double in place: every prefix copied is a whole number of periods
+    while k < count:
+        m = min(k, count - k)
+        out[k:k + m] = out[:m]
+        k += m
+    return out
+
+
+# 方波相位累加：f/fs 取分母不超过该值的有理数；周期不超过 SQUARE_TABLE_MAX 时直接循环整周期表
+SQUARE_MAX_DENOMINATOR = 1 << 40
+SQUARE_TABLE_MAX = 1 << 20
+
+
+class SquareStream(SignalStream):
+    """
+    Square/pulse wave from an integer phase accumulator.
+
+    f/fs is taken as the exact fraction p/q of the values as typed (their shortest decimal
+    form, denominator limited to SQUARE_MAX_DENOMINATOR) and the cycle position of sample n
+    is r = n*p mod q, computed in integers: the sample is high while r < duty*q. The wave
+    is exactly periodic with period q samples however long the file, with no float time
+    vector. Periods up to SQUARE_TABLE_MAX samples are built once and copied into blocks.
+    """
+
+    def __init__(self, num_samples, amplitude, frequency, duty, sample_rate, **kw):
+        super().__init__(num_samples, **kw)
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.duty = duty
+        self.sample_rate = float(sample_rate)
+        ratio = (Fraction(repr(float(frequency))) / Fraction(repr(self.sample_rate)))
+        ratio = ratio.limit_denominator(SQUARE_MAX_DENOMINATOR)
+        self.period = ratio.denominator
+        self._step = ratio.numerator % self.period
+        # integer r is below duty * q exactly when r < ceil(duty * q)
+        self._high = math.ceil(Fraction(repr(float(duty))) * self.period)
+        self._levels = np.array([-1.0, 1.0]) * amplitude
+        self._table = None
+
+    def _generate(self, start, count):
+        q, p = self.period, self._step
+        if q <= SQUARE_TABLE_MAX:
+            if self._table is None:
+                r = (np.arange(q, dtype=np.int64) * p) % q
+                self._table = self._levels[(r < self._high).view(np.int8)]
+            return fill_periodic(self._table, start, count)
+        out = np.empty(count)
+        for i in range(0, count, DEFAULT_BLOCK_SIZE):
+            k = min(DEFAULT_BLOCK_SIZE, count - i)
+            # n*p mod q for n = start+i .. ; the offset part is exact in Python ints
+            r0 = ((start + i) * p) % q
+            r = np.arange(k, dtype=np.int64) * p
+            r += r0
+            r %= q
+            out[i:i + k] = self._levels[(r < self._high).view(np.int8)]
+        return out
+
+
+class PRBSStream(SignalStream):
+    """PRBS blocks; carries the LFSR register (or the RNG) across blocks. See generate_prbs."""
+
+    def __init__(self, num_samples, amplitude, seed=None, order=None, mode='lfsr', **kw):
+        super().__init__(num_samples, **kw)
+        self.amplitude = amplitude
+        self.order = order
+        self.use_lfsr = ((mode or '').lower() == 'lfsr') and (order in LFSR_TAPS)
+        if seed is None and not self.use_lfsr:
+            # 固定一个随机种子，使 reset() 后可以重放相同序列
+            seed = _random_seed()
+        self.seed = seed
+        self._reset_state()
+
+    def _reset_state(self):
+        if self.use_lfsr:
+            self._reg = lfsr_state_at(self.order, self.seed, 0)
+        else:
+            self._rng = np.random.default_rng(self.seed)
+
+    def _generate(self, start, count):
+        if self.use_lfsr:
+            bits, self._reg = lfsr_run(self._reg, self.order, count, start)
+            out = bits.view(np.int8)
+        else:
+            out = self._rng.integers(0, 2, size=count)
+        return self.amplitude * (2 * out - 1)
+
+
+class WhiteNoiseStream(SignalStream):
+    """
+    Band-limited Gaussian noise blocks filtered by a StreamingFIR.
+
+    Noise is drawn and filtered in fixed frames aligned to the start of the signal and the
+    outputs are buffered, so the result never depends on the requested block sizes.
+    phase='zero' drops the first group_delay outputs (noise is drawn that far ahead), which
+    gives a zero-phase response for the symmetric firwin taps with a single pass and no
+    whole-array filtfilt; phase='linear' returns the causal output.
+    filter_mode describes what was actually applied. taps='design' designs the filter with
+    design_bandlimit_fir; pass its result instead (an array, or None for no filter) to share
+    one design between streams.
+    """
+
+    def __init__(self, num_samples, amplitude, sample_rate, lowcut, highcut, fir_order, seed=None,
+                 phase='zero', method='auto', taps='design', **kw):
+        super().__init__(num_samples, **kw)
+        if phase not in ('zero', 'linear'):
+            raise ValueError("phase must be 'zero' or 'linear'")
+        self.amplitude = amplitude
+        if seed is None:
+            seed = _random_seed()
+        self.seed = seed
+        self.phase = phase
+        if isinstance(taps, str):
+            taps = design_bandlimit_fir(sample_rate, lowcut, highcut, fir_order)
+        self.taps = taps
+        if self.taps is None:
+            self.fir = None
+            self.delay = 0
+            self.filter_mode = 'unfiltered Gaussian noise'
+        else:
+            self.fir = StreamingFIR(self.taps, method=method)
+            self.delay = self.fir.group_delay if phase == 'zero' else 0
+            self.filter_mode = '%s, %s' % (self.fir.describe(),
+                                           'zero-phase' if phase == 'zero' else 'linear-phase (delay %d)' % self.fir.group_delay)
+        self._reset_state()
+
+    def _reset_state(self):
+        self._rng = np.random.default_rng(self.seed)
+        if self.fir is not None:
+            self.fir.reset()
+        self._pending = np.zeros(0)
+        self._skip = self.delay
+
+    def _generate(self, start, count):
+        if self.fir is None:
+            return self.amplitude * self._rng.standard_normal(count)
+        parts = [self._pending]
+        have = self._pending.size
+        while have < count:
+            y = self.fir.process(self.amplitude * self._rng.standard_normal(self.fir.hop))
+            if self._skip:
+                cut = min(self._skip, y.size)
+                y = y[cut:]
+                self._skip -= cut
+            parts.append(y)
+            have += y.size
+        buf = np.concatenate(parts)
+        self._pending = buf[count:]
+        return buf[:count]
+
+
+class MultiChannelStream(SignalStream):
+    """
+    Channel streams read in lockstep; blocks are 2-D arrays of shape (count, channels).
+
+    ``channels`` is a list of job dicts as accepted by job_stream(), each with its own type,
+    amplitude, offset, seed, ... Channels with identical settings (seed included) share one
+    stream, generated once per block and copied into each of their columns. All channels
+    must have the same length, so sample n of every channel belongs to the same instant.
+    """
+
+    def __init__(self, channels, block_size=DEFAULT_BLOCK_SIZE):
+        self.specs = [dict(c) for c in channels]
+        if not self.specs:
+            raise ValueError('At least one channel is required')
+        unique = {}
+        self.index = [unique.setdefault(stage_key('channel', tuple(sorted(c.items()))), len(unique))
+                      for c in self.specs]
+        self.streams = [None] * len(unique)
+        for spec, i in zip(self.specs, self.index):
+            if self.streams[i] is None:
+                self.streams[i] = job_stream(spec, block_size=block_size)
+        lengths = sorted(set(len(st) for st in self.streams))
+        if len(lengths) != 1:
+            raise ValueError('Channels differ in length: %s samples' % lengths)
+        super().__init__(lengths[0], block_size=block_size)
+
+    @property
+    def channels(self):
+        return len(self.index)
+
+    def _reset_state(self):
+        for st in self.streams:
+            st.reset()
+
+    def _generate(self, start, count):
+        blocks = [st.read(count) for st in self.streams]
+        out = np.empty((count, self.channels))
+        for c, i in enumerate(self.index):
+            out[:, c] = blocks[i]
+        return out
+
+
+# 多音信号：IFFT 合成时一个周期最多的样本数；振荡器组每次计算的样本数
+MULTISINE_MAX_PERIOD = 1 << 22
+MULTISINE_BANK_BLOCK = 4096
+
+
+def parse_float_list(text):
+    """'200, 400 600' (or a list/tuple) -> [200.0, 400.0, 600.0]; blank -> []."""
+    if isinstance(text, (list, tuple, np.ndarray)):
+        return [float(v) for v in text]
+    return [float(v) for v in str(text).replace(',', ' ').replace(';', ' ').split()]
+
+
+def multisine_phases(amplitudes, mode='schroeder', seed=None):
+    """
+    Tone phases for a multisine.
+
+    'schroeder': phi_k = -2*pi * sum_{l<k} (k - l) * p_l with p_l = A_l^2 / sum(A^2) (reduces to
+    -pi*k*(k-1)/N for equal amplitudes); keeps the crest factor low. 'random': uniform in
+    [0, 2*pi) from np.random.default_rng(seed). 'zero': all zero.
+    """
+    a = np.asarray(amplitudes, dtype=float)
+    n = a.size
+    mode = (mode or 'schroeder').lower()
+    if mode == 'zero':
+        return np.zeros(n)
+    if mode == 'random':
+        return np.random.default_rng(seed).uniform(0.0, 2 * np.pi, n)
+    if mode != 'schroeder':
+        raise ValueError("phase mode must be 'schroeder', 'random' or 'zero'")
+    power = a * a
+    p = power / power.sum() if power.sum() > 0 else np.full(n, 1.0 / max(1, n))
+    k = np.arange(n)
+    # sum_{l<k} (k - l) p_l for every k
+    phases = np.array([-2 * np.pi * np.dot(kk - k[:kk], p[:kk]) for kk in k])
+    return np.mod(phases, 2 * np.pi)
+
+
+def multisine_period(frequencies, sample_rate, num_samples=None, max_period=MULTISINE_MAX_PERIOD):
+    """
+    Smallest period P (samples) on whose FFT grid every tone lies, or None if it would
+    exceed max_period. Each f/fs is approximated by a fraction with denominator <= max_period;
+    the approximation is accepted only if the phase it drifts over num_samples is < 1e-9 rad
+    (well below one LSB of a 24-bit code).
+    """
+    fs = float(sample_rate)
+    period = 1
+    for f in frequencies:
+        q = Fraction(float(f) / fs).limit_denominator(max_period).denominator
+        period = period * q // math.gcd(period, q)
+        if period > max_period:
+            return None
+    n = period if num_samples is None else max(period, int(num_samples))
+    for f in frequencies:
+        b = float(f) * period / fs
+        if abs(b - round(b)) * 2 * np.pi * n / period > 1e-9:
+            return None
+    return period
+
+
+class MultisineStream(SignalStream):
+    """
+    Sum of tones A_k * sin(2*pi*f_k*t + phi_k).
+
+    Tone amplitudes are ``amplitude * a_k / sum(|a|)`` (equal a_k by default), so the peak never
+    exceeds ``amplitude``; phases are given or come from multisine_phases(phase_mode, seed).
+    method:
+      - 'ifft': one period is synthesized with an inverse real FFT (all tones on the grid of
+        multisine_period) and blocks are read from it; cost does not depend on the tone count.
+      - 'bank': oscillator bank, each MULTISINE_BANK_BLOCK samples are one complex
+        matrix-vector product of the tone phasors with a precomputed rotation table.
+      - 'direct': one sin pass per tone (same formula as SineStream).
+      - 'auto': 'ifft' if a period fits in MULTISINE_MAX_PERIOD, else 'bank' (single tone: 'direct').
+    """
+
+    def __init__(self, num_samples, amplitude, frequencies, sample_rate, amplitudes=None, phases=None,
+                 phase_mode='schroeder', seed=None, method='auto', **kw):
+        super().__init__(num_samples, **kw)
+        self.frequencies = np.asarray(parse_float_list(frequencies), dtype=float)
+        if self.frequencies.size == 0:
+            raise ValueError('Multisine needs at least one frequency')
+        n = self.frequencies.size
+        rel = parse_float_list(amplitudes) if amplitudes is not None else []
+        if len(rel) == 0:
+            rel = [1.0] * n
+        elif len(rel) == 1:
+            rel = rel * n
+        if len(rel) != n:
+            raise ValueError('Got %d tone amplitudes for %d frequencies' % (len(rel), n))
+        rel = np.asarray(rel, dtype=float)
+        total = np.abs(rel).sum()
+        self.tone_amplitudes = float(amplitude) * rel / total if total > 0 else np.zeros(n)
+        ph = parse_float_list(phases) if phases is not None else []
+        if len(ph) == 0:
+            if (phase_mode or '').lower() == 'random' and seed is None:
+                seed = _random_seed()
+            ph = multisine_phases(self.tone_amplitudes, phase_mode, seed)
+        elif len(ph) != n:
+            raise ValueError('Got %d phases for %d frequencies' % (len(ph), n))
+        self.phases = np.asarray(ph, dtype=float)
+        self.seed = seed
+        self.sample_rate = float(sample_rate)
+        self.period = None
+        if method == 'auto':
+            self.period = multisine_period(self.frequencies, self.sample_rate, self.num_samples)
+            method = 'ifft' if self.period is not None else ('bank' if n > 1 else 'direct')
+        elif method == 'ifft':
+            self.period = multisine_period(self.frequencies, self.sample_rate, self.num_samples)
+            if self.period is None:
+                raise ValueError('Tones have no common period up to %d samples; use bank or direct'
+                                 % MULTISINE_MAX_PERIOD)
+        elif method not in ('bank', 'direct'):
+            raise ValueError("method must be 'auto', 'ifft', 'bank' or 'direct'")
+        self.method = method
+        self._table = None
+        self._bank_block = None
+
+    def describe(self):
+        if self.method == 'ifft':
+            return '%d-tone multisine, IFFT (period %d)' % (self.frequencies.size, self.period)
+        return '%d-tone multisine, %s' % (self.frequencies.size,
+                                          'oscillator bank' if self.method == 'bank' else 'direct')
+
+    def _build_table(self):
+        if self.method == 'ifft':
+            P = self.period
+            spec = np.zeros(P // 2 + 1, dtype=complex)
+            for A, f, ph in zip(self.tone_amplitudes, self.frequencies, self.phases):
+                b = int(round(f * P / self.sample_rate)) % P
+                if 2 * b > P:
+                    # sin(2*pi*(P-b')n/P + ph) = -sin(2*pi*b'n/P - ph)
+                    b, A, ph = P - b, -A, -ph
+                if b == 0 or 2 * b == P:
+                    # DC / Nyquist bins are real: A*sin(ph) (times (-1)^n at Nyquist)
+                    spec[b] += P * A * math.sin(ph)
+                else:
+                    spec[b] += 0.5 * P * A * np.exp(1j * (ph - np.pi / 2))
+            self._table = np.fft.irfft(spec, P)
+        else:
+            w = 2 * np.pi * self.frequencies / self.sample_rate
+            self._omega = w
+            self._weights = self.tone_amplitudes * np.exp(1j * self.phases)
+            self._table = np.exp(1j * np.outer(w, np.arange(MULTISINE_BANK_BLOCK)))
+
+    def _generate(self, start, count):
+        if self.method == 'direct':
+            t = np.arange(start, start + count) / self.sample_rate
+            out = np.zeros(count)
+            for A, f, ph in zip(self.tone_amplitudes, self.frequencies, self.phases):
+                out += A * np.sin(2 * np.pi * f * t + ph)
+            return out
+        if self._table is None:
+            self._build_table()
+        if self.method == 'ifft':
+            return fill_periodic(self._table, start, count)
+        out = np.empty(count)
+        B = MULTISINE_BANK_BLOCK
+        pos, end = start, start + count
+        while pos < end:
+            # sub-blocks sit on absolute multiples of B and are always computed whole (the BLAS
+            # sums can differ in the last bit with the slice shape), so the samples do not
+            # depend on where a read began; the last one is kept for reads that end inside it
+            b0 = (pos // B) * B
+            if self._bank_block is None or self._bank_block[0] != b0:
+                z0 = self._weights * np.exp(1j * (self._omega * b0))
+                self._bank_block = (b0, np.dot(z0, self._table).imag)
+            j = pos - b0
+            k = min(B - j, end - pos)
+            out[pos - start:pos - start + k] = self._bank_block[1][j:j + k]
+            pos += k
+        return out
+
+
+def generate_multisine(num_samples, amplitude, frequencies, sample_rate, amplitudes=None, phases=None,
+                       phase_mode='schroeder', seed=None, method='auto'):
+    """Multi-tone signal (see MultisineStream); frequencies/amplitudes/phases are lists or '1, 2, 3' text."""
+    return MultisineStream(num_samples, amplitude, frequencies, sample_rate, amplitudes, phases,
+                           phase_mode=phase_mode, seed=seed, method=method).read_all()
+
+
+class JobCancelled(Exception):
+    """Raised from a progress callback to stop a running generate/export job."""
+
+
+def iter_quantized(stream, total_bits, frac_bits, unsigned=False, progress=None):
+    """
+    Quantize a SignalStream block by block (yields blocks of uint_dtype(total_bits)).
+
+    Unsigned scaling needs the global min/max, so the stream is read once for the range and
+    then replayed; the blocks equal quantize_unsigned() of the whole signal. For a
+    MultiChannelStream the blocks are 2-D and every channel gets its own range.
+    progress(fraction) is called after every block and may raise JobCancelled.
+    """
+    total = float(max(1, len(stream)) * (2 if unsigned else 1))
+    stream.reset()
+    if unsigned:
+        vmin, vmax = np.inf, -np.inf
+        for blk in stream:
+            if blk.size:
+                vmin = np.minimum(vmin, blk.min(axis=0))
+                vmax = np.maximum(vmax, blk.max(axis=0))
+            if progress is not None:
+                progress(stream.position / total)
+        # max(x - vmin) == max(x) - vmin, float subtraction is monotonic
+        span = vmax - vmin
+        stream.reset()
+        done = len(stream)
+        for blk in stream:
+            if blk.ndim == 1:
+                yield quantize_unsigned(blk, total_bits, vmin=vmin, span=span, compact=True)
+            else:
+                u = np.empty(blk.shape, dtype=uint_dtype(total_bits))
+                for c in range(blk.shape[1]):
+                    u[:, c] = quantize_unsigned(blk[:, c], total_bits, vmin=vmin[c], span=span[c], compact=True)
+                yield u
+            if progress is not None:
+                progress((done + stream.position) / total)
+    else:
+        for blk in stream:
+            yield quantize_signed(blk, total_bits, frac_bits, compact=True)
+            if progress is not None:
+                progress(stream.position / total)
+
+
+def export_quantized_stream(stream, path, fmt, total_bits, frac_bits, unsigned=False, byteorder='big',
+                            progress=None, memmap=False, layout='interleaved'):
+    """
+    Generate, quantize and write a stream to .hex/.mem/.bin with bounded memory.
+
+    Output is identical to save_hex/save_bin of the whole quantized array. Returns the
+    number of samples written (per channel). progress is passed to iter_quantized.
+    memmap=True fills a pre-sized file in place (see write_quantized) instead of appending
+    with file writes. A MultiChannelStream is written sample-interleaved to ``path``
+    (ch0, ch1, ... per sample), or with layout='separate' to one file per channel
+    (channel_paths; memmap does not apply).
+    """
+    channels = getattr(stream, 'channels', 1)
+    blocks = iter_quantized(stream, total_bits, frac_bits, unsigned, progress=progress)
+    if layout == 'separate' and channels > 1:
+        return write_quantized_channels(blocks, channel_paths(path, channels), fmt, total_bits, byteorder)
+    n = write_quantized(blocks, path, fmt, total_bits, byteorder,
+                        count=len(stream) * channels if memmap else None)
+    return n // channels
+
+
+# memmap 导出时每个映射窗口的大小（字节）；写满即 flush 并解除映射，RSS 不随信号长度增长
+EXPORT_WINDOW_BYTES = 32 << 20
+
+
+@instrumented('write', lambda n, args: n)
+def write_quantized(blocks, path, fmt, total_bits, byteorder='big', count=None):
+    """
+    Write an iterable of code blocks to .hex/.mem (fmt 'hex') or .bin; returns the sample count.
+
+    With ``count`` (the total number of samples) the file is pre-sized and filled in place
+    through np.memmap windows of EXPORT_WINDOW_BYTES, each flushed and unmapped when full,
+    so no bytes objects are built and resident memory does not grow with the signal.
+    Both paths write the same bytes (see QuantizedWriter).
+    """
+    with QuantizedWriter(path, fmt, total_bits, byteorder, count) as w:
+        for u in blocks:
+            w.write(u)
+    return w.count
+
+
+class QuantizedWriter:
+    """
+    Push-style write_quantized: write(codes) once per block, close() (or the with block)
+    finishes the file. 2-D (samples, channels) blocks are written row by row, i.e.
+    interleaved. With ``count`` the file is pre-sized and filled through np.memmap
+    windows; if fewer samples arrive, the unwritten tail is cut off on close.
+    """
+
+    def __init__(self, path, fmt, total_bits, byteorder='big', count=None):
+        self.path = path
+        self.total_bits = int(total_bits)
+        self.byteorder = byteorder
+        self.binary = (fmt == 'bin')
+        self.count = 0
+        self.size = int(count) if count is not None and int(count) > 0 else None
+        self._f = self._win = None
+        if self.size is None:
+            self._text_mode = (not self.binary) and os.linesep != '\n'
+            self._f = open(path, 'w' if self._text_mode else 'wb')
+            return
+        # text-mode writes would turn '\n' into os.linesep; the memmap rows carry it directly
+        self._newline = os.linesep.encode('ascii')
+        if self.binary:
+            self.width = (self.total_bits + 7) // 8
+        else:
+            self.width = (self.total_bits + 3) // 4 + len(self._newline)
+        with open(path, 'wb') as f:
+            f.truncate(self.size * self.width)
+            try:
+                # allocate the blocks up front so page faults in the map do not have to
+                os.posix_fallocate(f.fileno(), 0, self.size * self.width)
+            except (AttributeError, OSError):
+                pass
+        self._rows_per_window = max(1, EXPORT_WINDOW_BYTES // self.width)
+        self._win_start = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @instrumented('write', lambda n, args: np.asarray(args[1]).size)
+    def write(self, u):
+        u = np.asarray(u).reshape(-1)
+        if self.size is None:
+            _write_codes(self._f, u, self.binary, self._text_mode, self.total_bits, self.byteorder)
+            self.count += u.size
+            return
+        pos = self.count
+        if pos + u.size > self.size:
+            raise ValueError('more samples than the pre-sized %d' % self.size)
+        i = 0
+        while i < u.size:
+            if self._win is None or pos >= self._win_start + self._win.shape[0]:
+                if self._win is not None:
+                    self._win.flush()
+                self._win_start = pos
+                rows = min(self._rows_per_window, self.size - pos)
+                self._win = np.memmap(self.path, dtype=np.uint8, mode='r+', offset=pos * self.width,
+                                      shape=(rows, self.width))
+            k = min(u.size - i, self._win_start + self._win.shape[0] - pos)
+            dst = self._win[pos - self._win_start:pos - self._win_start + k]
+            if self.binary:
+                byte_columns(u[i:i + k], self.total_bits, self.byteorder, out=dst)
+            else:
+                hex_rows(u[i:i + k], self.total_bits, self._newline, out=dst)
+            pos += k
+            i += k
+        self.count = pos
+
+    def close(self):
+        """Flush and close the file; returns the number of samples written."""
+        if self._win is not None:
+            self._win.flush()
+        self._release()
+        if self.size is not None and self.count != self.size:
+            # fewer samples than announced: drop the unwritten tail
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.count * self.width)
+            self.size = self.count
+        return self.count
+
+    def abort(self):
+        """Close the file without finishing it (after an error)."""
+        self._release()
+
+    def _release(self):
+        self._win = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def _write_codes(f, u, binary, text_mode, total_bits, byteorder):
+    if binary:
+        f.write(uints_to_bytes(u, total_bits, byteorder))
+    else:
+        buf = hex_encode(u, total_bits)
+        f.write(buf.decode('ascii') if text_mode else buf)
+
+
+def channel_paths(path, channels):
+    """One output path per channel: data.bin -> data_ch0.bin, data_ch1.bin, ..."""
+    root, ext = os.path.splitext(path)
+    return ['%s_ch%d%s' % (root, c, ext) for c in range(channels)]
+
+
+@instrumented('write', lambda n, args: n)
+def write_quantized_channels(blocks, paths, fmt, total_bits, byteorder='big'):
+    """
+    Write 2-D (samples, channels) code blocks to one file per channel in a single pass.
+
+    Every file holds the same bytes write_quantized would write for that channel alone.
+    Returns the number of samples per channel.
+    """
+    binary = (fmt == 'bin')
+    text_mode = (not binary) and os.linesep != '\n'
+    count = 0
+    files = []
+    try:
+        for p in paths:
+            files.append(open(p, 'w' if text_mode else 'wb'))
+        for u in blocks:
+            u = np.asarray(u)
+            if u.ndim == 1:
+                u = u[:, None]
+            if u.shape[1] != len(files):
+                raise ValueError('%d channels for %d files' % (u.shape[1], len(files)))
+            for c, f in enumerate(files):
+                _write_codes(f, np.ascontiguousarray(u[:, c]), binary, text_mode, total_bits, byteorder)
+            count += u.shape[0]
+    finally:
+        for f in files:
+            f.close()
+    return count
+
+
+class MappedSamples:
+    """
+    Lazy, memory-mapped view of a fixed-width .bin sample file.
+
+    The file is mapped with np.memmap and nothing is decoded up front: indexing with a slice
+    or an index array decodes (and sign-extends) only the selected samples and reconstructs
+    them to float, so a decimated preview only touches the pages it plots. uints(key) returns
+    the raw codes. 1/2/4/8-byte samples map straight onto a native dtype; other widths
+    (e.g. 24-bit, 3 bytes) are mapped as an (n, bytes_per) uint8 array.
+    """
+
+    def __init__(self, path, total_bits, frac_bits=0, signed=True, byteorder='big', vmin=0.0, vmax=1.0):
+        if byteorder not in ('big', 'little'):
+            raise ValueError("byteorder must be 'big' or 'little'")
+        self.path = path
+        self.total_bits = int(total_bits)
+        self.frac_bits = int(frac_bits)
+        self.signed = bool(signed)
+        self.byteorder = byteorder
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self.bytes_per = (self.total_bits + 7) // 8
+        if self.bytes_per > 8:
+            raise ValueError('Samples wider than 64 bits are not supported')
+        size = os.path.getsize(path)
+        if size % self.bytes_per != 0:
+            raise ValueError('Binary file size is not a multiple of bytes per sample')
+        n = size // self.bytes_per
+        self._native = self.bytes_per in (1, 2, 4, 8)
+        if self._native:
+            dt = np.dtype('u%d' % self.bytes_per).newbyteorder('>' if byteorder == 'big' else '<')
+            shape = (n,)
+        else:
+            dt = np.uint8
+            shape = (n, self.bytes_per)
+        if n == 0:
+            # np.memmap cannot map an empty file
+            self._raw = np.zeros(shape, dtype=dt)
+        else:
+            self._raw = np.memmap(path, dtype=dt, mode='r', shape=shape)
+
+    def __len__(self):
+        return self._raw.shape[0]
+
+    @property
+    def size(self):
+        return len(self)
+
+    def uints(self, key=slice(None)):
+        """Decode the selected samples to uint64 codes."""
+        sel = self._raw[key]
+        if self._native:
+            return np.asarray(sel).astype(np.uint64)
+        sel = np.asarray(sel).reshape(-1, self.bytes_per)
+        le = np.zeros((sel.shape[0], 8), dtype=np.uint8)
+        le[:, :self.bytes_per] = sel[:, ::-1] if self.byteorder == 'big' else sel
+        return le.view('<u8').ravel()
+
+    def __getitem__(self, key):
+        u = self.uints(key)
+        if self.signed:
+            return reconstruct_signed(u, self.total_bits, self.frac_bits)
+        return reconstruct_unsigned(u, self.total_bits, self.vmin, self.vmax)
+
+    def __array__(self, dtype=None, copy=None):
+        vals = self[:]
+        return vals if dtype is None else vals.astype(dtype)
+
+
+@instrumented('parse')
+def load_samples(path, ffmt, total_bits=24, frac_bits=23, signed=True, byteorder='big', vmin=0.0, vmax=1.0):
+    """
+    Load samples for import/analysis and return them reconstructed to float.
+
+    ffmt: 'hex'/'mem'/'bin' (quantized codes, reconstructed with the given fixed-point format;
+    vmin/vmax map unsigned codes back to their range) or 'csv'/'mat'/'npz' (raw floats).
+    .bin files come back as a lazy MappedSamples; everything else as a numpy array.
+    """
+    p, tb, fb = path, int(total_bits), int(frac_bits)
+    vmin, vmax = float(vmin), float(vmax)
+    if ffmt in ('hex','mem'):
+        with open(p, 'rb') as f:
+            uints = hex_decode(f.read(), tb)
+    elif ffmt == 'bin':
+        # memory-mapped: samples are decoded and reconstructed only when indexed
+        recon = MappedSamples(p, tb, fb, signed=signed, byteorder=byteorder,
+                              vmin=vmin, vmax=vmax)
+        uints = None
+    elif ffmt in ('csv','mat','npz'):
+        # Raw imports: read floats from CSV/MAT/NPZ
+        if ffmt == 'csv':
+            data = np.loadtxt(p, delimiter=',')
+        elif ffmt == 'mat':
+            try:
+                from scipy import io as spio
+                mat = spio.loadmat(p)
+                # try common keys
+                if 'samples' in mat:
+                    data = np.asarray(mat['samples']).squeeze()
+                else:
+                    # pick the first numeric variable
+                    for k, v in mat.items():
+                        if not k.startswith('__'):
+                            data = np.asarray(v).squeeze()
+                            break
+            except Exception:
+                # fallback: try numpy.load
+                npz = np.load(p, allow_pickle=True)
+                if 'samples' in npz:
+                    data = np.asarray(npz['samples']).squeeze()
+                else:
+                    # pick first array-like
+                    keys = [k for k in npz.keys()]
+                    data = np.asarray(npz[keys[0]]).squeeze()
+        else:  # npz
+            npz = np.load(p, allow_pickle=True)
+            if 'samples' in npz:
+                data = np.asarray(npz['samples']).squeeze()
+            else:
+                keys = [k for k in npz.keys()]
+                data = np.asarray(npz[keys[0]]).squeeze()
+        # normalize data to 1D array
+        if data.ndim > 1:
+            # pick first column if 2D, else flatten
+            if data.shape[1] >= 1:
+                data = data[:,0]
+            else:
+                data = data.ravel()
+        recon = data.astype(float)
+        uints = None
+    else:
+        raise ValueError('Unsupported format')
+    if len(recon if uints is None else uints) == 0:
+        raise ValueError('No samples found in file')
+
+    # reconstruct floats (.bin reconstructs lazily inside MappedSamples)
+    if ffmt in ('hex', 'mem', 'bin') and not signed:
+        # need vmin/vmax to map back to float
+        if vmax <= vmin:
+            raise ValueError('vmax must be greater than vmin for unsigned reconstruction')
+    if uints is not None:
+        if signed:
+            recon = reconstruct_signed(uints, tb, fb)
+        else:
+            recon = reconstruct_unsigned(uints, tb, vmin, vmax)
+
+    return recon
+
+
+class EnvelopePyramid:
+    """
+    Multi-resolution min/max envelope of a 1-D signal for preview and zoom.
+
+    Built once in a single chunked pass (works on MappedSamples too): level 0 holds min/max
+    of bins of ``base`` samples and each further level merges ``factor`` bins. render() picks
+    the coarsest level that still gives at least one bin per pixel for the visible x-range,
+    so any zoom is re-drawn in O(pixels) and peaks/transitions are never dropped.
+    """
+
+    def __init__(self, data, base=64, factor=4, chunk=1 << 20, progress=None):
+        self.data = data
+        self.n = int(len(data))
+        chunk = max(base, (chunk // base) * base)
+        mins, maxs = [], []
+        for i in range(0, self.n, chunk):
+            blk = np.asarray(data[i:i + chunk], dtype=float)
+            starts = np.arange(0, blk.size, base)
+            mins.append(np.minimum.reduceat(blk, starts))
+            maxs.append(np.maximum.reduceat(blk, starts))
+            if progress is not None:
+                progress(min(1.0, (i + chunk) / float(self.n)))
+        lo = np.concatenate(mins) if mins else np.zeros(0)
+        hi = np.concatenate(maxs) if maxs else np.zeros(0)
+        self.levels = [(base, lo, hi)]
+        size = base
+        while lo.size > 1:
+            starts = np.arange(0, lo.size, factor)
+            lo = np.minimum.reduceat(lo, starts)
+            hi = np.maximum.reduceat(hi, starts)
+            size *= factor
+            self.levels.append((size, lo, hi))
+        top = self.levels[-1]
+        self.vmin = float(top[1].min()) if top[1].size else 0.0
+        self.vmax = float(top[2].max()) if top[2].size else 0.0
+
+    def __len__(self):
+        return self.n
+
+    def render(self, x0, x1, width):
+        """
+        Return (x, y, raw) for sample range [x0, x1] drawn ``width`` pixels wide.
+
+        raw=True means y are the samples themselves; otherwise (x, y) trace min and max of
+        each bin as a vertical stroke at the bin centre.
+        """
+        width = max(1, int(width))
+        i0 = max(0, int(math.floor(x0)))
+        i1 = min(self.n, int(math.ceil(x1)) + 1)
+        if i1 <= i0:
+            return np.zeros(0), np.zeros(0), True
+        count = i1 - i0
+        if count <= 2 * width:
+            return np.arange(i0, i1), np.asarray(self.data[i0:i1], dtype=float), True
+        spp = count / float(width)
+        level = None
+        for lv in self.levels:
+            if lv[0] <= spp:
+                level = lv
+        if level is None:
+            # zoomed in below the finest level: bin the (few) visible raw samples directly
+            size = int(math.ceil(spp))
+            blk = np.asarray(self.data[i0:i1], dtype=float)
+            starts = np.arange(0, blk.size, size)
+            lo = np.minimum.reduceat(blk, starts)
+            hi = np.maximum.reduceat(blk, starts)
+            centres = i0 + starts + (np.minimum(starts + size, blk.size) - starts - 1) / 2.0
+        else:
+            size, lo, hi = level
+            b0 = i0 // size
+            b1 = -(-i1 // size)
+            lo = lo[b0:b1]
+            hi = hi[b0:b1]
+            first = np.arange(b0, b1) * size
+            centres = (first + np.minimum(first + size, self.n) - 1) / 2.0
+        x = np.repeat(centres, 2)
+        y = np.column_stack((lo, hi)).ravel()
+        return x, y, False
+
+
+class QuantizedEnvelope:
+    """
+    Envelope of the quantized signal, mapped on demand from the analog EnvelopePyramid.
+
+    quantize -> reconstruct is monotonic, so the quantized min/max of a bin are the mapped
+    analog min/max: render() quantizes only the points it returns (O(pixels)) and the
+    whole signal is never quantized for the preview. Unsigned scaling takes the signal
+    range from the pyramid, which holds the global min/max already.
+    """
+
+    def __init__(self, pyramid, total_bits, frac_bits, unsigned=False):
+        self.pyramid = pyramid
+        self.total_bits = int(total_bits)
+        self.frac_bits = int(frac_bits)
+        self.unsigned = bool(unsigned)
+        self.range = (pyramid.vmin, pyramid.vmax - pyramid.vmin)
+        ends = self.map(np.array([pyramid.vmin, pyramid.vmax]))
+        self.vmin, self.vmax = float(ends[0]), float(ends[1])
+
+    def __len__(self):
+        return len(self.pyramid)
+
+    def map(self, values):
+        return quantize_reconstruct(values, self.total_bits, self.frac_bits, self.unsigned,
+                                    vmin=self.range[0], span=self.range[1])
+
+    def render(self, x0, x1, width):
+        x, y, raw = self.pyramid.render(x0, x1, width)
+        return x, self.map(y), raw
+
+
+# ---------------------------------------------------------------------------
+# Streaming spectrum and error analysis (utils/timeNpsdAnalysis.m)
+# ---------------------------------------------------------------------------
+
+WELCH_WINDOWS = ('hamming', 'hann', 'blackman', 'rect')
+# 一次 rfft 处理的最多段数：限制临时内存（段数 x nfft x 通道）
+WELCH_SEGMENT_BATCH = 64
+# 流式读取 .hex/.mem 时每次读入的字节数
+FILE_BLOCK_BYTES = 8 << 20
+
+
+@functools.lru_cache(maxsize=32)
+def welch_window(name, n):
+    """Symmetric window of length n as MATLAB's hamming(n) / hann(n) / blackman(n); read-only, cached."""
+    if name == 'hamming':
+        w = np.hamming(n)
+    elif name == 'hann':
+        w = np.hanning(n)
+    elif name == 'blackman':
+        w = np.blackman(n)
+    elif name == 'rect':
+        w = np.ones(n)
+    else:
+        raise ValueError('window must be one of %s' % ', '.join(WELCH_WINDOWS))
+    w.setflags(write=False)
+    return w
+
+
+class WelchPSD:
+    """
+    Welch power spectral density accumulated over signal blocks.
+
+    Same estimate as MATLAB's pwelch(x, window(nperseg), round(overlap * nperseg), nfft, fs):
+    the mean of the windowed segment periodograms, one-sided, in units^2/Hz. The windows are
+    symmetric (welch_window), so scipy.signal.welch matches only when given
+    get_window(name, nperseg, fftbins=False) and detrend=False; with its default periodic
+    window the result differs by ~1e-4 .. 1e-3 relative (less for longer segments).
+
+    update() takes 1-D blocks or (count, channels) blocks (one PSD per column); samples that
+    do not complete a segment wait for the next block, so the result does not depend on the
+    block split and memory stays at one segment per channel plus the FFT work space,
+    whatever the signal length. Windows are cached per (name, length) and numpy's FFT keeps
+    the plan for the repeated nfft.
+    A signal shorter than nperseg is estimated from a single segment of its own length.
+    """
+
+    def __init__(self, nperseg=8192, overlap=0.5, window='hamming', nfft=None, sample_rate=1.0):
+        self.nperseg = int(nperseg)
+        if self.nperseg < 2:
+            raise ValueError('nperseg must be at least 2')
+        noverlap = int(round(float(overlap) * self.nperseg))
+        if not 0 <= noverlap < self.nperseg:
+            raise ValueError('overlap must be in [0, 1)')
+        self.hop = self.nperseg - noverlap
+        self.window = window
+        self.nfft = int(nfft) if nfft else self.nperseg
+        if self.nfft < self.nperseg:
+            raise ValueError('nfft must be at least nperseg')
+        self.sample_rate = float(sample_rate)
+        welch_window(window, self.nperseg)
+        self.reset()
+
+    def reset(self):
+        self._buf = None
+        self._acc = None
+        self.segments = 0
+        self.samples = 0
+
+    @property
+    def frequencies(self):
+        return np.fft.rfftfreq(self.nfft, 1.0 / self.sample_rate)
+
+    @instrumented('psd', _arg_size)
+    def update(self, block):
+        blk = np.asarray(block, dtype=float)
+        if blk.ndim == 1:
+            blk = blk[:, None]
+        if self._buf is None:
+            self._buf = np.zeros((blk.shape[1], 0))
+            self._acc = np.zeros((blk.shape[1], self.nfft // 2 + 1))
+        data = np.concatenate((self._buf, blk.T), axis=1) if self._buf.shape[1] else blk.T
+        self.samples += blk.shape[0]
+        n = data.shape[1]
+        if n >= self.nperseg:
+            nseg = (n - self.nperseg) // self.hop + 1
+            win = welch_window(self.window, self.nperseg)
+            segs = sliding_window_view(data, self.nperseg, axis=1)[:, ::self.hop]
+            for s in range(0, nseg, WELCH_SEGMENT_BATCH):
+                spec = np.fft.rfft(segs[:, s:min(nseg, s + WELCH_SEGMENT_BATCH)] * win, self.nfft, axis=-1)
+                self._acc += (spec.real ** 2 + spec.imag ** 2).sum(axis=1)
+            self.segments += nseg
+            data = data[:, nseg * self.hop:]
+        self._buf = np.ascontiguousarray(data)
+
+    def psd(self):
+        """(frequencies, Pxx); Pxx is (channels, bins), or (bins,) for 1-D input."""
+        if self._acc is None or self.samples == 0:
+            raise ValueError('No samples')
+        if self.segments:
+            acc, count, win = self._acc, self.segments, welch_window(self.window, self.nperseg)
+            nfft, f = self.nfft, self.frequencies
+        else:
+            # shorter than one segment: periodogram of everything there is
+            n = self._buf.shape[1]
+            win = welch_window(self.window, n)
+            nfft = max(n, 2)
+            spec = np.fft.rfft(self._buf * win, nfft, axis=-1)
+            acc, count = spec.real ** 2 + spec.imag ** 2, 1
+            f = np.fft.rfftfreq(nfft, 1.0 / self.sample_rate)
+        p = acc / (count * self.sample_rate * float(np.dot(win, win)))
+        # one-sided: every bin but DC (and Nyquist for even nfft) stands for +f and -f
+        p[:, 1:nfft // 2 + (nfft % 2)] *= 2.0
+        return f, (p[0] if p.shape[0] == 1 else p)
+
+
+class ErrorStats:
+    """
+    Running error statistics of an estimate y_hat against a reference y, e = y - y_hat (the
+    numbers timeNpsdAnalysis.m prints): mse, relative error (|e|^2 / |y|^2, in %) and SNR in dB.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.err_energy = 0.0
+        self.ref_energy = 0.0
+
+    def update(self, y, y_hat):
+        y = np.asarray(y, dtype=float)
+        e = y - np.asarray(y_hat, dtype=float)
+        self.count += y.size
+        self.err_energy += float(np.dot(e, e))
+        self.ref_energy += float(np.dot(y, y))
+
+    @property
+    def mse(self):
+        return self.err_energy / self.count if self.count else 0.0
+
+    @property
+    def relative_error(self):
+        return 100.0 * self.err_energy / self.ref_energy if self.ref_energy else float('inf')
+
+    @property
+    def snr_db(self):
+        if not self.err_energy:
+            return float('inf')
+        if not self.ref_energy:
+            return float('-inf')
+        return 10.0 * math.log10(self.ref_energy / self.err_energy)
+
+    def describe(self):
+        return 'MSE %.3g, relative error %.3g %%, SNR %.1f dB' % (self.mse, self.relative_error, self.snr_db)
+
+
+def iter_file_blocks(path, ffmt, total_bits=24, frac_bits=23, signed=True, byteorder='big', vmin=0.0, vmax=1.0,
+                     block_size=1 << 20, progress=None):
+    """
+    Reconstructed float blocks of a sample file (arguments as load_samples) without reading
+    it whole: .bin through MappedSamples, .hex/.mem in FILE_BLOCK_BYTES pieces cut at line
+    ends; csv/mat/npz are loaded with load_samples. progress(fraction of the file).
+    """
+    tb, fb = int(total_bits), int(frac_bits)
+    if ffmt in ('hex', 'mem'):
+        if not signed and float(vmax) <= float(vmin):
+            raise ValueError('vmax must be greater than vmin for unsigned reconstruction')
+        size = max(1, os.path.getsize(path))
+        done = 0
+        tail = b''
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_BLOCK_BYTES)
+                data = tail + chunk
+                if chunk:
+                    cut = data.rfind(b'\n') + 1
+                    data, tail = data[:cut], data[cut:]
+                if data:
+                    u = hex_decode(data, tb)
+                    if u.size:
+                        yield (reconstruct_signed(u, tb, fb) if signed
+                               else reconstruct_unsigned(u, tb, float(vmin), float(vmax)))
+                done += len(chunk)
+                if progress is not None:
+                    progress(min(1.0, done / float(size)))
+                if not chunk:
+                    break
+        return
+    data = load_samples(path, ffmt, tb, fb, signed=signed, byteorder=byteorder, vmin=vmin, vmax=vmax)
+    n = len(data)
+    for i in range(0, n, block_size):
+        yield np.asarray(data[i:i + block_size], dtype=float)
+        if progress is not None:
+            progress(min(1.0, (i + block_size) / float(n)))
+
+
+# ---------------------------------------------------------------------------
+# Bit-accurate fixed-point FIR: what the FPGA computes from an exported stimulus
+# ---------------------------------------------------------------------------
+
+FIXED_FIR_ROUNDING = ('truncate', 'round', 'convergent')
+
+
+def sign_extend(codes, total_bits):
+    """Two's-complement codes (as produced by quantize_signed) -> signed int64 (total_bits <= 63)."""
+    ui = np.asarray(codes).astype(np.int64) & ((1 << total_bits) - 1)
+    sign = 1 << (total_bits - 1)
+    return (ui ^ sign) - sign
+
+
+def wrap_signed(values, bits):
+    """Keep the low ``bits`` bits of int64 values as two's complement (integer overflow)."""
+    sign = 1 << (bits - 1)
+    # int64 arithmetic is modulo 2^64, so the low bits are right even if values + sign wraps
+    return ((np.asarray(values, dtype=np.int64) + sign) & ((1 << bits) - 1)) - sign
+
+
+def shift_round(values, shift, rounding='round'):
+    """
+    values / 2^shift in integers: 'truncate' drops the LSBs (floor), 'round' adds half an
+    LSB first (round half up), 'convergent' rounds half to even. shift <= 0 shifts left.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if shift <= 0:
+        return values << -shift
+    if rounding == 'truncate':
+        return values >> shift
+    if rounding == 'round':
+        return (values + (1 << (shift - 1))) >> shift
+    if rounding == 'convergent':
+        q = values >> shift
+        rem = values & ((1 << shift) - 1)
+        half = 1 << (shift - 1)
+        return q + ((rem > half) | ((rem == half) & ((q & 1) == 1)))
+    raise ValueError('rounding must be one of %s' % ', '.join(FIXED_FIR_ROUNDING))
+
+
+def quantize_coefficients(coefficients, total_bits, frac_bits):
+    """Round float taps to Q(total_bits - frac_bits).frac_bits and saturate; signed int64."""
+    c = np.round(np.asarray(coefficients, dtype=float).ravel() * 2.0 ** frac_bits)
+    return np.clip(c, -2 ** (total_bits - 1), 2 ** (total_bits - 1) - 1).astype(np.int64)
+
+
+def load_coefficients(path):
+    """
+    Read FIR taps from .npy, .npz (array 'w', as save_adaptive_weights writes it), .csv/.txt
+    (one or more per line) or .mat. In a .mat file the variable 'w' is used (also inside a
+    struct, e.g. s.w from the LMS system identification scripts), otherwise the first
+    numeric vector.
+    """
+    low = path.lower()
+    if low.endswith('.npy'):
+        return np.load(path).astype(float).ravel()
+    if low.endswith('.npz'):
+        with np.load(path) as data:
+            return np.asarray(data['w'], dtype=float).ravel()
+    if low.endswith('.mat'):
+        from scipy import io as spio
+        mat = spio.loadmat(path, squeeze_me=True, struct_as_record=False)
+        found = []
+        for k, v in mat.items():
+            if k.startswith('__'):
+                continue
+            if k == 'w':
+                found.insert(0, v)
+            elif hasattr(v, 'w'):
+                found.insert(0, v.w)
+            elif isinstance(v, np.ndarray) and v.dtype.kind in 'iuf' and v.size > 1:
+                found.append(v)
+        if not found:
+            raise ValueError('No coefficient vector in %s' % path)
+        return np.asarray(found[0], dtype=float).ravel()
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read().replace(',', ' ')
+    return np.array(text.split(), dtype=float)
+
+
+class FixedPointFIR:
+    """
+    Bit-accurate model of a direct-form FIR on the FPGA.
+
+    Inputs are signed integers in Q(in_bits - in_frac).in_frac (the codes of quantize_signed),
+    coefficients are rounded and saturated to Q(coef_bits - coef_frac).coef_frac (or given as
+    integers with integer_coefficients=True). Products are exact and summed in an
+    ``acc_bits`` two's-complement accumulator that wraps like a DSP48 cascade; the sums
+    are modular, so the order of the additions does not matter. The sum is scaled to the
+    output format by dropping in_frac + coef_frac - out_frac LSBs with ``rounding``
+    ('truncate', 'round' = half up, 'convergent' = half even), then saturated
+    (overflow='saturate') or wrapped ('wrap') to out_bits. All widths are at most 63 bits.
+
+    process() keeps the last taps - 1 inputs, so any block split gives the same output; each
+    block costs one vectorized int64 multiply-add per non-zero tap (a million samples
+    through 512 taps in well under a second). acc_overflows / out_overflows count the
+    samples that wrapped in the accumulator (only detectable while required_acc_bits
+    <= 63) or hit the output limits.
+    """
+
+    def __init__(self, coefficients, in_bits=24, in_frac=23, coef_bits=18, coef_frac=17, acc_bits=48,
+                 out_bits=24, out_frac=23, rounding='round', overflow='saturate', integer_coefficients=False):
+        for name, bits in (('in_bits', in_bits), ('coef_bits', coef_bits), ('acc_bits', acc_bits),
+                           ('out_bits', out_bits)):
+            if not 2 <= int(bits) <= 63:
+                raise ValueError('%s must be between 2 and 63, got %r' % (name, bits))
+        if rounding not in FIXED_FIR_ROUNDING:
+            raise ValueError('rounding must be one of %s' % ', '.join(FIXED_FIR_ROUNDING))
+        if overflow not in ('saturate', 'wrap'):
+            raise ValueError("overflow must be 'saturate' or 'wrap'")
+        self.in_bits, self.in_frac = int(in_bits), int(in_frac)
+        self.coef_bits, self.coef_frac = int(coef_bits), int(coef_frac)
+        self.acc_bits = int(acc_bits)
+        self.out_bits, self.out_frac = int(out_bits), int(out_frac)
+        self.rounding = rounding
+        self.overflow = overflow
+        if integer_coefficients:
+            self.coef = wrap_signed(np.asarray(coefficients, dtype=np.int64).ravel(), self.coef_bits)
+        else:
+            self.coef = quantize_coefficients(coefficients, self.coef_bits, self.coef_frac)
+        if self.coef.size == 0:
+            raise ValueError('FIR needs at least one coefficient')
+        self.shift = self.in_frac + self.coef_frac - self.out_frac
+        self.reset()
+
+    @property
+    def required_acc_bits(self):
+        """Accumulator width that cannot overflow for any input with these coefficients."""
+        return self.in_bits + max(1, int(np.abs(self.coef).sum()).bit_length())
+
+    def describe(self):
+        return ('Fixed-point FIR: %d taps Q%d.%d, acc %d bits (needs %d), out Q%d.%d, %s/%s'
+                % (self.coef.size, self.coef_bits - self.coef_frac, self.coef_frac, self.acc_bits,
+                   self.required_acc_bits, self.out_bits - self.out_frac, self.out_frac,
+                   self.rounding, self.overflow))
+
+    def reset(self):
+        self._hist = np.zeros(self.coef.size - 1, dtype=np.int64)
+        self.acc_overflows = 0
+        self.out_overflows = 0
+
+    @instrumented('fir_sim')
+    def process(self, x):
+        """Filter a block of signed integer inputs; returns the signed int64 outputs."""
+        x = np.asarray(x, dtype=np.int64).ravel()
+        n = x.size
+        T = self.coef.size
+        xx = np.concatenate((self._hist, x))
+        acc = np.zeros(n, dtype=np.int64)
+        tmp = np.empty(n, dtype=np.int64)
+        for k in np.flatnonzero(self.coef):
+            # y[i] += c[k] * x[i - k]; x[i] sits at xx[T - 1 + i]
+            np.multiply(xx[T - 1 - k:T - 1 - k + n], self.coef[k], out=tmp)
+            acc += tmp
+        if T > 1:
+            self._hist = xx[xx.size - (T - 1):].copy()
+        if self.required_acc_bits > self.acc_bits:
+            lim = 1 << (self.acc_bits - 1)
+            if self.required_acc_bits <= 63:
+                self.acc_overflows += int(np.count_nonzero((acc < -lim) | (acc >= lim)))
+            acc = wrap_signed(acc, self.acc_bits)
+        y = shift_round(acc, self.shift, self.rounding)
+        lim = 1 << (self.out_bits - 1)
+        over = (y < -lim) | (y >= lim)
+        count = int(np.count_nonzero(over))
+        if count:
+            self.out_overflows += count
+            y = np.clip(y, -lim, lim - 1) if self.overflow == 'saturate' else wrap_signed(y, self.out_bits)
+        return y
+
+    def process_codes(self, codes):
+        """quantize_signed codes in, output codes (two's complement, uint_dtype(out_bits)) out."""
+        y = self.process(sign_extend(codes, self.in_bits))
+        return self.to_codes(y)
+
+    def to_codes(self, y):
+        return (y & ((1 << self.out_bits) - 1)).astype(uint_dtype(self.out_bits))
+
+    def to_values(self, y):
+        """Output integers as floats (Q out_frac)."""
+        return np.asarray(y, dtype=float) / 2.0 ** self.out_frac
+
+    def filter_stream(self, stream, progress=None):
+        """Quantize a SignalStream to the input format and yield the filtered integer blocks."""
+        self.reset()
+        for u in iter_quantized(stream, self.in_bits, self.in_frac, progress=progress):
+            yield self.process(sign_extend(u, self.in_bits))
+
+
+def export_fixed_fir(stream, fir, path, fmt, byteorder='big', progress=None):
+    """
+    Write the golden output vector of ``fir`` for a stimulus stream to .hex/.mem/.bin, in
+    the same layout export_quantized_stream uses (out_bits-wide codes). Returns the
+    number of samples written.
+    """
+    blocks = (fir.to_codes(y) for y in fir.filter_stream(stream, progress=progress))
+    return write_quantized(blocks, path, fmt, fir.out_bits, byteorder)
+
+
+# ---------------------------------------------------------------------------
+# Adaptive filters: LMS system identification / FxLMS (utils/LMS_SYS_ID.m, utils/FXLMS.m)
+# ---------------------------------------------------------------------------
+
+ADAPTIVE_ALGORITHMS = ('lms', 'nlms', 'fxlms', 'fxnlms')
+# 频域 NLMS：各频点功率的指数平滑系数，以及相对平均功率的正则项（避免带外空频点被放大）
+FDAF_POWER_SMOOTHING = 0.9
+FDAF_REGULARIZATION = 1e-3
+
+
+class AdaptiveFilter:
+    """
+    Block LMS / NLMS / FxLMS adaptive FIR for system identification and ANC simulation.
+
+    process(x, d) filters the reference x with the weights w (y[n] = sum_k w[k] x[n-k]) and
+    adapts w so that e = d - y goes to zero. For FxLMS / FxNLMS, y first passes through the
+    true secondary path S (e = d - S * y) and the update uses the reference filtered by the
+    estimate S_est (filtered-x, default S_est = S), as in run_fxlms.m. Per-sample update with
+    r_n = [r[n], ..., r[n-taps+1]] (r = x, or S_est * x for the Fx variants):
+
+        lms / fxlms:    w += mu * e[n] * r_n
+        nlms / fxnlms:  w += mu * e[n] * r_n / (eps + |r_n|^2)
+
+    (LMS_SYS_ID.m writes the LMS update with 2 * mu.)
+
+    block_size=1 runs exactly that, sample by sample (a Python loop, a few us per sample).
+    block_size=B > 1 is block LMS: w is held for B samples, then moved by mu times the summed
+    gradient (normalized by the mean |r_n|^2 of the block for NLMS), which costs two matrix
+    products per block. domain='freq' is the constrained frequency-domain LMS (B = taps,
+    2 * taps point FFTs): for LMS / FxLMS the same update as block LMS, only faster for long
+    filters; NLMS / FxNLMS instead divide each frequency bin by its own smoothed power, which
+    keeps mu around 0.1 .. 1 stable and fast-converging even for band-limited references,
+    where a block update normalized by the total power needs a much smaller mu.
+
+    Output does not depend on how the record is split into process() calls: a block that
+    ends inside a call is completed by the next one. With history=K the weights and the mean
+    square error of every K samples (rounded up to whole blocks) are recorded in
+    weight_history / error_history.
+    """
+
+    def __init__(self, taps, mu, algorithm='lms', block_size=1, domain='time', secondary_path=None,
+                 secondary_estimate=None, eps=1e-8, history=0):
+        if algorithm not in ADAPTIVE_ALGORITHMS:
+            raise ValueError('algorithm must be one of %s' % ', '.join(ADAPTIVE_ALGORITHMS))
+        self.taps = int(taps)
+        if self.taps < 1:
+            raise ValueError('taps must be at least 1')
+        self.mu = float(mu)
+        self.algorithm = algorithm
+        self.normalized = algorithm in ('nlms', 'fxnlms')
+        self.eps = float(eps)
+        if domain not in ('time', 'freq'):
+            raise ValueError("domain must be 'time' or 'freq'")
+        self.domain = domain
+        self.block_size = self.taps if domain == 'freq' else max(1, int(block_size))
+        if algorithm.startswith('fx'):
+            if secondary_path is None:
+                raise ValueError('%s needs the secondary path' % algorithm)
+            self.secondary = np.asarray(secondary_path, dtype=float).ravel()
+            est = self.secondary if secondary_estimate is None else secondary_estimate
+            self.secondary_estimate = np.asarray(est, dtype=float).ravel()
+        else:
+            self.secondary = self.secondary_estimate = None
+        self.history = int(history or 0)
+        self.reset()
+
+    def reset(self):
+        """Zero the weights, the filter states and the history."""
+        L = self.taps
+        self._wr = np.zeros(L)  # weights in reverse order: y[n] = x[n-L+1:n+1] . _wr
+        self._xh = np.zeros(L - 1)
+        self._rh = np.zeros(L - 1)
+        self._est = StreamingFIR(self.secondary_estimate, 'direct') if self.secondary is not None else None
+        self._yh = np.zeros(self.secondary.size - 1) if self.secondary is not None else None
+        self._grad = np.zeros(L)
+        self._pw = 0.0
+        self._bin_power = None
+        self._fill = 0
+        self._esq = 0.0
+        self.position = 0
+        self._weights = []
+        self._errors = []
+
+    @property
+    def weights(self):
+        return self._wr[::-1].copy()
+
+    @property
+    def history_interval(self):
+        """Samples between history records (history rounded up to whole blocks), 0 if off."""
+        if self.history <= 0:
+            return 0
+        return -(-self.history // self.block_size) * self.block_size
+
+    @property
+    def weight_history(self):
+        return np.array(self._weights).reshape(-1, self.taps)
+
+    @property
+    def error_history(self):
+        return np.array(self._errors)
+
+    def describe(self):
+        name = {'lms': 'LMS', 'nlms': 'NLMS', 'fxlms': 'FxLMS', 'fxnlms': 'FxNLMS'}[self.algorithm]
+        if self.block_size == 1:
+            mode = 'per sample'
+        else:
+            mode = 'block %d%s' % (self.block_size, ', FFT' if self.domain == 'freq' else '')
+        return '%s, %d taps, mu %g, %s' % (name, self.taps, self.mu, mode)
+
+    def _record(self, e, start, stop):
+        """History entry at the current position; e[start:stop] are the samples since the last one."""
+        seg = e[start:stop]
+        self._esq += float(np.dot(seg, seg))
+        self._weights.append(self.weights)
+        self._errors.append(self._esq / self.history_interval)
+        self._esq = 0.0
+
+    @instrumented('adapt')
+    def process(self, x, d):
+        """Adapt over one chunk; returns (y, e). For FxLMS y is the output before the secondary path."""
+        x = np.asarray(x, dtype=float).ravel()
+        d = np.asarray(d, dtype=float).ravel()
+        if x.size != d.size:
+            raise ValueError('x and d differ in length (%d, %d)' % (x.size, d.size))
+        n = x.size
+        xx = np.concatenate((self._xh, x))
+        rr = xx if self._est is None else np.concatenate((self._rh, self._est.process(x)))
+        y = np.empty(n)
+        e = np.empty(n)
+        if self.block_size == 1:
+            last = self._run_samples(xx, rr, d, y, e)
+        else:
+            last = i = 0
+            while i < n:
+                m = min(n - i, self.block_size - self._fill)
+                if self._run_block(xx, rr, d, y, e, i, m):
+                    self._record(e, last, i + m)
+                    last = i + m
+                i += m
+        seg = e[last:]
+        self._esq += float(np.dot(seg, seg))
+        L = self.taps
+        if L > 1:
+            self._xh = xx[xx.size - (L - 1):].copy()
+            self._rh = rr[rr.size - (L - 1):].copy() if rr is not xx else self._xh
+        return y, e
+
+    def _secondary_out(self, y):
+        """S * y with the state of the previous blocks."""
+        yy = np.concatenate((self._yh, y))
+        if self._yh.size:
+            self._yh = yy[y.size:].copy()
+        return np.convolve(yy, self.secondary, mode='valid')
+
+    def _run_samples(self, xx, rr, d, y, e):
+        """Sample-exact update; returns the index after the last history record."""
+        L, n = self.taps, d.size
+        X = sliding_window_view(xx, L)
+        R = X if rr is xx else sliding_window_view(rr, L)
+        wr, mu, eps, norm = self._wr, self.mu, self.eps, self.normalized
+        fx = self._yh is not None
+        if fx:
+            Ls = self.secondary.size
+            sr = self.secondary[::-1].copy()
+            yy = np.concatenate((self._yh, np.zeros(n)))
+        K = self.history_interval
+        snap = (K - 1 - self.position % K) if K else n
+        last = 0
+        for j in range(n):
+            yj = float(np.dot(X[j], wr))
+            y[j] = yj
+            if fx:
+                yy[Ls - 1 + j] = yj
+                ej = d[j] - float(np.dot(yy[j:j + Ls], sr))
+            else:
+                ej = d[j] - yj
+            e[j] = ej
+            r = R[j]
+            step = mu * ej
+            if norm:
+                step /= eps + float(np.dot(r, r))
+            wr += step * r
+            if j == snap:
+                self.position += j + 1 - last
+                self._record(e, last, j + 1)
+                last = j + 1
+                snap += K
+        if fx and Ls > 1:
+            self._yh = yy[n:].copy()
+        self.position += n - last
+        return last
+
+    def _run_block(self, xx, rr, d, y, e, i, m):
+        """Samples i..i+m of this chunk, all inside one block; True when a history entry is due."""
+        L, B = self.taps, self.block_size
+        freq = self.domain == 'freq'
+        whole = m == B and self._fill == 0
+        if freq and whole:
+            # overlap-save: the 2L - 1 inputs covering the block, zero-padded to 2L
+            sx = np.fft.rfft(xx[i:i + 2 * L - 1], 2 * L)
+            yb = np.fft.irfft(sx * np.fft.rfft(self._wr[::-1], 2 * L), 2 * L)[L - 1:2 * L - 1]
+        else:
+            yb = sliding_window_view(xx[i:i + m + L - 1], L) @ self._wr
+        y[i:i + m] = yb
+        if self._yh is not None:
+            yb = self._secondary_out(yb)
+        eb = d[i:i + m] - yb
+        e[i:i + m] = eb
+        r = rr[i:i + m + L - 1]
+        if freq:
+            # the gradient is formed once the block is complete, from the block's errors
+            # and the 2L - 1 regressor samples they were made with
+            if whole:
+                span, errs = r, eb
+                sr = sx if rr is xx else None
+            else:
+                if self._fill == 0:
+                    self._span, self._errs = [r[:L - 1]], []
+                self._span.append(r[L - 1:])
+                self._errs.append(eb)
+                if self._fill + m == B:
+                    span, errs = np.concatenate(self._span), np.concatenate(self._errs)
+                    sr = None
+        elif self._fill == 0 and whole:
+            self._grad = eb @ sliding_window_view(r, L)
+        else:
+            self._grad += eb @ sliding_window_view(r, L)
+        if self.normalized and not freq:
+            c = np.concatenate(([0.0], np.cumsum(r * r)))
+            self._pw += float((c[L:] - c[:-L]).sum())
+        self._fill += m
+        self.position += m
+        if self._fill < B:
+            return False
+        if freq:
+            self._wr += self.mu * self._freq_gradient(span, errs, sr)
+        else:
+            step = self.mu / (self.eps + self._pw / B) if self.normalized else self.mu
+            self._wr += step * self._grad
+            self._grad[:] = 0.0
+            self._pw = 0.0
+        self._fill = 0
+        K = self.history_interval
+        return bool(K) and self.position % K == 0
+
+    def _freq_gradient(self, span, errs, sr=None):
+        """
+        Block gradient (reversed like _wr) as the correlation of the errors with the
+        regressor, via 2L point FFTs. NLMS divides every bin by its smoothed power first.
+        """
+        L = self.taps
+        nfft = 2 * L
+        if sr is None:
+            sr = np.fft.rfft(span, nfft)
+        # errors at lags L-1 .. 2L-2; lags 0 .. L-1 of the circular correlation do not wrap
+        G = np.fft.rfft(np.concatenate((np.zeros(L - 1), errs)), nfft) * np.conj(sr)
+        if self.normalized:
+            power = sr.real ** 2 + sr.imag ** 2
+            if self._bin_power is None:
+                self._bin_power = power
+            else:
+                self._bin_power = FDAF_POWER_SMOOTHING * self._bin_power + (1 - FDAF_POWER_SMOOTHING) * power
+            # regularized against (nearly) empty bins outside the band of the reference
+            G /= self._bin_power + self.eps + FDAF_REGULARIZATION * self._bin_power.mean()
+        return np.fft.irfft(G, nfft)[L - 1::-1]
+
+    def run(self, x, d, chunk=DEFAULT_BLOCK_SIZE, progress=None):
+        """
+        Adapt over whole records (arrays or MappedSamples, read ``chunk`` samples at a time);
+        returns (y, e). progress(fraction) may raise JobCancelled.
+        """
+        n = min(len(x), len(d))
+        chunk = max(1, chunk // self.block_size) * self.block_size
+        y = np.empty(n)
+        e = np.empty(n)
+        for i in range(0, n, chunk):
+            j = min(n, i + chunk)
+            y[i:j], e[i:j] = self.process(x[i:j], d[i:j])
+            if progress is not None:
+                progress(j / float(n))
+        return y, e
+
+
+def save_adaptive_weights(path, filt, sample_rate):
+    """
+    Save the weights like LMS_SYS_ID.m (struct s with w, fs, mu), so run_fxlms.m and
+    load_coefficients read them back. Without scipy the weights go to ``path`` with the
+    extension changed to .npz. Returns the path actually written.
+    """
+    try:
+        from scipy import io as spio
+    except ImportError:
+        path = os.path.splitext(path)[0] + '.npz'
+        np.savez(path, w=filt.weights, fs=float(sample_rate), mu=filt.mu, algorithm=filt.algorithm)
+        return path
+    try:
+        spio.savemat(path, {'s': {'w': filt.weights.reshape(-1, 1), 'fs': float(sample_rate), 'mu': filt.mu,
+                                  'algorithm': filt.algorithm}})
+    except Exception as e:
+        raise RuntimeError('Could not save the adaptive filter weights to %s: %s' % (path, e)) from e
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Stage-cached pipeline: generate -> offset -> quantize -> reconstruct
+# ---------------------------------------------------------------------------
+
+# 各阶段结果的内存上限（字节）；超过后按最近最少使用淘汰
+PIPELINE_CACHE_BYTES = 512 << 20
+
+
+def stage_key(stage, *inputs):
+    """Hash of a stage name and its inputs (parent stage keys, parameters)."""
+    import hashlib
+    return hashlib.sha1(repr((stage,) + inputs).encode('utf-8')).hexdigest()
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+class StageCache:
+    """LRU of stage results bounded by total array bytes. Cached arrays are made read-only."""
+
+    def __init__(self, max_bytes=PIPELINE_CACHE_BYTES):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            # larger than the whole budget: hand it back without caching
+            return value
+        for v in (value if isinstance(value, (tuple, list)) else (value,)):
+            if isinstance(v, np.ndarray):
+                v.setflags(write=False)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, old) = self._items.popitem(last=False)
+                self.nbytes -= old
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+class SignalPipeline:
+    """
+    generate -> offset -> quantize -> reconstruct with every stage output cached in a
+    StageCache under a hash of its inputs, so a bit-width edit only re-quantizes and an export
+    after a preview writes the previewed codes.
+
+    spec is a normalized job dict as used by job_stream(); it must carry a concrete seed
+    for random signals, otherwise every generate run is a new realization. The generate
+    stage runs with offset 0; 'offset' is applied by the offset stage (same values as a
+    stream built with the offset). Results are read-only arrays shared with the cache.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else StageCache()
+
+    def keys(self, spec, total_bits=None, frac_bits=None, unsigned=False):
+        """Stage keys for spec (and the fixed-point format, if given)."""
+        gen = dict(spec)
+        offset = float(gen.pop('offset', 0.0))
+        k = {'generate': stage_key('generate', tuple(sorted(gen.items())))}
+        k['offset'] = stage_key('offset', k['generate'], offset)
+        if total_bits is not None:
+            fmt = ('unsigned', int(total_bits)) if unsigned else ('signed', int(total_bits), int(frac_bits))
+            k['range'] = stage_key('range', k['offset'])
+            k['quantize'] = stage_key('quantize', k['offset'], fmt)
+            k['reconstruct'] = stage_key('reconstruct', k['quantize'])
+        return k
+
+    def stream(self, spec, offset=True):
+        """SignalStream for spec (without the offset if offset=False)."""
+        if not offset:
+            spec = dict(spec, offset=0.0)
+        return job_stream(spec)
+
+    def generate(self, spec, progress=None):
+        key = self.keys(spec)['generate']
+        vals = self.cache.get(key)
+        if vals is None:
+            stream = self.stream(spec, offset=False)
+            n = len(stream)
+            vals = np.empty(n, dtype=float)
+            for blk in stream:
+                vals[stream.position - blk.size:stream.position] = blk
+                if progress is not None:
+                    progress(stream.position / max(1, n))
+            vals = self.cache.put(key, vals)
+        return vals
+
+    @instrumented('offset')
+    def offset(self, spec, progress=None):
+        key = self.keys(spec)['offset']
+        vals = self.cache.get(key)
+        if vals is None:
+            raw = self.generate(spec, progress)
+            offset = float(spec.get('offset', 0.0))
+            # x + 0.0 only turns -0.0 into 0.0, which the generate stage already did
+            vals = raw if offset == 0.0 else self.cache.put(key, raw + offset)
+        return vals
+
+    def value_range(self, spec, progress=None):
+        """(min, span) of the offset signal, span = max - min (the unsigned scaling)."""
+        key = self.keys(spec, 1, 0)['range']
+        r = self.cache.get(key)
+        if r is None:
+            lo, hi = value_range(self.offset(spec, progress))
+            r = self.cache.put(key, (float(lo), float(hi - lo)))
+        return r
+
+    def quantize(self, spec, total_bits, frac_bits, unsigned=False, progress=None):
+        key = self.keys(spec, total_bits, frac_bits, unsigned)['quantize']
+        u = self.cache.get(key)
+        if u is None:
+            vals = self.offset(spec, progress)
+            if unsigned:
+                lo, span = self.value_range(spec)
+                u = quantize_unsigned(vals, total_bits, vmin=lo, span=span, compact=True)
+            else:
+                u = quantize_signed(vals, total_bits, frac_bits, compact=True)
+            u = self.cache.put(key, u)
+        return u
+
+    def reconstruct(self, spec, total_bits, frac_bits, unsigned=False, progress=None):
+        key = self.keys(spec, total_bits, frac_bits, unsigned)['reconstruct']
+        recon = self.cache.get(key)
+        if recon is None:
+            u = self.quantize(spec, total_bits, frac_bits, unsigned, progress)
+            if unsigned:
+                lo, span = self.value_range(spec)
+                recon = reconstruct_unsigned(u, total_bits, lo, lo + (span if span != 0 else 1.0))
+            else:
+                recon = reconstruct_signed(u, total_bits, frac_bits)
+            recon = self.cache.put(key, recon)
+        return recon
+
+    def cached_codes(self, spec, total_bits, frac_bits, unsigned=False):
+        """Quantized codes if this exact stage is cached, else None."""
+        return self.cache.get(self.keys(spec, total_bits, frac_bits, unsigned)['quantize'])
+
+    def generated_codes(self, spec, total_bits, frac_bits, unsigned=False, progress=None):
+        """Quantized codes if the signal is already generated (quantizing if needed), else None."""
+        k = self.keys(spec, total_bits, frac_bits, unsigned)
+        if not (k['quantize'] in self.cache or k['offset'] in self.cache or k['generate'] in self.cache):
+            return None
+        return self.quantize(spec, total_bits, frac_bits, unsigned, progress)
+
+    def channels(self, specs, progress=None):
+        """(samples, channels) array of the offset signals; identical specs are generated once."""
+        cols = []
+        for c, spec in enumerate(specs):
+            step = None if progress is None else (lambda f, c=c: progress((c + f) / len(specs)))
+            cols.append(self.offset(spec, progress=step))
+        if len(set(len(v) for v in cols)) > 1:
+            raise ValueError('Channels differ in length')
+        out = np.empty((len(cols[0]), len(cols)))
+        for c, v in enumerate(cols):
+            out[:, c] = v
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Headless batch generation
+# ---------------------------------------------------------------------------
+
+# 批处理任务的默认参数（任务文件中的 "defaults" 与每个任务的字段依次覆盖）
+BATCH_DEFAULTS = {
+    'amplitude': 1.0,
+    'offset': 0.0,
+    'sample_rate': 48000.0,
+    'time': 10.0,
+    'total_bits': 24,
+    'frac_bits': 23,
+    'signed': True,
+    'format': 'bin',
+    'byteorder': 'big',
+}
+
+
+def _format_rate(sample_rate):
+    sr = float(sample_rate)
+    if sr >= 1000:
+        return '%gkHz' % (sr / 1000.0)
+    return '%gHz' % sr
+
+
+def stimulus_name(job):
+    """
+    File name (without extension) following the convention in exp_data/fixed_FIR.md:
+
+        [type]_[low]T[high]Hz_Fs[rate]_FIROrder[order]_[Q format]
+
+    e.g. BB_200T300Hz_Fs48kHz_FIROrder512_Q123 or Harmonic_Base200_Fs48kHz_Q123.
+    Band-limited noise is 'WB' when highcut >= 10 * lowcut and 'BB' otherwise unless the job
+    sets 'prefix'; an explicit 'name' wins, 'suffix' (e.g. a date) is appended.
+    """
+    if job.get('name'):
+        return str(job['name'])
+    kind = job['type']
+    if kind == 'white_noise':
+        lo, hi = float(job['lowcut']), float(job['highcut'])
+        prefix = job.get('prefix') or ('WB' if lo > 0 and hi >= 10 * lo else 'BB')
+        parts = ['%s_%gT%gHz' % (prefix, lo, hi)]
+    elif kind == 'harmonic':
+        parts = ['%s_Base%g' % (job.get('prefix') or 'Harmonic', float(job['base']))]
+    elif kind == 'multisine':
+        freqs = parse_float_list(job['frequencies'])
+        parts = ['%s_%dTone_%gT%gHz' % (job.get('prefix') or 'Multisine', len(freqs), min(freqs), max(freqs))]
+    elif kind == 'sine':
+        parts = ['%s_%gHz' % (job.get('prefix') or 'Sine', float(job['frequency']))]
+        if (job.get('mode') or 'float').lower() == 'dds':
+            parts.append('DDS%dx%d' % (int(job.get('lut_bits', 10)), int(job.get('lut_width', 16))))
+    elif kind == 'square':
+        parts = ['%s_%gHz_Duty%g' % (job.get('prefix') or 'Square', float(job['frequency']),
+                                     100.0 * float(job.get('duty', 0.5)))]
+    elif kind == 'prbs':
+        if (job.get('mode') or 'lfsr').lower() == 'lfsr':
+            parts = ['%s%d' % (job.get('prefix') or 'PRBS', int(job.get('order', 13)))]
+        else:
+            parts = ['%sRNG' % (job.get('prefix') or 'PRBS')]
+    elif kind == 'multichannel':
+        parts = ['%s_%dCh' % (job.get('prefix') or 'MultiCh', len(job['channels']))]
+    else:
+        raise ValueError('Unknown job type: %r' % kind)
+    parts.append('Fs' + _format_rate(job['sample_rate']))
+    if job.get('fir_order') is not None:
+        parts.append('FIROrder%d' % int(job['fir_order']))
+    tb, fb = int(job['total_bits']), int(job['frac_bits'])
+    parts.append('Q%d%d' % (tb - fb, fb) if job.get('signed', True) else 'U%d' % tb)
+    if job.get('suffix'):
+        parts.append(str(job['suffix']))
+    return '_'.join(parts)
+
+
+def job_seed(master_seed, name):
+    """Per-job seed derived from the master seed and the job's file name (not its position)."""
+    import hashlib
+    digest = hashlib.sha256(('%s:%s' % (master_seed, name)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little') >> 1
+
+
+# 多通道任务中由任务本身继承给各通道的字段（通道内同名字段优先）
+CHANNEL_INHERITED = ('amplitude', 'offset', 'sample_rate', 'time', 'samples')
+
+
+def channel_jobs(job):
+    """
+    Per-channel job dicts of a 'multichannel' job.
+
+    Each entry of job['channels'] is a job of its own (type, frequency, seed, ...) that
+    inherits CHANNEL_INHERITED from the enclosing job. A channel without a seed gets one
+    derived from the job seed and its settings, so identical channels stay identical (and
+    are generated once) while different ones get independent realizations.
+    """
+    out = []
+    for ch in job['channels']:
+        full = {k: job[k] for k in CHANNEL_INHERITED if job.get(k) is not None}
+        full.update(ch)
+        if 'samples' in ch:
+            full.pop('time', None)
+        elif 'time' in ch:
+            full.pop('samples', None)
+        if full.get('seed') is None and job.get('seed') is not None:
+            full['seed'] = job_seed(job['seed'], stage_key('channel', tuple(sorted(full.items()))))
+        out.append(full)
+    return out
+
+
+def job_stream(job, block_size=DEFAULT_BLOCK_SIZE, taps='design'):
+    """Build the SignalStream for one normalized batch job (taps: see WhiteNoiseStream)."""
+    kind = job['type']
+    if kind == 'multichannel':
+        return MultiChannelStream(channel_jobs(job), block_size=block_size)
+    sr = float(job['sample_rate'])
+    if job.get('samples') is not None:
+        num = int(job['samples'])
+    else:
+        num = max(1, int(round(float(job['time']) * sr)))
+    amp = float(job['amplitude'])
+    kw = dict(offset=float(job['offset']), block_size=block_size)
+    if kind == 'sine':
+        if (job.get('mode') or 'float').lower() == 'dds':
+            return NCOStream(num, amp, float(job['frequency']), float(job.get('phase', 0.0)), sr,
+                             acc_bits=int(job.get('acc_bits', 32)), lut_bits=int(job.get('lut_bits', 10)),
+                             lut_width=int(job.get('lut_width', 16)),
+                             quarter_wave=bool(job.get('quarter_wave', True)), **kw)
+        return SineStream(num, amp, float(job['frequency']), float(job.get('phase', 0.0)), sr, **kw)
+    if kind == 'square':
+        return SquareStream(num, amp, float(job['frequency']), float(job.get('duty', 0.5)), sr, **kw)
+    if kind == 'prbs':
+        mode = (job.get('mode') or 'lfsr').lower()
+        order = job.get('order', 13)
+        return PRBSStream(num, amp, job['seed'], int(order) if order is not None else None, mode=mode, **kw)
+    if kind == 'white_noise':
+        return WhiteNoiseStream(num, amp, sr, float(job['lowcut']), float(job['highcut']),
+                                int(job.get('fir_order', 101)), seed=job['seed'],
+                                phase=job.get('filter_phase', 'zero'), method=job.get('fir_method', 'auto'),
+                                taps=taps, **kw)
+    if kind == 'harmonic':
+        n = int(job.get('harmonics', 3))
+        base = float(job['base'])
+        # equal tones, amp / n each, zero phase
+        return MultisineStream(num, amp, [base * (k + 1) for k in range(n)], sr, phase_mode='zero',
+                               method=job.get('synthesis', 'auto'), **kw)
+    if kind == 'multisine':
+        return MultisineStream(num, amp, job['frequencies'], sr, amplitudes=job.get('amplitudes'),
+                               phases=job.get('phases'), phase_mode=job.get('phase_mode', 'schroeder'),
+                               seed=job.get('seed'), method=job.get('synthesis', 'auto'), **kw)
+    if kind == 'zeros':
+        return SignalStream(num, **kw)
+    raise ValueError('Unknown job type: %r' % kind)
+
+
+# 批处理 "fir_sim" 字段中可设置的定点 FIR 参数（输入格式取任务本身的 total_bits / frac_bits）
+FIR_SIM_FIELDS = ('coef_bits', 'coef_frac', 'acc_bits', 'out_bits', 'out_frac', 'rounding', 'overflow',
+                  'integer_coefficients')
+
+
+def job_fixed_fir(job):
+    """
+    FixedPointFIR for a job's "fir_sim" entry, or None. "coefficients" is a file
+    (see load_coefficients) or a list of taps; the input format is the job's Q format.
+    """
+    spec = job.get('fir_sim')
+    if not spec:
+        return None
+    if not job.get('signed', True) or job['type'] == 'multichannel':
+        raise ValueError('fir_sim needs a signed single-channel job: %s' % job.get('name'))
+    coeffs = spec['coefficients']
+    if isinstance(coeffs, str):
+        coeffs = load_coefficients(coeffs)
+    kw = {k: spec[k] for k in FIR_SIM_FIELDS if spec.get(k) is not None}
+    kw.setdefault('out_bits', int(job['total_bits']))
+    kw.setdefault('out_frac', int(job['frac_bits']))
+    return FixedPointFIR(coeffs, in_bits=int(job['total_bits']), in_frac=int(job['frac_bits']), **kw)
+
+
+def fir_output_path(path):
+    """Golden FIR output next to the stimulus: name.bin -> name_FIRout.bin."""
+    root, ext = os.path.splitext(path)
+    return root + '_FIRout' + ext
+
+
+def load_spec(path):
+    """Parse a job / spec file: JSON, or TOML for *.toml (tomllib, or tomli before Python 3.11)."""
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError('Reading TOML needs Python 3.11+ or the tomli package')
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    import json
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_jobs(path):
+    """Read a job list: either a list of jobs or {"defaults": {...}, "jobs": [...]} (JSON or TOML)."""
+    spec = load_spec(path)
+    if isinstance(spec, list):
+        return {}, spec
+    return spec.get('defaults', {}), spec.get('jobs', [])
+
+
+def prepare_jobs(jobs, out_dir, defaults=None, master_seed=0):
+    """Merge defaults, name every job, assign seeds and output paths. Names must be unique."""
+    prepared = []
+    seen = set()
+    for job in jobs:
+        full = dict(BATCH_DEFAULTS)
+        full.update(defaults or {})
+        full.update(job)
+        name = stimulus_name(full)
+        if name in seen:
+            raise ValueError('Duplicate output name in job list: %s' % name)
+        seen.add(name)
+        full['name'] = name
+        if full.get('seed') is None:
+            full['seed'] = job_seed(master_seed, name)
+        full['path'] = os.path.join(out_dir, name + '.' + full['format'])
+        prepared.append(full)
+    return prepared
+
+
+def run_job(job):
+    """
+    generate -> quantize -> export for one prepared job; returns a summary dict.
+
+    With job['fir_sim'] the quantized stimulus is also run through the fixed-point FIR
+    (job_fixed_fir) and the golden output is written to fir_output_path(path).
+    With job['profile'] the summary also carries 'profile' (see StageProfiler.summary).
+    """
+    if job.get('profile'):
+        with profiling(memory=True) as prof:
+            res = run_job(dict(job, profile=False))
+        res['profile'] = prof.summary()
+        return res
+    stream = job_stream(job)
+    fmt = 'bin' if job['format'] == 'bin' else 'hex'
+    layout = job.get('layout', 'interleaved')
+    n = export_quantized_stream(stream, job['path'], fmt, int(job['total_bits']), int(job['frac_bits']),
+                                unsigned=not job.get('signed', True), byteorder=job['byteorder'],
+                                memmap=bool(job.get('memmap', False)), layout=layout)
+    res = {'name': job['name'], 'path': job['path'], 'samples': n, 'seed': job['seed'],
+           'filter_mode': getattr(stream, 'filter_mode', None)}
+    channels = getattr(stream, 'channels', 1)
+    if channels > 1:
+        res['channels'] = channels
+        if layout == 'separate':
+            res['paths'] = channel_paths(job['path'], channels)
+    fir = job_fixed_fir(job)
+    if fir is not None:
+        res['fir_path'] = fir_output_path(job['path'])
+        export_fixed_fir(stream, fir, res['fir_path'], fmt, job['byteorder'])
+        res['fir_overflows'] = {'acc': fir.acc_overflows, 'out': fir.out_overflows}
+    return res
+
+
+def run_batch(jobs, out_dir, defaults=None, workers=1, master_seed=0):
+    """
+    Run every job in a process pool (workers > 1) or inline. Each job only depends on its own
+    parameters and seed, so the output files do not depend on the worker count.
+    Returns the job summaries in job-list order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    prepared = prepare_jobs(jobs, out_dir, defaults, master_seed)
+    if workers is None or workers <= 1 or len(prepared) <= 1:
+        return [run_job(job) for job in prepared]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_job, prepared))
+
+
+# ---------------------------------------------------------------------------
+# Declarative job spec: shared stages scheduled once as a DAG
+# ---------------------------------------------------------------------------
+
+# 规格文件中也可以直接使用 GUI 参数名（build_params 中的标签），读入时换成任务字段
+PARAM_FIELDS = {
+    'Amplitude': 'amplitude', 'Offset': 'offset', 'Frequency (Hz)': 'frequency', 'Phase (rad)': 'phase',
+    'Duty (0-1)': 'duty', 'Mode': 'mode', 'Order': 'order', 'Seed (int)': 'seed',
+    'Sine mode': 'mode', 'Accumulator bits': 'acc_bits', 'LUT address bits': 'lut_bits', 'LUT width': 'lut_width',
+    'Quarter-wave': 'quarter_wave', 'Lowcut (Hz)': 'lowcut', 'Highcut (Hz)': 'highcut', 'FIR order': 'fir_order',
+    'Filter phase': 'filter_phase', 'FIR method': 'fir_method', 'Frequencies (Hz)': 'frequencies',
+    'Tone amplitudes': 'amplitudes', 'Phases (rad)': 'phases', 'Phase mode': 'phase_mode',
+    'Synthesis': 'synthesis', 'Total bits': 'total_bits', 'Fractional bits': 'frac_bits',
+}
+
+# GUI 信号类型名 -> 任务 type
+SIGNAL_TYPES = {'Sine': 'sine', 'Square': 'square', 'Multisine': 'multisine', 'White Noise': 'white_noise',
+                'PRBS': 'prbs'}
+
+# 只影响量化与输出文件的任务字段：不进入 generate 阶段的键，也不参与信号种子的派生
+OUTPUT_FIELDS = ('total_bits', 'frac_bits', 'signed', 'format', 'byteorder', 'memmap', 'layout', 'fir_sim',
+                 'name', 'prefix', 'suffix', 'profile', 'path')
+
+SPEC_FILE_FORMATS = ('bin', 'hex', 'mem', 'csv', 'mat')
+
+
+def spec_fields(entry):
+    """Job fields of a spec entry; GUI names ('Frequency (Hz)', 'White Noise', 'DDS', ...) are translated."""
+    out = {}
+    for key, value in entry.items():
+        field = PARAM_FIELDS.get(key, key)
+        if field == 'type':
+            value = SIGNAL_TYPES.get(value, value)
+        elif field in ('mode', 'fir_method', 'phase_mode', 'synthesis') and isinstance(value, str):
+            value = value.lower()
+        elif field == 'filter_phase' and isinstance(value, str):
+            value = 'linear' if value.lower().startswith('linear') else 'zero'
+        elif field == 'quarter_wave' and isinstance(value, str):
+            value = value.lower() in ('yes', 'true', '1')
+        elif key == 'Seed (int)' and value == 0:
+            # GUI: 0 = automatic
+            value = None
+        out[field] = value
+    return out
+
+
+def _spec_refs(value, table, what):
+    """Entries named by an output: an id, a list of ids, '*' (all) or an inline dict."""
+    if value is None:
+        if what == 'signal':
+            raise ValueError('Spec output without a signal')
+        return [{}]
+    if value == '*':
+        return list(table.values())
+    out = []
+    for ref in (value if isinstance(value, list) else [value]):
+        if isinstance(ref, dict):
+            out.append(ref)
+        elif ref in table:
+            out.append(table[ref])
+        else:
+            raise ValueError('Unknown %s in spec outputs: %r' % (what, ref))
+    return out
+
+
+def _signal_fields(job):
+    return tuple(sorted((k, v) for k, v in job.items() if k not in OUTPUT_FIELDS + ('offset', 'seed')))
+
+
+def expand_spec(spec, out_dir, master_seed=0):
+    """
+    Prepared output jobs of a declarative spec (JSON or TOML, see load_spec):
+
+        {"defaults": {...},
+         "signals": {"id": {job fields}, ...},
+         "fixed_point": {"id": {"total_bits": 24, "frac_bits": 23, "signed": true}, ...},
+         "outputs": [{"signal": "id" | ["id", ...] | "*", "fixed_point": ..., "format": "bin" | [...], ...}]}
+
+    Every output entry fans out to signal x fixed_point x format; its other fields (offset,
+    suffix, byteorder, layout, fir_sim, ...) override the signal's. A signal without a seed
+    gets one derived from the master seed and its generation fields, so all outputs of a
+    signal (and identical signals) share one realization. This differs from prepare_jobs,
+    which derives the seed from the file name (that includes the Q format): with the same
+    master seed, random signals do not reproduce the noise of an equivalent job list.
+    Output paths must be unique.
+    """
+    defaults = spec_fields(spec.get('defaults', {}))
+    signals = spec.get('signals', {})
+    formats = spec.get('fixed_point', {})
+    jobs = []
+    seen = set()
+    for entry in spec.get('outputs', []):
+        extra = spec_fields(entry)
+        sigs = _spec_refs(extra.pop('signal', None), signals, 'signal')
+        fps = _spec_refs(extra.pop('fixed_point', None), formats, 'fixed_point')
+        file_fmts = extra.pop('format', None) or defaults.get('format') or BATCH_DEFAULTS['format']
+        for sig in sigs:
+            for fp in fps:
+                for fmt in (file_fmts if isinstance(file_fmts, list) else [file_fmts]):
+                    if fmt not in SPEC_FILE_FORMATS:
+                        raise ValueError('Unknown output format: %r' % fmt)
+                    job = dict(BATCH_DEFAULTS)
+                    job.update(defaults)
+                    job.update(spec_fields(sig))
+                    job.update(spec_fields(fp))
+                    job.update(extra)
+                    job['format'] = fmt
+                    if job.get('seed') is None:
+                        job['seed'] = job_seed(master_seed, stage_key('signal', _signal_fields(job)))
+                    job['name'] = stimulus_name(job)
+                    job['path'] = os.path.join(out_dir, job['name'] + '.' + fmt)
+                    if job['path'] in seen:
+                        raise ValueError('Duplicate output path in spec: %s' % job['path'])
+                    seen.add(job['path'])
+                    jobs.append(job)
+    return jobs
+
+
+class StageNode:
+    """One stage of a BatchPlan: kernel name, parameters and the keys of the nodes it reads."""
+
+    __slots__ = ('key', 'stage', 'inputs', 'params')
+
+    def __init__(self, key, stage, inputs, params):
+        self.key = key
+        self.stage = stage
+        self.inputs = tuple(inputs)
+        self.params = params
+
+
+# 各阶段在 describe() 中的显示顺序
+PLAN_STAGES = ('design', 'generate', 'offset', 'range', 'quantize', 'fir', 'save')
+
+
+class BatchPlan:
+    """
+    Stage DAG of prepared jobs: design -> generate -> offset -> (range ->) quantize -> save,
+    plus quantize -> fir -> save for "fir_sim". Nodes are keyed with stage_key on their
+    parameters and input nodes, so a firwin design, noise realization, offset or
+    quantization shared by several outputs is a single node that runs once and fans out.
+
+    The kernels are the core functions: design_bandlimit_fir (its taps are handed to the
+    generate stage), the job's SignalStream (the streams behind the generate_* functions),
+    quantize_signed / quantize_unsigned and QuantizedWriter (the writer behind
+    write_quantized / export_quantized_stream), so each file has the same bytes run_job
+    writes for the job, and memory stays at one block per node (see execute). Connected
+    components run in separate worker processes.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+        self.nodes = collections.OrderedDict()
+        self.refs = collections.Counter()
+        self.job_keys = [self._add_job(job) for job in self.jobs]
+
+    def _add(self, stage, inputs, params, used):
+        key = stage_key(stage, tuple(inputs), tuple(sorted(params.items())))
+        if key not in self.nodes:
+            self.nodes[key] = StageNode(key, stage, inputs, params)
+        if key not in used:
+            used.add(key)
+            self.refs[key] += 1
+        return key
+
+    def _add_job(self, job):
+        used = set()
+        keys = {'fir': None}
+        gen = {k: v for k, v in job.items() if k not in OUTPUT_FIELDS}
+        if job['type'] == 'multichannel':
+            # channels inherit the offset (channel_jobs); the generate stage applies it
+            offset = 0.0
+        else:
+            offset = float(gen.pop('offset', 0.0))
+            gen['offset'] = 0.0
+        inputs = ()
+        if job['type'] == 'white_noise':
+            inputs = (self._add('design', (), {
+                'sample_rate': float(job['sample_rate']), 'lowcut': float(job['lowcut']),
+                'highcut': float(job['highcut']), 'fir_order': int(job.get('fir_order', 101))}, used),)
+        keys['generate'] = self._add('generate', inputs, gen, used)
+        off = self._add('offset', (keys['generate'],), {'offset': offset}, used)
+        fmt, path = job['format'], job['path']
+        if fmt in ('csv', 'mat'):
+            if job.get('fir_sim'):
+                raise ValueError('fir_sim needs a .bin / .hex / .mem output: %s' % path)
+            keys['save'] = [self._add('save', (off,), {'path': path, 'format': fmt,
+                                                       'sample_rate': float(job['sample_rate'])}, used)]
+            return keys
+        tb, signed = int(job['total_bits']), bool(job.get('signed', True))
+        if signed:
+            q = self._add('quantize', (off,), {'total_bits': tb, 'frac_bits': int(job['frac_bits']),
+                                               'signed': True}, used)
+        else:
+            rng = self._add('range', (off,), {}, used)
+            q = self._add('quantize', (off, rng), {'total_bits': tb, 'signed': False}, used)
+        layout = job.get('layout', 'interleaved') if job['type'] == 'multichannel' else 'interleaved'
+        memmap = bool(job.get('memmap', False))
+        keys['save'] = [self._add('save', (q,), {'path': path, 'format': fmt, 'total_bits': tb,
+                                                 'byteorder': job['byteorder'], 'layout': layout,
+                                                 'memmap': memmap}, used)]
+        if job.get('fir_sim'):
+            fir = {k: job[k] for k in ('type', 'signed', 'total_bits', 'frac_bits', 'fir_sim')}
+            keys['fir'] = self._add('fir', (q,), fir, used)
+            out_bits = int(job['fir_sim'].get('out_bits') or tb)
+            keys['save'].append(self._add('save', (keys['fir'],), {
+                'path': fir_output_path(path), 'format': fmt, 'total_bits': out_bits,
+                'byteorder': job['byteorder'], 'layout': 'interleaved', 'memmap': memmap}, used))
+        return keys
+
+    def stage_counts(self):
+        """{stage: (nodes, runs without sharing)} -- the second number counts one run per output."""
+        counts = {}
+        for key, node in self.nodes.items():
+            n, runs = counts.get(node.stage, (0, 0))
+            counts[node.stage] = (n + 1, runs + self.refs[key])
+        return counts
+
+    def describe(self):
+        counts = self.stage_counts()
+        text = ', '.join('%s %d/%d' % (s, counts[s][0], counts[s][1]) for s in PLAN_STAGES if s in counts)
+        return '%d outputs in %d groups; stage runs shared/unshared: %s' % (
+            len(self.jobs), len(self.groups()), text)
+
+    def groups(self):
+        """Job indices per connected component of the DAG (outputs that share any stage)."""
+        parent = {}
+
+        def find(k):
+            while k in parent:
+                k = parent[k]
+            return k
+
+        for node in self.nodes.values():
+            for k in node.inputs:
+                a, b = find(node.key), find(k)
+                if a != b:
+                    parent[a] = b
+        out = collections.OrderedDict()
+        for i, keys in enumerate(self.job_keys):
+            out.setdefault(find(keys['generate']), []).append(i)
+        return list(out.values())
+
+    def run(self, workers=1, profile=False):
+        """
+        Run the plan; groups go to a process pool when workers > 1. Returns the job summaries
+        (as run_job) in job order, each with the index of its 'group'. With profile=True every
+        summary carries the StageProfiler summary of its whole group.
+        """
+        for d in set(os.path.dirname(job['path']) for job in self.jobs):
+            if d:
+                os.makedirs(d, exist_ok=True)
+        groups = self.groups()
+        tasks = [([self.jobs[i] for i in idx], profile) for idx in groups]
+        if workers is None or workers <= 1 or len(tasks) <= 1:
+            parts = [run_plan_group(t) for t in tasks]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(run_plan_group, tasks))
+        results = [None] * len(self.jobs)
+        for g, (idx, part) in enumerate(zip(groups, parts)):
+            for i, res in zip(idx, part):
+                res['group'] = g
+                results[i] = res
+        return results
+
+    def execute(self, profile=False):
+        """
+        Run every node once in this process; returns the job summaries in job order.
+
+        Each generate node is one SignalStream read block by block, and every block is pushed
+        through the node's subtree (offset, quantize, fir) into the open output files, so
+        memory stays at one block per node whatever the signal length. Unsigned formats
+        need the range of the whole signal: a subtree with range nodes reads the stream once
+        for them and then replays it, as iter_quantized does.
+        """
+        if profile:
+            with profiling(memory=True) as prof:
+                results = self.execute()
+            summary = prof.summary()
+            for res in results:
+                res['profile'] = summary
+            return results
+        consumers = collections.defaultdict(list)
+        for node in self.nodes.values():
+            for k in node.inputs:
+                consumers[k].append(node.key)
+        info, taps = {}, {}
+        for node in list(self.nodes.values()):
+            if node.stage != 'generate':
+                continue
+            for k in node.inputs:
+                if k not in taps:
+                    p = self.nodes[k].params
+                    taps[k] = design_bandlimit_fir(p['sample_rate'], p['lowcut'], p['highcut'], p['fir_order'])
+            self._stream_generate(node, taps[node.inputs[0]] if node.inputs else 'design', consumers, info)
+        return [self._summary(job, keys, info) for job, keys in zip(self.jobs, self.job_keys)]
+
+    def _subtree(self, key, consumers):
+        """Nodes fed (directly or not) by ``key``, in insertion order, which is topological."""
+        seen, todo = set(), [key]
+        while todo:
+            for k in consumers[todo.pop()]:
+                if k not in seen:
+                    seen.add(k)
+                    todo.append(k)
+        return [node for k, node in self.nodes.items() if k in seen]
+
+    def _stream_generate(self, gen, taps, consumers, info):
+        stream = job_stream(gen.params, taps=taps)
+        channels = getattr(stream, 'channels', 1)
+        info[gen.key] = {'filter_mode': getattr(stream, 'filter_mode', None), 'channels': channels}
+        sub = self._subtree(gen.key, consumers)
+        state = {}
+        ranges = [node for node in sub if node.stage == 'range']
+        if ranges:
+            for r in ranges:
+                state[r.key] = (np.inf, -np.inf)
+            for blk in stream:
+                for r in ranges:
+                    vals = self._run_block(self.nodes[r.inputs[0]], [blk], state)
+                    if vals.size:
+                        lo, hi = state[r.key]
+                        state[r.key] = (np.minimum(lo, vals.min(axis=0)), np.maximum(hi, vals.max(axis=0)))
+            for r in ranges:
+                # max(x - vmin) == max(x) - vmin, float subtraction is monotonic
+                lo, hi = state[r.key]
+                state[r.key] = (lo, hi - lo)
+            stream.reset()
+        sinks = [node for node in sub if node.stage == 'save']
+        try:
+            for node in sub:
+                if node.stage == 'fir':
+                    state[node.key] = job_fixed_fir(node.params)
+                elif node.stage == 'save':
+                    state[node.key] = OutputWriter(node.params, len(stream), channels)
+            for blk in stream:
+                vals = {gen.key: blk}
+                for node in sub:
+                    vals[node.key] = self._run_block(node, [vals[k] for k in node.inputs], state)
+        except BaseException:
+            for node in sinks:
+                if node.key in state:
+                    state[node.key].abort()
+            raise
+        for node in sinks:
+            info[node.key] = state[node.key].close()
+        for node in sub:
+            if node.stage == 'fir':
+                fir = state[node.key]
+                info[node.key] = {'acc': fir.acc_overflows, 'out': fir.out_overflows}
+
+    @staticmethod
+    def _run_block(node, args, state):
+        p = node.params
+        if node.stage == 'offset':
+            return args[0] if p['offset'] == 0.0 else args[0] + p['offset']
+        if node.stage == 'range':
+            return state[node.key]
+        if node.stage == 'quantize':
+            vals, tb = args[0], p['total_bits']
+            if p['signed']:
+                return quantize_signed(vals, tb, p['frac_bits'], compact=True)
+            lo, span = args[1]
+            if vals.ndim == 1:
+                return quantize_unsigned(vals, tb, vmin=lo, span=span, compact=True)
+            u = np.empty(vals.shape, dtype=uint_dtype(tb))
+            for c in range(vals.shape[1]):
+                u[:, c] = quantize_unsigned(vals[:, c], tb, vmin=lo[c], span=span[c], compact=True)
+            return u
+        if node.stage == 'fir':
+            return state[node.key].process_codes(args[0])
+        if node.stage == 'save':
+            state[node.key].write(args[0])
+            return None
+        raise ValueError('Unknown stage: %r' % node.stage)
+
+    def _summary(self, job, keys, info):
+        gen = info[keys['generate']]
+        res = {'name': job['name'], 'path': job['path'], 'samples': info[keys['save'][0]], 'seed': job['seed'],
+               'filter_mode': gen['filter_mode']}
+        if gen['channels'] > 1:
+            res['channels'] = gen['channels']
+            if self.nodes[keys['save'][0]].params.get('layout') == 'separate':
+                res['paths'] = channel_paths(job['path'], gen['channels'])
+        if keys['fir'] is not None:
+            res['fir_path'] = fir_output_path(job['path'])
+            res['fir_overflows'] = info[keys['fir']]
+        return res
+
+
+class OutputWriter:
+    """
+    One save node of a BatchPlan, fed block by block: codes go to .bin / .hex / .mem through
+    QuantizedWriter (2-D blocks interleaved, or one file per channel with layout
+    'separate'; pre-sized np.memmap files with memmap=True), float values to .csv (appended
+    per block) or .mat, which needs the whole array and is written on close.
+    ``count`` is the stream length per channel; close() returns the samples per channel.
+    """
+
+    def __init__(self, params, count, channels=1):
+        self.format = params['format']
+        self.path = params['path']
+        self.params = params
+        self.samples = 0
+        self._writers = []
+        self._parts = []
+        self._f = None
+        if self.format == 'csv':
+            self._f = open(self.path, 'w')
+        elif self.format != 'mat':
+            tb, bo = params['total_bits'], params['byteorder']
+            memmap = params.get('memmap', False)
+            if channels > 1 and params.get('layout') == 'separate':
+                self._writers = [QuantizedWriter(p, self.format, tb, bo, count if memmap else None)
+                                 for p in channel_paths(self.path, channels)]
+            else:
+                self._writers = [QuantizedWriter(self.path, self.format, tb, bo,
+                                                 count * channels if memmap else None)]
+
+    def write(self, block):
+        if self.format == 'csv':
+            np.savetxt(self._f, block, delimiter=',', fmt='%.18e')
+        elif self.format == 'mat':
+            self._parts.append(block)
+        elif len(self._writers) > 1:
+            for c, w in enumerate(self._writers):
+                w.write(np.ascontiguousarray(block[:, c]))
+        else:
+            self._writers[0].write(block)
+        self.samples += len(block)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self.format == 'mat':
+            save_raw_mat(np.concatenate(self._parts) if self._parts else np.zeros(0),
+                         self.params['sample_rate'], self.path)
+            self._parts = []
+        for w in self._writers:
+            w.close()
+        return self.samples
+
+    def abort(self):
+        """Close the files without finishing them (after an error)."""
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        for w in self._writers:
+            w.abort()
+        self._parts = []
+
+
+def run_plan_group(task):
+    """Process-pool entry point: (jobs, profile) of one BatchPlan group -> summaries."""
+    jobs, profile = task
+    return BatchPlan(jobs).execute(profile)
+
+
+def run_spec(spec, out_dir, workers=1, master_seed=0, profile=False):
+    """expand_spec + BatchPlan.run; returns (plan, job summaries)."""
+    plan = BatchPlan(expand_spec(spec, out_dir, master_seed))
+    return plan, plan.run(workers, profile)
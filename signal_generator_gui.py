@@ -1,238 +1,47 @@
-import sys
-import math
-import numpy as np
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import secrets
+"""
+Tk GUI and command line entry point of the FPGA stimulus generator.
+
+Generators, quantizers, codecs, the stage-cached pipeline and batch jobs live in
+signal_generator_core (numpy only) and are re-exported here, so scripts importing this
+module keep working. tkinter is only needed for the window (``--batch`` runs without it)
+and matplotlib is imported when the window is created.
+"""
 import os
+import json
+import argparse
+import secrets
+import threading
+import queue
+import time
+
+import numpy as np
 
 try:
-    from matplotlib.figure import Figure
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-except Exception:
-    Figure = None
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+except ImportError:
+    # 没有 Tk 的环境（如构建服务器）仍可使用 --batch
+    tk = ttk = filedialog = messagebox = None
+
+from signal_generator_core import *  # noqa: F401,F403 (re-exported for existing scripts)
+
+# matplotlib（TkAgg）在创建主窗口时才导入；导入失败时预览不可用
+Figure = FigureCanvasTkAgg = NavigationToolbar2Tk = None
 
 # Note: widgets (RectangleSelector) will be imported lazily when setting up the canvas
 
 
-def generate_sine(num_samples, amplitude, frequency, phase, sample_rate):
-    t = np.arange(num_samples) / float(sample_rate)
-    return amplitude * np.sin(2 * np.pi * frequency * t + phase)
-
-
-def generate_square(num_samples, amplitude, frequency, duty, sample_rate):
-    t = np.arange(num_samples) / float(sample_rate)
-    cycle = (t * frequency) % 1.0
-    return amplitude * (np.where(cycle < duty, 1.0, -1.0))
-
-
-def generate_prbs(num_samples, amplitude, seed=None, order=None, mode='lfsr'):
-    """
-    生成 PRBS 序列。
-
-    参数:
-      - num_samples: 采样点数
-      - amplitude: ±振幅映射到 bit 为 0/1 映射为 -amp/+amp
-      - seed: 整数种子（作为 LFSR 的初始状态或 RNG 种子）
-      - order: LFSR 阶（如 7, 15, 31）；如果为 None，则回退到 RNG 模式
-      - mode: 'lfsr' 或 'rng'，优先使用 lfsr 当 order 有效
-
-    返回浮点数组（长度 num_samples），值为 ±amplitude
-    """
-    # 支持的 LFSR taps（zero-based bit indices）—常用的最大长度多项式 taps
-    # Expanded taps table (zero-based bit indices). These are common maximal-length taps.
-    taps_table = {
-        5:  [4, 1],    # x^5 + x^2 + 1
-        7:  [6, 5],    # x^7 + x^6 + 1
-        9:  [8, 4],    # x^9 + x^5 + 1
-        11: [10, 8],   # x^11 + x^9 + 1
-        13: [12, 11, 10, 7],  # x^13 + x^12 + x^11 + x^8 + 1
-        15: [14, 13],  # x^15 + x^14 + 1
-        17: [16, 13],  # x^17 + x^14 + 1
-        19: [18, 5],   # x^19 + x^6 + 1
-        23: [22, 17],  # x^23 + x^18 + 1
-        29: [28, 1],   # x^29 + x^2 + 1
-        31: [30, 27],  # x^31 + x^28 + 1
-    }
-
-    # normalize mode
-    mode = (mode or '').lower()
-    use_lfsr = (mode == 'lfsr') and (order in taps_table)
-    if use_lfsr:
-        taps = taps_table[order]
-        # validate taps
-        if any((t < 0 or t >= order) for t in taps):
-            # invalid taps for this order; fall back to RNG
-            use_lfsr = False
-        else:
-            # 为提升速度，预计算 taps 的位掩码并用 bit_count 计算奇偶性，避免循环内多次索引
-            mask = 0
-            for t in taps:
-                mask |= (1 << t)
-            # bit_count helper (fallback for older Pythons)
-            if hasattr(int, 'bit_count'):
-                def _bitcount(x):
-                    return x.bit_count()
-            else:
-                def _bitcount(x):
-                    return bin(x).count('1')
-        # 初始化寄存器：使用 seed 的低 order 位，若为 None 或 0 则使用全 1（避免全 0 锁死）
-        if seed is None or int(seed) == 0:
-            reg = (1 << order) - 1
-        else:
-            reg = int(seed) & ((1 << order) - 1)
-            if reg == 0:
-                reg = 1
-
-        out = np.empty(num_samples, dtype=np.int8)
-        for i in range(num_samples):
-            bit = reg & 1
-            out[i] = bit
-            # 反馈位计算：使用位掩码并计算位计数的奇偶性
-            fb = (_bitcount(reg & mask) & 1)
-            # 右移并在最高位写入反馈
-            reg = (reg >> 1) | (fb << (order - 1))
-            # 防止意外进入全零状态
-            if reg == 0:
-                reg = (1 << order) - 1
-
-        return amplitude * (2 * out - 1)
-
-    # 回退到 RNG 模式（与之前实现兼容）
-    rng = np.random.default_rng(seed)
-    bits = rng.integers(0, 2, size=num_samples)
-    return amplitude * (2 * bits - 1)
-
-
-def generate_white_noise(num_samples, amplitude, sample_rate, lowcut, highcut, fir_order):
-    """
-    Generate band-limited white Gaussian noise. Try to use scipy.signal.firwin + lfilter
-    (or filtfilt if available). If scipy is not available or filter design fails, fall back
-    to raw Gaussian noise.
-
-    lowcut, highcut in Hz. If lowcut <= 0 and highcut >= fs/2 -> return raw noise.
-    """
-    rng = np.random.default_rng()
-    x = amplitude * rng.standard_normal(num_samples)
-    fs = float(sample_rate)
-    # sanitize
-    lowf = max(0.0, float(lowcut))
-    highf = float(highcut)
-    nyq = fs / 2.0
-    if highf <= 0 or highf <= lowf:
-        return x
-    if lowf <= 0 and highf >= nyq - 1e-9:
-        return x
-    # try to design FIR via scipy
-    try:
-        from scipy.signal import firwin, lfilter, filtfilt
-        use_filtfilt = True
-    except Exception:
-        try:
-            from scipy.signal import firwin, lfilter
-            filtfilt = None
-            use_filtfilt = False
-        except Exception:
-            # scipy not available
-            return x
-
-    numtaps = max(3, int(round(fir_order)))
-    # ensure numtaps is odd for Type I linear phase
-    if numtaps % 2 == 0:
-        numtaps += 1
-
-    try:
-        if lowf <= 0:
-            # lowpass
-            cutoff = min(max(highf / nyq, 1e-6), 0.9999)
-            b = firwin(numtaps, cutoff)
-        elif highf >= nyq - 1e-9:
-            # highpass
-            cutoff = min(max(lowf / nyq, 1e-6), 0.9999)
-            b = firwin(numtaps, cutoff, pass_zero=False)
-        else:
-            # bandpass
-            wn = [max(lowf/nyq, 1e-6), min(highf/nyq, 0.9999)]
-            if wn[1] <= wn[0]:
-                return x
-            b = firwin(numtaps, wn, pass_zero=False)
-        # apply filter (use filtfilt if available to remove phase)
-        if 'filtfilt' in globals() and filtfilt is not None:
-            y = filtfilt(b, 1.0, x)
-        else:
-            y = lfilter(b, 1.0, x)
-        return y
-    except Exception:
-        return x
-
-
-def float_to_signed_twos(value, total_bits):
-    mask = (1 << total_bits) - 1
-    return int(value) & mask
-
-
-def quantize_signed(values, total_bits, frac_bits):
-    scale = 2 ** frac_bits
-    max_int = 2 ** (total_bits - 1) - 1
-    min_int = -2 ** (total_bits - 1)
-    ints = np.round(values * scale).astype(np.int64)
-    ints = np.clip(ints, min_int, max_int)
-    # convert to unsigned representation (two's complement) for storage
-    mask = (1 << total_bits) - 1
-    uints = (ints & mask).astype(np.uint64)
-    return uints
-
-
-def quantize_unsigned(values, total_bits):
-    # Shift to non-negative range and scale to full range
-    vmin = values.min()
-    shifted = values - vmin
-    vmax = shifted.max()
-    if vmax == 0:
-        return np.zeros_like(shifted, dtype=np.uint64)
-    scale = (2 ** total_bits - 1) / float(vmax)
-    ints = np.round(shifted * scale).astype(np.uint64)
-    return ints
-
-
-def save_hex(lines, path):
-    with open(path, 'w') as f:
-        for v in lines:
-            f.write(v + '\n')
-
-
-def save_bin(uints, total_bits, path):
-    bytes_per = (total_bits + 7) // 8
-    with open(path, 'wb') as f:
-        for v in uints:
-            f.write(int(v).to_bytes(bytes_per, byteorder='big'))
-
-
-def save_raw_csv(values, path):
-    # Save floating point values as one value per line CSV
-    try:
-        np.savetxt(path, np.asarray(values), delimiter=',', fmt='%.18e')
-    except Exception as e:
-        raise
-
-
-def save_raw_mat(values, sample_rate, path):
-    # Try to use scipy.io.savemat; if unavailable, fallback to numpy savez
-    try:
-        from scipy import io as spio
-        spio.savemat(path, {'samples': np.asarray(values), 'sample_rate': float(sample_rate)})
-    except Exception:
-        # fallback to npz
+def _import_matplotlib():
+    """Import the TkAgg figure classes on first use; False when matplotlib is not available."""
+    global Figure, FigureCanvasTkAgg, NavigationToolbar2Tk
+    if Figure is None:
         try:
-            np.savez(path, samples=np.asarray(values), sample_rate=float(sample_rate))
+            from matplotlib.figure import Figure as _Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
         except Exception:
-            raise
-
-
-def make_hex_lines(uints, total_bits):
-    hex_digits = (total_bits + 3) // 4
-    fmt = '{:0' + str(hex_digits) + 'X}'
-    return [fmt.format(int(v)) for v in uints]
+            return False
+        Figure = _Figure
+    return True
 
 
 class SignalGeneratorApp:
@@ -250,7 +59,7 @@ class SignalGeneratorApp:
         ttk.Label(top, text='Signal:').pack(side='left')
         self.sig_var = tk.StringVar(value='Sine')
         self.sig_cb = ttk.Combobox(top, textvariable=self.sig_var, state='readonly', width=16,
-                                   values=['Sine', 'Square', 'White Noise', 'PRBS'])
+                                   values=['Sine', 'Square', 'Multisine', 'White Noise', 'PRBS'])
         self.sig_cb.pack(side='left', padx=6)
         self.sig_cb.bind('<<ComboboxSelected>>', lambda e: self.build_params())
 
@@ -308,11 +117,30 @@ class SignalGeneratorApp:
         # 最大绘图点数（用来限制在高采样/大量样本时的绘图开销）
         self.max_plot_points = 5000
 
-        # Preview canvas
-        preview_frame = ttk.Frame(main)
-        preview_frame.pack(fill='both', expand=True)
-
-        if Figure is not None:
+        # Channels: snapshots of the settings above, generated with a common sample rate and
+        # length and exported together (interleaved or one file per channel)
+        chan_frame = ttk.LabelFrame(main, text='Channels')
+        chan_frame.pack(fill='x', pady=(8, 0))
+        self.channels = []
+        self.channel_list = tk.Listbox(chan_frame, height=3, exportselection=False)
+        self.channel_list.pack(side='left', fill='x', expand=True, padx=6, pady=4)
+        chan_btns = ttk.Frame(chan_frame)
+        chan_btns.pack(side='left', padx=6)
+        for text, cmd in (('Add current', self.add_channel), ('Update', self.update_channel),
+                          ('Load', self.load_channel), ('Remove', self.remove_channel)):
+            ttk.Button(chan_btns, text=text, command=cmd).pack(side='left', padx=2)
+        self.preview_channels_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(chan_btns, text='Preview all', variable=self.preview_channels_var).pack(side='left', padx=6)
+
+        # Preview canvas (Time tab) and Welch PSD (Spectrum tab)
+        self.view_tabs = ttk.Notebook(main)
+        self.view_tabs.pack(fill='both', expand=True)
+        preview_frame = ttk.Frame(self.view_tabs)
+        self.view_tabs.add(preview_frame, text='Time')
+        spectrum_frame = ttk.Frame(self.view_tabs)
+        self.view_tabs.add(spectrum_frame, text='Spectrum')
+
+        if _import_matplotlib():
             self.fig = Figure(figsize=(6, 2.5), dpi=100)
             self.ax = self.fig.add_subplot(111)
             self.canvas = FigureCanvasTkAgg(self.fig, master=preview_frame)
@@ -344,14 +172,106 @@ class SignalGeneratorApp:
                 self._rs = None
         else:
             ttk.Label(preview_frame, text='matplotlib not available: preview disabled').pack()
+        self._build_spectrum_tab(spectrum_frame)
 
         # Buttons
         btns = ttk.Frame(main)
         btns.pack(fill='x', pady=6)
 
-        ttk.Button(btns, text='Generate & Preview', command=self.on_preview).pack(side='left', padx=6)
-        ttk.Button(btns, text='Export...', command=self.on_export).pack(side='left', padx=6)
-        ttk.Button(btns, text='Import...', command=self.on_import).pack(side='left')
+        self.preview_btn = ttk.Button(btns, text='Generate & Preview', command=self.on_preview)
+        self.preview_btn.pack(side='left', padx=6)
+        self.export_btn = ttk.Button(btns, text='Export...', command=self.on_export)
+        self.export_btn.pack(side='left', padx=6)
+        self.import_btn = ttk.Button(btns, text='Import...', command=self.on_import)
+        self.import_btn.pack(side='left')
+        self.fir_btn = ttk.Button(btns, text='FIR sim...', command=self.on_fir_sim)
+        self.fir_btn.pack(side='left', padx=6)
+        self.adapt_btn = ttk.Button(btns, text='Adaptive filter...', command=self.on_adaptive)
+        self.adapt_btn.pack(side='left')
+        # disabled while a background job runs
+        self._job_buttons = (self.preview_btn, self.export_btn, self.import_btn, self.fir_btn, self.adapt_btn,
+                             self.psd_btn)
+
+        # background job progress (preview/export/import run in a worker thread)
+        self.cancel_btn = ttk.Button(btns, text='Cancel', command=self.on_cancel, state='disabled')
+        self.cancel_btn.pack(side='right', padx=6)
+        self.progress = ttk.Progressbar(btns, mode='determinate', maximum=1.0, length=160)
+        self.progress.pack(side='right', padx=6)
+        self.job_status_var = tk.StringVar(value='')
+        ttk.Label(btns, textvariable=self.job_status_var).pack(side='right')
+        self._job = None
+        # last settings of the FIR sim dialog
+        self.fir_settings = {'coefficients': '', 'coef_bits': 18, 'coef_frac': 17, 'acc_bits': 48,
+                             'rounding': 'round', 'overflow': 'saturate', 'golden': '', 'byteorder': 'big'}
+
+        # status bar: per-stage time / throughput / peak memory of the last job
+        status = ttk.Frame(main, relief='sunken', padding=(4, 1))
+        status.pack(fill='x', side='bottom')
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(status, text='Profile stages', variable=self.profile_var).pack(side='left')
+        self.stats_var = tk.StringVar(value='')
+        ttk.Label(status, textvariable=self.stats_var).pack(side='left', padx=6)
+
+        # generate -> offset -> quantize -> reconstruct, cached per stage
+        self.pipeline = SignalPipeline()
+        self._auto_seeds = {}
+        self._pyramids = {}
+        # last imported file (values, path, sample rate): a reference or desired signal for the
+        # adaptive filter
+        self.imported = None
+        # d and e of the last adaptive filter run, for the Spectrum tab
+        self.adaptive_result = None
+        self.adapt_settings = {'algorithm': 'NLMS', 'taps': 512, 'mu': 0.1, 'block_size': 512, 'domain': 'Frequency (FFT)',
+                               'primary': '', 'secondary': '', 'secondary_estimate': '', 'save': ''}
+
+    def _build_spectrum_tab(self, frame):
+        """Controls and figure of the Spectrum tab (Welch PSD, see on_psd)."""
+        ctl = ttk.Frame(frame)
+        ctl.pack(fill='x', pady=2)
+        ttk.Label(ctl, text='Source:').pack(side='left')
+        self.psd_source_var = tk.StringVar(value='Current signal')
+        self.psd_source_cb = ttk.Combobox(ctl, textvariable=self.psd_source_var, width=16, state='readonly',
+                                          values=['Current signal'], postcommand=self._refresh_psd_sources)
+        self.psd_source_cb.pack(side='left', padx=(2, 8))
+        # segment length / overlap / window as pwelch in timeNpsdAnalysis.m (WDLEN = 2^13, 50 %, hamming)
+        ttk.Label(ctl, text='Segment:').pack(side='left')
+        self.psd_nperseg_var = tk.IntVar(value=8192)
+        ttk.Combobox(ctl, textvariable=self.psd_nperseg_var, width=7,
+                     values=[2 ** k for k in range(8, 17)]).pack(side='left', padx=(2, 8))
+        ttk.Label(ctl, text='Overlap %:').pack(side='left')
+        self.psd_overlap_var = tk.DoubleVar(value=50.0)
+        ttk.Entry(ctl, textvariable=self.psd_overlap_var, width=5).pack(side='left', padx=(2, 8))
+        ttk.Label(ctl, text='Window:').pack(side='left')
+        self.psd_window_var = tk.StringVar(value='hamming')
+        ttk.Combobox(ctl, textvariable=self.psd_window_var, width=9, state='readonly',
+                     values=list(WELCH_WINDOWS)).pack(side='left', padx=(2, 8))
+        # 0 = up to Nyquist
+        ttk.Label(ctl, text='Max freq (Hz):').pack(side='left')
+        self.psd_fmax_var = tk.DoubleVar(value=5000.0)
+        ttk.Entry(ctl, textvariable=self.psd_fmax_var, width=7).pack(side='left', padx=(2, 8))
+        self.psd_btn = ttk.Button(ctl, text='Compute PSD', command=self.on_psd)
+        self.psd_btn.pack(side='left', padx=6)
+        self.psd_stats_var = tk.StringVar(value='')
+        ttk.Label(frame, textvariable=self.psd_stats_var).pack(fill='x', padx=4)
+        if Figure is not None:
+            self.psd_fig = Figure(figsize=(6, 2.5), dpi=100)
+            self.psd_ax = self.psd_fig.add_subplot(111)
+            self.psd_canvas = FigureCanvasTkAgg(self.psd_fig, master=frame)
+            self.psd_canvas.get_tk_widget().pack(fill='both', expand=True)
+            try:
+                toolbar = NavigationToolbar2Tk(self.psd_canvas, frame)
+                toolbar.update()
+                toolbar.pack()
+            except Exception:
+                pass
+
+    def _refresh_psd_sources(self):
+        values = ['Current signal']
+        if self.imported:
+            values.append('Imported file')
+        if self.adaptive_result:
+            values.append('Adaptive filter')
+        self.psd_source_cb.config(values=values)
 
     def clear_param_widgets(self):
         for w in self.param_frame.winfo_children():
@@ -371,10 +291,23 @@ class SignalGeneratorApp:
         sig = self.sig_var.get()
     # Add White Noise parameters similar to MATLAB GUI
         if sig == 'Sine':
+            # Float: np.sin；DDS: 相位累加器 + 正弦查找表（与 FPGA NCO 逐位一致）
+            self._add_param('Sine mode', tk.StringVar(value=saved.get('Sine mode', 'Float')), readonly=True,
+                            widget='combobox', values=['Float', 'DDS'], column='left')
+            try:
+                self.params['Sine mode'].trace_add('write', lambda *a: self.build_params())
+            except Exception:
+                pass
             self._add_param('Amplitude', tk.DoubleVar(value=saved.get('Amplitude', 1.0)), column='left')
             self._add_param('Offset', tk.DoubleVar(value=saved.get('Offset', 0.0)), column='left')
             self._add_param('Frequency (Hz)', tk.DoubleVar(value=saved.get('Frequency (Hz)', 1000.0)), column='left')
             self._add_param('Phase (rad)', tk.DoubleVar(value=saved.get('Phase (rad)', 0.0)), column='left')
+            if self.params['Sine mode'].get() == 'DDS':
+                self._add_param('Accumulator bits', tk.IntVar(value=saved.get('Accumulator bits', 32)), column='left')
+                self._add_param('LUT address bits', tk.IntVar(value=saved.get('LUT address bits', 10)), column='left')
+                self._add_param('LUT width', tk.IntVar(value=saved.get('LUT width', 16)), column='left')
+                self._add_param('Quarter-wave', tk.StringVar(value=saved.get('Quarter-wave', 'Yes')), readonly=True,
+                                widget='combobox', values=['Yes', 'No'], column='left')
         elif sig == 'Square':
             self._add_param('Amplitude', tk.DoubleVar(value=saved.get('Amplitude', 1.0)), column='left')
             self._add_param('Offset', tk.DoubleVar(value=saved.get('Offset', 0.0)), column='left')
@@ -415,6 +348,19 @@ class SignalGeneratorApp:
                 # RNG 模式仅显示可选的种子
                 self._add_param('Seed (int)', tk.IntVar(value=saved.get('Seed (int)', default_seed)), column='left')
 
+        elif sig == 'Multisine':
+            # 多音信号：频率/相对幅度/相位均为逗号分隔列表；相位留空时按 Phase mode 生成
+            self._add_param('Amplitude', tk.DoubleVar(value=saved.get('Amplitude', 1.0)), column='left')
+            self._add_param('Offset', tk.DoubleVar(value=saved.get('Offset', 0.0)), column='left')
+            self._add_param('Frequencies (Hz)', tk.StringVar(value=saved.get('Frequencies (Hz)', '200, 400, 600')), column='left')
+            self._add_param('Tone amplitudes', tk.StringVar(value=saved.get('Tone amplitudes', '1')), column='left')
+            self._add_param('Phases (rad)', tk.StringVar(value=saved.get('Phases (rad)', '')), column='left')
+            self._add_param('Phase mode', tk.StringVar(value=saved.get('Phase mode', 'Schroeder')), readonly=True,
+                            widget='combobox', values=['Schroeder', 'Random', 'Zero'], column='left')
+            self._add_param('Seed (int)', tk.IntVar(value=saved.get('Seed (int)', 0)), column='left')
+            self._add_param('Synthesis', tk.StringVar(value=saved.get('Synthesis', 'Auto')), readonly=True,
+                            widget='combobox', values=['Auto', 'IFFT', 'Bank', 'Direct'], column='left')
+
         elif sig == 'White Noise':
             # Band-limited white Gaussian noise
             self._add_param('Amplitude', tk.DoubleVar(value=saved.get('Amplitude', 1.0)), column='left')
@@ -424,6 +370,10 @@ class SignalGeneratorApp:
             self._add_param('Highcut (Hz)', tk.DoubleVar(value=saved.get('Highcut (Hz)', 24000.0)), column='left')
             # FIR order (num taps)
             self._add_param('FIR order', tk.IntVar(value=saved.get('FIR order', 101)), column='left')
+            self._add_param('Filter phase', tk.StringVar(value=saved.get('Filter phase', 'Zero-phase')), readonly=True,
+                            widget='combobox', values=['Zero-phase', 'Linear-phase'], column='left')
+            self._add_param('FIR method', tk.StringVar(value=saved.get('FIR method', 'Auto')), readonly=True,
+                            widget='combobox', values=['Auto', 'Direct', 'FFT'], column='left')
 
         # Total bits / Fractional bits 可编辑（下拉只选择 Signed/Unsigned，不包含位宽细节）
         self._add_param('Total bits', tk.IntVar(value=saved.get('Total bits', 24)), column='right')
@@ -475,111 +425,372 @@ class SignalGeneratorApp:
             # 容错：不做任何改变
             pass
 
-    def make_signal(self):
+    def _start_job(self, title, work, done):
+        """Run work(report) in a worker thread; done(result) runs on the Tk thread afterwards.
+
+        report(fraction) updates the progress bar and raises JobCancelled once Cancel was
+        pressed. Messages come back through a queue polled with root.after, so no Tk call is
+        made from the worker. Returns False (and starts nothing) if a job is already running.
+        With 'Profile stages' checked the job runs under profiling() and the stage summary is
+        shown in the status bar.
+        """
+        if self._job is not None:
+            messagebox.showinfo(title, '%s is still running; wait for it or press Cancel.' % self._job['title'])
+            return False
+        cancel = threading.Event()
+        q = queue.Queue()
+
+        def report(fraction):
+            if cancel.is_set():
+                raise JobCancelled()
+            q.put(('progress', fraction))
+
+        profile_var = getattr(self, 'profile_var', None)
+        profile = bool(profile_var.get()) if profile_var is not None else False
+
+        def run():
+            try:
+                if profile:
+                    with profiling(memory=True) as prof:
+                        result = work(report)
+                    q.put(('stats', prof.summary()))
+                    q.put(('done', result))
+                else:
+                    q.put(('done', work(report)))
+            except JobCancelled:
+                q.put(('cancelled', None))
+            except Exception as e:
+                q.put(('error', e))
+
+        self._job = {'title': title, 'cancel': cancel, 'queue': q, 'done': done}
+        for b in self._job_buttons:
+            b.config(state='disabled')
+        self.cancel_btn.config(state='normal')
+        self.progress['value'] = 0.0
+        self.job_status_var.set(title + '...')
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(50, self._poll_job)
+        return True
+
+    def _poll_job(self):
+        job = self._job
+        if job is None:
+            return
+        finished = None
+        try:
+            while True:
+                kind, payload = job['queue'].get_nowait()
+                if kind == 'progress':
+                    self.progress['value'] = payload
+                elif kind == 'stats':
+                    self.stats_var.set('%s: %s' % (job['title'], format_stage_stats(payload)))
+                else:
+                    finished = (kind, payload)
+                    break
+        except queue.Empty:
+            pass
+        if finished is None:
+            self.root.after(50, self._poll_job)
+            return
+        self._job = None
+        for b in self._job_buttons:
+            b.config(state='normal')
+        self.cancel_btn.config(state='disabled')
+        kind, payload = finished
+        if kind == 'done':
+            self.progress['value'] = 1.0
+            self.job_status_var.set('')
+            try:
+                job['done'](payload)
+            except Exception as e:
+                messagebox.showerror(job['title'] + ' error', str(e))
+        elif kind == 'cancelled':
+            self.progress['value'] = 0.0
+            self.job_status_var.set(job['title'] + ' cancelled')
+        else:
+            self.progress['value'] = 0.0
+            self.job_status_var.set('')
+            messagebox.showerror(job['title'] + ' error', str(payload))
+
+    def on_cancel(self):
+        if self._job is not None:
+            self._job['cancel'].set()
+            self.job_status_var.set('Cancelling...')
+
+    def signal_spec(self):
+        """
+        Current settings as a job dict for job_stream() / SignalPipeline (offset included).
+
+        Random signals without a user seed get one seed per parameter set, drawn once and
+        remembered, so Preview and Export of the same settings produce the same realization.
+        """
         sig = self.sig_var.get()
         num = int(self.num_samples_var.get())
         sr = float(self.sample_rate_var.get())
         amp = float(self.params['Amplitude'].get())
         # read optional offset parameter (default 0.0)
         offset = float(self.params['Offset'].get()) if 'Offset' in self.params else 0.0
+        spec = dict(samples=num, sample_rate=sr, amplitude=amp, offset=offset)
         if sig == 'Sine':
-            freq = float(self.params['Frequency (Hz)'].get())
-            phase = float(self.params['Phase (rad)'].get())
-            vals = generate_sine(num, amp, freq, phase, sr)
+            spec.update(type='sine', frequency=float(self.params['Frequency (Hz)'].get()),
+                        phase=float(self.params['Phase (rad)'].get()))
+            if 'Sine mode' in self.params and self.params['Sine mode'].get() == 'DDS':
+                spec.update(mode='dds', acc_bits=int(self.params['Accumulator bits'].get()),
+                            lut_bits=int(self.params['LUT address bits'].get()),
+                            lut_width=int(self.params['LUT width'].get()),
+                            quarter_wave=self.params['Quarter-wave'].get() == 'Yes')
         elif sig == 'Square':
-            freq = float(self.params['Frequency (Hz)'].get())
-            duty = float(self.params['Duty (0-1)'].get())
-            vals = generate_square(num, amp, freq, duty, sr)
+            spec.update(type='square', frequency=float(self.params['Frequency (Hz)'].get()),
+                        duty=float(self.params['Duty (0-1)'].get()))
         elif sig == 'PRBS':
             seed = int(self.params['Seed (int)'].get())
-            if seed == 0:
-                seed = None
             order = int(self.params.get('Order', tk.IntVar(value=13)).get()) if 'Order' in self.params else None
             mode = self.params.get('Mode', tk.StringVar(value='LFSR')).get() if 'Mode' in self.params else 'LFSR'
-            vals = generate_prbs(num, amp, seed, order, mode=mode.lower())
-        else:
-            vals = np.zeros(num)
-
-        if sig == 'White Noise':
-            # For white noise we've already generated vals above as zeros; replace with generated noise
+            spec.update(type='prbs', order=order, mode=mode.lower(), seed=seed if seed != 0 else None)
+            if spec['seed'] is None and (spec['mode'] != 'lfsr' or order not in LFSR_TAPS):
+                spec['seed'] = self._auto_seed(spec)
+        elif sig == 'Multisine':
+            phases = parse_float_list(self.params['Phases (rad)'].get())
+            spec.update(type='multisine',
+                        frequencies=tuple(parse_float_list(self.params['Frequencies (Hz)'].get())),
+                        amplitudes=tuple(parse_float_list(self.params['Tone amplitudes'].get())),
+                        phases=tuple(phases) or None,
+                        phase_mode=self.params['Phase mode'].get().lower(),
+                        seed=int(self.params['Seed (int)'].get()) or None,
+                        synthesis=self.params['Synthesis'].get().lower())
+            if not phases and spec['phase_mode'] == 'random' and spec['seed'] is None:
+                spec['seed'] = self._auto_seed(spec)
+        elif sig == 'White Noise':
             try:
                 lowcut = float(self.params.get('Lowcut (Hz)', tk.DoubleVar(value=0.0)).get()) if 'Lowcut (Hz)' in self.params else 0.0
                 highcut = float(self.params.get('Highcut (Hz)', tk.DoubleVar(value=24000.0)).get()) if 'Highcut (Hz)' in self.params else float(sr) / 2.0
                 fir_order = int(self.params.get('FIR order', tk.IntVar(value=101)).get()) if 'FIR order' in self.params else 101
-                vals = generate_white_noise(num, amp, sr, lowcut, highcut, fir_order)
+                phase = 'linear' if self.params['Filter phase'].get() == 'Linear-phase' else 'zero'
+                method = self.params['FIR method'].get().lower()
             except Exception:
-                vals = generate_white_noise(num, amp, sr, 0.0, sr/2.0, 101)
+                lowcut, highcut, fir_order, phase, method = 0.0, sr / 2.0, 101, 'zero', 'auto'
+            spec.update(type='white_noise', lowcut=lowcut, highcut=highcut, fir_order=fir_order,
+                        filter_phase=phase, fir_method=method, seed=None)
+            spec['seed'] = self._auto_seed(spec)
+        else:
+            spec.update(type='zeros')
+        return spec
+
+    def _auto_seed(self, spec):
+        gen = dict(spec)
+        gen.pop('offset', None)
+        return self._auto_seeds.setdefault(stage_key('seed', tuple(sorted(gen.items()))),
+                                           secrets.randbits(63))
+
+    def make_stream(self, block_size=DEFAULT_BLOCK_SIZE):
+        """Build a SignalStream for the current settings (offset included)."""
+        return job_stream(self.signal_spec(), block_size=block_size)
+
+    def make_signal(self):
+        return self.pipeline.offset(self.signal_spec())
+
+    def _channel_entry(self):
+        # 定点格式不属于通道：所有通道共用当前的 Total/Fractional bits
+        params = {k: v.get() for k, v in self.params.items() if k not in ('Total bits', 'Fractional bits')}
+        return {'signal': self.sig_var.get(), 'params': params, 'spec': self.signal_spec()}
+
+    def _channel_text(self, i, entry):
+        spec = entry['spec']
+        parts = ['Ch%d' % i, entry['signal']]
+        kind = spec.get('type')
+        if kind in ('sine', 'square'):
+            parts.append('%g Hz' % spec['frequency'])
+        elif kind == 'white_noise':
+            parts.append('%g-%g Hz' % (spec['lowcut'], spec['highcut']))
+        elif kind == 'multisine':
+            parts.append('%d tones' % len(spec['frequencies']))
+        elif kind == 'prbs' and spec.get('order') is not None and spec.get('mode') == 'lfsr':
+            parts.append('order %d' % spec['order'])
+        parts.append('A=%g' % spec['amplitude'])
+        if spec.get('offset'):
+            parts.append('offset %g' % spec['offset'])
+        same = [j for j, e in enumerate(self.channels[:i]) if e['spec'] == spec]
+        if same:
+            parts.append('(same as Ch%d, generated once)' % same[0])
+        return '  '.join(parts)
+
+    def _refresh_channels(self):
+        self.channel_list.delete(0, 'end')
+        for i, entry in enumerate(self.channels):
+            self.channel_list.insert('end', self._channel_text(i, entry))
+
+    def _selected_channel(self):
+        sel = self.channel_list.curselection()
+        if not sel:
+            messagebox.showinfo('Channels', 'Select a channel first')
+            return None
+        return int(sel[0])
+
+    def add_channel(self):
+        try:
+            self.channels.append(self._channel_entry())
+        except Exception as e:
+            messagebox.showerror('Channels', str(e))
+            return
+        self._refresh_channels()
+
+    def update_channel(self):
+        i = self._selected_channel()
+        if i is None:
+            return
+        try:
+            self.channels[i] = self._channel_entry()
+        except Exception as e:
+            messagebox.showerror('Channels', str(e))
+            return
+        self._refresh_channels()
+        self.channel_list.selection_set(i)
 
-        # apply offset (numpy array + scalar works)
+    def load_channel(self):
+        """Put the selected channel's settings back into the parameter panel for editing."""
+        i = self._selected_channel()
+        if i is None:
+            return
+        entry = self.channels[i]
+        self.sig_var.set(entry['signal'])
+        # build_params restores values by label, plain values included
+        self.params.update(entry['params'])
+        self.build_params()
+
+    def remove_channel(self):
+        i = self._selected_channel()
+        if i is None:
+            return
+        del self.channels[i]
+        self._refresh_channels()
+
+    def channel_specs(self):
+        """Job dicts of the channel list, all with the current sample rate and length."""
+        num = int(self.num_samples_var.get())
+        sr = float(self.sample_rate_var.get())
+        return [dict(entry['spec'], samples=num, sample_rate=sr) for entry in self.channels]
+
+    def make_channels(self):
+        """(samples, channels) array of the channel list."""
+        return self.pipeline.channels(self.channel_specs())
+
+    def _plot_width(self):
+        """Number of horizontal bins to render: the axes width in pixels, capped by max_plot_points."""
         try:
-            return vals + float(offset)
+            width = int(self.ax.get_window_extent().width)
         except Exception:
-            # fallback: convert to numpy array then add
-            return np.array(vals) + float(offset)
+            width = 0
+        if width <= 0:
+            width = self.max_plot_points // 2
+        return max(16, min(width, self.max_plot_points // 2))
+
+    def _set_traces(self, traces):
+        """Plot (pyramid, label, style, steps) traces on the cleared axes and render the full view.
 
-    def _decimate_for_plot(self, arr):
-        """Return (t_indices, arr_decimated) where arr_decimated has at most self.max_plot_points samples.
-        Uses even decimation (linspace indices) to preserve overall shape when truncation is needed.
+        The lines are re-rendered from their envelope pyramids whenever the x-range changes
+        (scroll, rectangle zoom, toolbar pan/zoom/home).
         """
-        n = int(len(arr))
-        m = min(n, int(self.max_plot_points))
-        if n <= m:
-            return np.arange(n), arr
-        idx = np.linspace(0, n - 1, m).astype(int)
-        return np.arange(m), arr[idx]
+        self._traces = []
+        for pyr, label, style, steps in traces:
+            line, = self.ax.plot([], [], label=label, **style)
+            self._traces.append((pyr, line, steps))
+        n = max([len(t[0]) for t in self._traces] + [1])
+        lo = min([t[0].vmin for t in self._traces] + [0.0])
+        hi = max([t[0].vmax for t in self._traces] + [0.0])
+        pad = 0.05 * (hi - lo) if hi > lo else 1.0
+        self.ax.set_xlim(0, max(n - 1, 1))
+        self.ax.set_ylim(lo - pad, hi + pad)
+        self._render_traces()
+        # Axes.clear() drops callbacks, so connect again for every new plot
+        self.ax.callbacks.connect('xlim_changed', lambda ax: self._render_traces())
+
+    def _render_traces(self):
+        x0, x1 = self.ax.get_xlim()
+        width = self._plot_width()
+        for pyr, line, steps in getattr(self, '_traces', []):
+            x, y, raw = pyr.render(x0, x1, width)
+            line.set_data(x, y)
+            line.set_drawstyle('steps-mid' if (raw and steps) else 'default')
 
     def on_preview(self):
-        vals = self.make_signal()
-        total_bits = int(self.params['Total bits'].get())
-        frac_bits = int(self.params['Fractional bits'].get())
-        is_unsigned = (self.format_var.get() == 'Unsigned')
-
-        if is_unsigned:
-            u = quantize_unsigned(vals, total_bits)
-        else:
-            u = quantize_signed(vals, total_bits, frac_bits)
-
         if Figure is None:
             messagebox.showwarning('Preview', 'matplotlib not found; cannot show preview')
             return
-
-        self.ax.clear()
+        if self.channels and self.preview_channels_var.get():
+            return self._preview_channels()
+        spec = self.signal_spec()
+        stream = job_stream(spec)
+        total_bits = int(self.params['Total bits'].get())
+        frac_bits = int(self.params['Fractional bits'].get())
+        is_unsigned = (self.format_var.get() == 'Unsigned')
         sig = self.sig_var.get()
-        # decimate both the analog values and the reconstructed quantized trace to at most max_plot_points
-        n = len(vals)
-        t_plot, vals_plot = self._decimate_for_plot(vals)
-        # compute reconstruction from full data, then decimate for plotting (so scaling uses full range)
-        if is_unsigned:
-            # reconstruct approx using full arrays
-            vmin = vals.min()
-            shifted = vals - vmin
-            vmax = shifted.max() if shifted.max() != 0 else 1.0
-            recon_full = (u.astype(float) / (2 ** total_bits - 1)) * vmax + vmin
-        else:
-            ui = u.astype(np.int64)
-            sign_mask = 1 << (total_bits - 1)
-            wrap = (ui & sign_mask) != 0
-            if wrap.any():
-                ui = np.where(wrap, ui - (1 << total_bits), ui)
-            recon_full = ui / float(2 ** frac_bits)
-
-        _, recon_plot = self._decimate_for_plot(recon_full)
-
-        # For PRBS signals, draw the analog trace as stairs to reflect discrete levels.
-        if sig == 'PRBS':
-            try:
-                edges = np.arange(len(vals_plot) + 1)
-                self.ax.stairs(vals_plot, edges, label='Analog')
-            except Exception:
-                self.ax.step(t_plot, vals_plot, where='mid', label='Analog')
-        else:
-            self.ax.plot(t_plot, vals_plot, label='Analog')
-
-        # draw quantized trace as dashed step to visually distinguish
-        self.ax.step(t_plot, recon_plot, where='mid', label='Quantized', linestyle='--')
-        self.ax.legend()
-        self.ax.set_xlabel('Sample')
-        self.canvas.draw()
+        pipe = self.pipeline
+        keys = pipe.keys(spec, total_bits, frac_bits, is_unsigned)
+        pyramids = dict(self._pyramids)
+
+        def work(report):
+            # min/max envelope of the analog signal: zooming re-renders the visible range
+            # without losing peaks. Only generated when the signal parameters changed.
+            analog = pyramids.get(keys['offset'])
+            if analog is None:
+                vals = pipe.offset(spec, progress=lambda f: report(0.8 * f))
+                analog = EnvelopePyramid(vals, progress=lambda f: report(0.8 + 0.2 * f))
+            # the quantized trace maps the drawn envelope points only, so a bit-width or
+            # format edit costs O(pixels) whatever the signal length
+            return analog, QuantizedEnvelope(analog, total_bits, frac_bits, is_unsigned)
+
+        def done(result):
+            analog, quant = result
+            self._pyramids = {keys['offset']: analog}
+            self.ax.clear()
+            # PRBS analog samples are drawn as steps to reflect discrete levels; the quantized
+            # trace is a dashed step to visually distinguish it.
+            self._set_traces([
+                (analog, 'Analog', {}, sig == 'PRBS'),
+                (quant, 'Quantized', {'linestyle': '--'}, True),
+            ])
+            self.ax.legend()
+            self.ax.set_xlabel('Sample')
+            # report how band-limited noise was actually filtered / how the signal was synthesized
+            filter_mode = getattr(stream, 'filter_mode', None)
+            if filter_mode is None and hasattr(stream, 'describe'):
+                filter_mode = stream.describe()
+            if filter_mode:
+                self.ax.set_title(filter_mode, fontsize='small')
+            self.canvas.draw()
+
+        self._start_job('Preview', work, done)
+
+    def _preview_channels(self):
+        """Plot every channel of the channel list (analog values, one trace per channel)."""
+        specs = self.channel_specs()
+        pipe = self.pipeline
+        keys = [pipe.keys(spec)['offset'] for spec in specs]
+        pyramids = dict(self._pyramids)
+
+        def work(report):
+            out = {}
+            for c, (spec, key) in enumerate(zip(specs, keys)):
+                if key in out:
+                    continue
+                pyr = pyramids.get(key)
+                if pyr is None:
+                    vals = pipe.offset(spec, progress=lambda f, c=c: report((c + 0.8 * f) / len(specs)))
+                    pyr = EnvelopePyramid(vals, progress=lambda f, c=c: report((c + 0.8 + 0.2 * f) / len(specs)))
+                out[key] = pyr
+            return out
+
+        def done(pyrs):
+            self._pyramids = pyrs
+            self.ax.clear()
+            self._set_traces([(pyrs[key], 'Ch%d' % c, {}, spec['type'] in ('prbs', 'square'))
+                              for c, (spec, key) in enumerate(zip(specs, keys))])
+            self.ax.legend()
+            self.ax.set_xlabel('Sample')
+            self.ax.set_title('%d channels' % len(specs), fontsize='small')
+            self.canvas.draw()
+
+        self._start_job('Preview', work, done)
 
     def _on_scroll(self, event):
         if event.inaxes != self.ax:
@@ -703,6 +914,12 @@ class SignalGeneratorApp:
         sr_var = tk.DoubleVar(value=float(self.sample_rate_var.get()))
         ttk.Entry(row, textvariable=sr_var, width=10).grid(row=4, column=1, sticky='w', padx=6)
 
+        byteorder_label = ttk.Label(row, text='Byte order (.bin):')
+        byteorder_label.grid(row=4, column=2, sticky='e')
+        byteorder_var = tk.StringVar(value='big')
+        byteorder_cb = ttk.Combobox(row, textvariable=byteorder_var, values=['big', 'little'], width=10, state='readonly')
+        byteorder_cb.grid(row=4, column=3, sticky='w', padx=6)
+
         msg_var = tk.StringVar(value='')
         msg_lbl = ttk.Label(dlg, textvariable=msg_var, foreground='red')
         msg_lbl.pack(fill='x', padx=6, pady=(4,0))
@@ -729,6 +946,8 @@ class SignalGeneratorApp:
                     vmin_entry.grid_remove()
                     vmax_label.grid_remove()
                     vmax_entry.grid_remove()
+                    byteorder_label.grid_remove()
+                    byteorder_cb.grid_remove()
                 except Exception:
                     pass
                 return
@@ -772,6 +991,14 @@ class SignalGeneratorApp:
                 vmax_label.grid_remove()
                 vmax_entry.grid_remove()
 
+            # byte order only matters for raw binary files
+            if show_bin:
+                byteorder_label.grid()
+                byteorder_cb.grid()
+            else:
+                byteorder_label.grid_remove()
+                byteorder_cb.grid_remove()
+
         # call update when file path or import type changes
         try:
             file_var.trace_add('write', update_import_params)
@@ -815,107 +1042,32 @@ class SignalGeneratorApp:
                 else:
                     # default to hex for unknown quantized
                     ffmt = 'hex'
-            tb = int(totalbits_var.get())
-            fb = int(fracbits_var.get())
-            signed = (signed_var.get() == 'Signed')
             try:
-                if ffmt in ('hex','mem'):
-                    with open(p, 'r') as f:
-                        lines = [l.strip() for l in f.readlines() if l.strip()]
-                    uints = []
-                    hex_digits = (tb + 3) // 4
-                    for ln in lines:
-                        v = ln
-                        if v.startswith('0x') or v.startswith('0X'):
-                            v = v[2:]
-                        # pad or trim
-                        if len(v) > hex_digits:
-                            # allow but warn: trim higher digits
-                            v = v[-hex_digits:]
-                        v = v.rjust(hex_digits, '0')
-                        try:
-                            ui = int(v, 16)
-                        except Exception:
-                            raise ValueError(f'Invalid hex line: {ln}')
-                        uints.append(ui)
-                    uints = np.array(uints, dtype=np.uint64)
-                elif ffmt == 'bin':
-                    bytes_per = (tb + 7) // 8
-                    with open(p, 'rb') as f:
-                        data = f.read()
-                    if len(data) % bytes_per != 0:
-                        raise ValueError('Binary file size is not a multiple of bytes per sample')
-                    uints = []
-                    for i in range(0, len(data), bytes_per):
-                        chunk = data[i:i+bytes_per]
-                        ui = int.from_bytes(chunk, byteorder='big')
-                        uints.append(ui)
-                    uints = np.array(uints, dtype=np.uint64)
-                elif ffmt in ('csv','mat','npz'):
-                    # Raw imports: read floats from CSV/MAT/NPZ
-                    if ffmt == 'csv':
-                        data = np.loadtxt(p, delimiter=',')
-                    elif ffmt == 'mat':
-                        try:
-                            from scipy import io as spio
-                            mat = spio.loadmat(p)
-                            # try common keys
-                            if 'samples' in mat:
-                                data = np.asarray(mat['samples']).squeeze()
-                            else:
-                                # pick the first numeric variable
-                                for k, v in mat.items():
-                                    if not k.startswith('__'):
-                                        data = np.asarray(v).squeeze()
-                                        break
-                        except Exception:
-                            # fallback: try numpy.load
-                            npz = np.load(p, allow_pickle=True)
-                            if 'samples' in npz:
-                                data = np.asarray(npz['samples']).squeeze()
-                            else:
-                                # pick first array-like
-                                keys = [k for k in npz.keys()]
-                                data = np.asarray(npz[keys[0]]).squeeze()
-                    else:  # npz
-                        npz = np.load(p, allow_pickle=True)
-                        if 'samples' in npz:
-                            data = np.asarray(npz['samples']).squeeze()
-                        else:
-                            keys = [k for k in npz.keys()]
-                            data = np.asarray(npz[keys[0]]).squeeze()
-                    # normalize data to 1D array
-                    if data.ndim > 1:
-                        # pick first column if 2D, else flatten
-                        if data.shape[1] >= 1:
-                            data = data[:,0]
-                        else:
-                            data = data.ravel()
-                    recon = data.astype(float)
-                else:
-                    raise ValueError('Unsupported format')
-                if uints.size == 0:
-                    raise ValueError('No samples found in file')
-
-                # reconstruct floats
-                if signed:
-                    ui64 = uints.astype(np.int64)
-                    sign_mask = 1 << (tb - 1)
-                    wrap = (ui64 & sign_mask) != 0
-                    if wrap.any():
-                        ui64 = np.where(wrap, ui64 - (1 << tb), ui64)
-                    recon = ui64.astype(float) / float(2 ** fb)
-                else:
-                    # need vmin/vmax to map back to float
-                    vmin = float(vmin_var.get())
-                    vmax = float(vmax_var.get())
-                    if vmax <= vmin:
-                        raise ValueError('vmax must be greater than vmin for unsigned reconstruction')
-                    recon = (uints.astype(float) / (2 ** tb - 1)) * (vmax - vmin) + vmin
+                tb = int(totalbits_var.get())
+                fb = int(fracbits_var.get())
+                signed = (signed_var.get() == 'Signed')
+                byteorder = byteorder_var.get()
+                vmin = float(vmin_var.get())
+                vmax = float(vmax_var.get())
+                sr = float(sr_var.get())
+            except Exception as e:
+                messagebox.showerror('Import error', str(e))
+                return
 
+            def work(report):
+                recon = load_samples(p, ffmt, tb, fb, signed=signed, byteorder=byteorder, vmin=vmin, vmax=vmax)
+                report(0.1)
+                pyr = EnvelopePyramid(recon, progress=lambda f: report(0.1 + 0.9 * f))
+                return recon, pyr
+
+            def done(result):
+                recon, pyr = result
+                self.imported = {'values': recon, 'path': p, 'sample_rate': sr,
+                                 'load': dict(ffmt=ffmt, total_bits=tb, frac_bits=fb, signed=signed,
+                                              byteorder=byteorder, vmin=vmin, vmax=vmax)}
                 # apply sample rate and update UI
-                self.num_samples_var.set(int(uints.size))
-                self.sample_rate_var.set(float(sr_var.get()))
+                self.num_samples_var.set(int(len(recon)))
+                self.sample_rate_var.set(sr)
                 # update fixed-point fields
                 self.format_var.set('Signed' if signed else 'Unsigned')
                 # ensure params exist and set
@@ -924,22 +1076,17 @@ class SignalGeneratorApp:
                 if 'Fractional bits' in self.params:
                     self.params['Fractional bits'].set(fb)
 
-                # plot imported data in preview
-                # plot imported data in preview (decimate to avoid UI lag)
+                # plot imported data in preview (min/max envelope to avoid UI lag)
                 self.ax.clear()
-                t_plot, recon_plot = self._decimate_for_plot(recon)
-                try:
-                    edges = np.arange(len(recon_plot) + 1)
-                    self.ax.stairs(recon_plot, edges, label='Imported', linestyle='-')
-                except Exception:
-                    self.ax.plot(t_plot, recon_plot, label='Imported')
+                self._set_traces([(pyr, 'Imported', {}, True)])
                 self.ax.legend()
                 self.canvas.draw()
 
                 messagebox.showinfo('Import', f'Imported {len(recon)} samples from {p}')
+
+            # file reading, reconstruction and envelope building run in the background
+            if self._start_job('Import', work, done):
                 dlg.destroy()
-            except Exception as e:
-                messagebox.showerror('Import error', str(e))
 
         ttk.Button(btn_row, text='Load', command=do_load).pack(side='right', padx=6)
         ttk.Button(btn_row, text='Cancel', command=dlg.destroy).pack(side='right')
@@ -1060,6 +1207,21 @@ class SignalGeneratorApp:
 
         ttk.Button(row, text='Browse...', command=browse).grid(row=2, column=3, padx=6)
 
+        # byte order only applies to .bin export
+        ttk.Label(row, text='Byte order:').grid(row=3, column=0, sticky='w')
+        byteorder_var = tk.StringVar(value='big')
+        ttk.Combobox(row, textvariable=byteorder_var, values=['big', 'little'], width=12,
+                     state='readonly').grid(row=3, column=1, sticky='w', padx=6)
+
+        # with a channel list: all channels in one interleaved file, one file per channel
+        # (name_ch0.bin, ...) or only the signal in the parameter panel
+        layout_var = tk.StringVar(value='Interleaved' if self.channels else 'Current signal only')
+        if self.channels:
+            ttk.Label(row, text='Channels (%d):' % len(self.channels)).grid(row=4, column=0, sticky='w')
+            ttk.Combobox(row, textvariable=layout_var, width=18, state='readonly',
+                         values=['Interleaved', 'Per-channel files', 'Current signal only']
+                         ).grid(row=4, column=1, sticky='w', padx=6)
+
         msg_var = tk.StringVar(value='')
         msg_lbl = ttk.Label(dlg, textvariable=msg_var, foreground='red')
         msg_lbl.pack(fill='x', padx=6, pady=(4,0))
@@ -1074,57 +1236,549 @@ class SignalGeneratorApp:
                 return
             m = mode_var.get()
             try:
-                vals = self.make_signal()
                 total_bits = int(self.params['Total bits'].get())
                 frac_bits = int(self.params['Fractional bits'].get())
                 is_unsigned = (self.format_var.get() == 'Unsigned')
+                sr = float(self.sample_rate_var.get())
+                byteorder = byteorder_var.get()
+                fmt = fmt_var.get()
+                # the spec is read on the Tk thread, generated in the worker; it carries the
+                # same seed as the preview, so both see one realization
+                multi = layout_var.get() != 'Current signal only'
+                if multi:
+                    specs = self.channel_specs()
+                    stream = MultiChannelStream(specs)
+                    layout = 'separate' if layout_var.get() == 'Per-channel files' else 'interleaved'
+                else:
+                    spec = self.signal_spec()
+                    stream = job_stream(spec)
+            except Exception as e:
+                messagebox.showerror('Export error', str(e))
+                return
+            pipe = self.pipeline
+            low = p.lower()
+
+            if m == 'Quantized':
+                if low.endswith('.hex') or low.endswith('.mem') or fmt in ('hex','mem'):
+                    ffmt = 'hex'
+                elif low.endswith('.bin') or fmt == 'bin':
+                    ffmt = 'bin'
+                else:
+                    # fallback to hex
+                    ffmt = 'hex'
 
-                if m == 'Quantized':
-                    if is_unsigned:
-                        u = quantize_unsigned(vals, total_bits)
+                def work(report):
+                    if multi:
+                        n = export_quantized_stream(stream, p, ffmt, total_bits, frac_bits,
+                                                    unsigned=is_unsigned, byteorder=byteorder,
+                                                    progress=report, layout=layout)
+                        where = ', '.join(channel_paths(p, stream.channels)) if layout == 'separate' else p
+                        return f'Exported {n} samples x {stream.channels} channels to {where}'
+                    u = pipe.generated_codes(spec, total_bits, frac_bits, is_unsigned)
+                    if u is not None:
+                        # the previewed signal is cached: quantize it instead of regenerating
+                        def blocks():
+                            for i in range(0, u.size, DEFAULT_BLOCK_SIZE):
+                                yield u[i:i + DEFAULT_BLOCK_SIZE]
+                                report(min(1.0, (i + DEFAULT_BLOCK_SIZE) / float(u.size)))
+                        n = write_quantized(blocks(), p, ffmt, total_bits, byteorder)
                     else:
-                        u = quantize_signed(vals, total_bits, frac_bits)
-                    low = p.lower()
-                    if low.endswith('.hex') or low.endswith('.mem') or fmt_var.get() in ('hex','mem'):
-                        lines = make_hex_lines(u, total_bits)
-                        save_hex(lines, p)
-                    elif low.endswith('.bin') or fmt_var.get() == 'bin':
-                        save_bin(u, total_bits, p)
+                        # generate -> quantize -> write block by block (bounded memory)
+                        n = export_quantized_stream(stream, p, ffmt, total_bits, frac_bits,
+                                                    unsigned=is_unsigned, byteorder=byteorder,
+                                                    progress=report)
+                    filter_mode = getattr(stream, 'filter_mode', None)
+                    note = f' ({filter_mode})' if filter_mode else ''
+                    return f'Exported {n} samples to {p}{note}'
+            else:
+                def work(report):
+                    # several channels are saved as columns
+                    if multi:
+                        vals = pipe.channels(specs, progress=lambda f: report(0.9 * f))
                     else:
-                        # fallback to hex
-                        lines = make_hex_lines(u, total_bits)
-                        save_hex(lines, p)
-                    messagebox.showinfo('Export', f'Exported {len(u)} samples to {p}')
-                else:
-                    low = p.lower()
-                    if low.endswith('.csv') or fmt_var.get() == 'csv':
+                        vals = pipe.offset(spec, progress=lambda f: report(0.9 * f))
+                    if low.endswith('.csv') or fmt == 'csv':
                         save_raw_csv(vals, p)
-                        messagebox.showinfo('Export', f'Exported {len(vals)} samples to {p} (CSV)')
-                    elif low.endswith('.mat') or fmt_var.get() == 'mat':
+                        return f'Exported {len(vals)} samples to {p} (CSV)'
+                    elif low.endswith('.mat') or fmt == 'mat':
                         try:
-                            save_raw_mat(vals, float(self.sample_rate_var.get()), p)
-                            messagebox.showinfo('Export', f'Exported {len(vals)} samples to {p} (MAT)')
+                            save_raw_mat(vals, sr, p)
+                            return f'Exported {len(vals)} samples to {p} (MAT)'
                         except Exception:
                             # fallback to npz
-                            save_raw_mat(vals, float(self.sample_rate_var.get()), p)
-                            messagebox.showinfo('Export', f'Exported {len(vals)} samples to {p} (NPZ fallback)')
-                    elif low.endswith('.npz') or fmt_var.get() == 'npz':
+                            save_raw_mat(vals, sr, p)
+                            return f'Exported {len(vals)} samples to {p} (NPZ fallback)'
+                    elif low.endswith('.npz') or fmt == 'npz':
                         # use numpy savez
-                        np.savez(p, samples=np.asarray(vals), sample_rate=float(self.sample_rate_var.get()))
-                        messagebox.showinfo('Export', f'Exported {len(vals)} samples to {p} (NPZ)')
+                        np.savez(p, samples=np.asarray(vals), sample_rate=sr)
+                        return f'Exported {len(vals)} samples to {p} (NPZ)'
                     else:
                         # default to CSV
                         save_raw_csv(vals, p)
-                        messagebox.showinfo('Export', f'Exported {len(vals)} samples to {p} (CSV)')
+                        return f'Exported {len(vals)} samples to {p} (CSV)'
+
+            def done(msg):
+                messagebox.showinfo('Export', msg)
+
+            if self._start_job('Export', work, done):
                 dlg.destroy()
-            except Exception as e:
-                messagebox.showerror('Export error', str(e))
 
         ttk.Button(btn_row, text='Save', command=do_save).pack(side='right', padx=6)
         ttk.Button(btn_row, text='Cancel', command=dlg.destroy).pack(side='right')
 
+    def on_fir_sim(self):
+        """Run the current signal through a bit-accurate fixed-point FIR (FixedPointFIR) and plot
+        input and output; optionally write the output as a golden .hex/.mem/.bin vector."""
+        if Figure is None:
+            messagebox.showwarning('FIR sim', 'matplotlib not found; cannot show preview')
+            return
+        if self.format_var.get() == 'Unsigned':
+            messagebox.showerror('FIR sim', 'The FIR model takes signed (Q format) samples; '
+                                 'switch the quantization format to Signed')
+            return
+        total_bits = int(self.params['Total bits'].get())
+        frac_bits = int(self.params['Fractional bits'].get())
+        saved = self.fir_settings
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title('Fixed-point FIR simulation')
+        dlg.transient(self.root)
+        try:
+            self.root.update_idletasks()
+            dlg.geometry('+%d+%d' % (self.root.winfo_rootx() + 60, self.root.winfo_rooty() + 60))
+        except Exception:
+            pass
+        dlg.grab_set()
+
+        row = ttk.Frame(dlg, padding=6)
+        row.pack(fill='x')
+
+        ttk.Label(row, text='Coefficients:').grid(row=0, column=0, sticky='w')
+        coef_var = tk.StringVar(value=saved['coefficients'])
+        ttk.Entry(row, textvariable=coef_var, width=48).grid(row=0, column=1, columnspan=3, padx=6, pady=2)
 
-def main():
+        def browse_coef():
+            p = filedialog.askopenfilename(filetypes=[('Coefficients', '*.mat *.npy *.npz *.csv *.txt'),
+                                                      ('All files', '*.*')])
+            if p:
+                coef_var.set(p)
+
+        ttk.Button(row, text='Browse...', command=browse_coef).grid(row=0, column=4, padx=6)
+
+        # integer fields: label, settings key, default
+        int_vars = {}
+        fields = [('Coef bits:', 'coef_bits', saved['coef_bits']), ('Coef frac bits:', 'coef_frac', saved['coef_frac']),
+                  ('Accumulator bits:', 'acc_bits', saved['acc_bits']),
+                  ('Output bits:', 'out_bits', total_bits), ('Output frac bits:', 'out_frac', frac_bits)]
+        for i, (label, key, value) in enumerate(fields):
+            ttk.Label(row, text=label).grid(row=1 + i // 2, column=2 * (i % 2), sticky='w')
+            int_vars[key] = tk.IntVar(value=value)
+            ttk.Entry(row, textvariable=int_vars[key], width=8).grid(row=1 + i // 2, column=2 * (i % 2) + 1,
+                                                                     sticky='w', padx=6, pady=2)
+
+        ttk.Label(row, text='Rounding:').grid(row=4, column=0, sticky='w')
+        rounding_var = tk.StringVar(value=saved['rounding'])
+        ttk.Combobox(row, textvariable=rounding_var, values=list(FIXED_FIR_ROUNDING), width=10,
+                     state='readonly').grid(row=4, column=1, sticky='w', padx=6)
+        ttk.Label(row, text='Overflow:').grid(row=4, column=2, sticky='w')
+        overflow_var = tk.StringVar(value=saved['overflow'])
+        ttk.Combobox(row, textvariable=overflow_var, values=['saturate', 'wrap'], width=10,
+                     state='readonly').grid(row=4, column=3, sticky='w', padx=6)
+
+        # optional golden output vector (leave empty to only plot)
+        ttk.Label(row, text='Golden output:').grid(row=5, column=0, sticky='w')
+        golden_var = tk.StringVar(value=saved['golden'])
+        ttk.Entry(row, textvariable=golden_var, width=48).grid(row=5, column=1, columnspan=3, padx=6, pady=2)
+
+        def browse_golden():
+            p = filedialog.asksaveasfilename(defaultextension='.hex', filetypes=[
+                ('Hex (.hex)', '*.hex'), ('Memory (.mem)', '*.mem'), ('Binary (.bin)', '*.bin')])
+            if p:
+                golden_var.set(p)
+
+        ttk.Button(row, text='Browse...', command=browse_golden).grid(row=5, column=4, padx=6)
+        ttk.Label(row, text='Byte order:').grid(row=6, column=0, sticky='w')
+        byteorder_var = tk.StringVar(value=saved['byteorder'])
+        ttk.Combobox(row, textvariable=byteorder_var, values=['big', 'little'], width=10,
+                     state='readonly').grid(row=6, column=1, sticky='w', padx=6)
+
+        btn_row = ttk.Frame(dlg)
+        btn_row.pack(fill='x', pady=6)
+
+        def do_run():
+            try:
+                kw = {key: int(var.get()) for key, var in int_vars.items()}
+                kw.update(rounding=rounding_var.get(), overflow=overflow_var.get())
+                coef_path = coef_var.get()
+                if not coef_path:
+                    raise ValueError('Select a coefficient file')
+                golden = golden_var.get()
+                byteorder = byteorder_var.get()
+                spec = self.signal_spec()
+                stream = job_stream(spec)
+            except Exception as e:
+                messagebox.showerror('FIR sim error', str(e))
+                return
+            self.fir_settings = dict(kw, coefficients=coef_path, golden=golden, byteorder=byteorder)
+            del self.fir_settings['out_bits'], self.fir_settings['out_frac']
+            ffmt = 'bin' if golden.lower().endswith('.bin') else 'hex'
+
+            def work(report):
+                fir = FixedPointFIR(load_coefficients(coef_path), total_bits, frac_bits, **kw)
+                n = len(stream)
+                xin = np.empty(n, dtype=np.int64)
+                yout = np.empty(n, dtype=np.int64)
+                pos = [0]
+
+                def blocks():
+                    # the input trace is the quantized stimulus the FIR actually saw
+                    for u in iter_quantized(stream, total_bits, frac_bits, progress=lambda f: report(0.8 * f)):
+                        i = pos[0]
+                        xin[i:i + u.size] = sign_extend(u, total_bits)
+                        yout[i:i + u.size] = fir.process(xin[i:i + u.size])
+                        pos[0] += u.size
+                        yield fir.to_codes(yout[i:i + u.size])
+
+                if golden:
+                    write_quantized(blocks(), golden, ffmt, fir.out_bits, byteorder)
+                else:
+                    for _ in blocks():
+                        pass
+                x_pyr = EnvelopePyramid(xin / 2.0 ** frac_bits, progress=lambda f: report(0.8 + 0.1 * f))
+                y_pyr = EnvelopePyramid(fir.to_values(yout), progress=lambda f: report(0.9 + 0.1 * f))
+                return fir, x_pyr, y_pyr
+
+            def done(result):
+                fir, x_pyr, y_pyr = result
+                self.ax.clear()
+                self._set_traces([(x_pyr, 'FIR input (Q%d.%d)' % (total_bits - frac_bits, frac_bits),
+                                   {'alpha': 0.6}, True),
+                                  (y_pyr, 'FIR output', {}, True)])
+                self.ax.legend()
+                self.ax.set_xlabel('Sample')
+                title = fir.describe()
+                if fir.acc_overflows or fir.out_overflows:
+                    title += '\noverflows: acc %d, out %d' % (fir.acc_overflows, fir.out_overflows)
+                self.ax.set_title(title, fontsize='small')
+                self.canvas.draw()
+                if golden:
+                    messagebox.showinfo('FIR sim', 'Wrote %d output samples to %s' % (len(y_pyr), golden))
+
+            if self._start_job('FIR sim', work, done):
+                dlg.destroy()
+
+        ttk.Button(btn_row, text='Run', command=do_run).pack(side='right', padx=6)
+        ttk.Button(btn_row, text='Cancel', command=dlg.destroy).pack(side='right')
+
+    def on_adaptive(self):
+        """LMS / NLMS / FxLMS (AdaptiveFilter) on the current signal or the last imported file.
+
+        The desired signal is the reference through a primary-path (plant) FIR, or the imported
+        file (e.g. a measured response for system identification, as in LMS_SYS_ID.m). The
+        preview shows d and the error e; the weights can be saved in the LMS_SYS_ID .mat layout.
+        """
+        if Figure is None:
+            messagebox.showwarning('Adaptive filter', 'matplotlib not found; cannot show preview')
+            return
+        saved = self.adapt_settings
+        dlg = tk.Toplevel(self.root)
+        dlg.title('Adaptive filter (LMS / FxLMS)')
+        dlg.transient(self.root)
+        try:
+            self.root.update_idletasks()
+            dlg.geometry('+%d+%d' % (self.root.winfo_rootx() + 60, self.root.winfo_rooty() + 60))
+        except Exception:
+            pass
+        dlg.grab_set()
+
+        row = ttk.Frame(dlg, padding=6)
+        row.pack(fill='x')
+
+        ttk.Label(row, text='Algorithm:').grid(row=0, column=0, sticky='w')
+        alg_var = tk.StringVar(value=saved['algorithm'])
+        ttk.Combobox(row, textvariable=alg_var, values=['LMS', 'NLMS', 'FxLMS', 'FxNLMS'], width=10,
+                     state='readonly').grid(row=0, column=1, sticky='w', padx=6)
+        ttk.Label(row, text='Domain:').grid(row=0, column=2, sticky='w')
+        domain_var = tk.StringVar(value=saved['domain'])
+        ttk.Combobox(row, textvariable=domain_var, values=['Time', 'Frequency (FFT)'], width=16,
+                     state='readonly').grid(row=0, column=3, sticky='w', padx=6)
+
+        # block size 1 = sample-by-sample update (as in the MATLAB scripts); FFT uses block = taps
+        taps_var = tk.IntVar(value=saved['taps'])
+        mu_var = tk.DoubleVar(value=saved['mu'])
+        block_var = tk.IntVar(value=saved['block_size'])
+        for i, (label, var) in enumerate((('Taps:', taps_var), ('Step size mu:', mu_var), ('Block size:', block_var))):
+            ttk.Label(row, text=label).grid(row=1 + i // 2, column=2 * (i % 2), sticky='w')
+            ttk.Entry(row, textvariable=var, width=10).grid(row=1 + i // 2, column=2 * (i % 2) + 1, sticky='w',
+                                                          padx=6, pady=2)
+
+        imported = self.imported
+        imported_name = 'Imported: %s' % os.path.basename(imported['path']) if imported else None
+        ttk.Label(row, text='Reference x:').grid(row=3, column=0, sticky='w')
+        ref_var = tk.StringVar(value='Current signal')
+        ttk.Combobox(row, textvariable=ref_var, width=30, state='readonly',
+                     values=['Current signal'] + ([imported_name] if imported else [])
+                     ).grid(row=3, column=1, columnspan=3, sticky='w', padx=6)
+        ttk.Label(row, text='Desired d:').grid(row=4, column=0, sticky='w')
+        des_var = tk.StringVar(value='Primary path * x')
+        ttk.Combobox(row, textvariable=des_var, width=30, state='readonly',
+                     values=['Primary path * x'] + ([imported_name] if imported else [])
+                     ).grid(row=4, column=1, columnspan=3, sticky='w', padx=6)
+
+        # coefficient files (load_coefficients: .mat with w / s.w, .npy, .csv/.txt)
+        file_vars = {}
+        for i, (label, key, save) in enumerate((('Primary path:', 'primary', False),
+                                                ('Secondary path:', 'secondary', False),
+                                                ('Secondary estimate:', 'secondary_estimate', False),
+                                                ('Save weights:', 'save', True))):
+            ttk.Label(row, text=label).grid(row=5 + i, column=0, sticky='w')
+            var = file_vars[key] = tk.StringVar(value=saved[key])
+            ttk.Entry(row, textvariable=var, width=40).grid(row=5 + i, column=1, columnspan=3, padx=6, pady=2)
+
+            def browse(var=var, save=save):
+                if save:
+                    p = filedialog.asksaveasfilename(defaultextension='.mat', filetypes=[('MAT (.mat)', '*.mat')])
+                else:
+                    p = filedialog.askopenfilename(filetypes=[('Coefficients', '*.mat *.npy *.npz *.csv *.txt'),
+                                                              ('All files', '*.*')])
+                if p:
+                    var.set(p)
+
+            ttk.Button(row, text='Browse...', command=browse).grid(row=5 + i, column=4, padx=6)
+
+        btn_row = ttk.Frame(dlg)
+        btn_row.pack(fill='x', pady=6)
+
+        def do_run():
+            try:
+                alg = alg_var.get()
+                domain = 'freq' if domain_var.get().startswith('Freq') else 'time'
+                taps, mu, block = int(taps_var.get()), float(mu_var.get()), int(block_var.get())
+                paths = {key: var.get() for key, var in file_vars.items()}
+                use_imported_x = ref_var.get() != 'Current signal'
+                use_imported_d = des_var.get() != 'Primary path * x'
+                if not use_imported_d and not paths['primary']:
+                    raise ValueError('Select a primary path file or an imported desired signal')
+                if alg.startswith('Fx') and not paths['secondary']:
+                    raise ValueError('%s needs a secondary path file' % alg)
+                spec = None if use_imported_x else self.signal_spec()
+                sr = imported['sample_rate'] if use_imported_x else float(self.sample_rate_var.get())
+            except Exception as e:
+                messagebox.showerror('Adaptive filter error', str(e))
+                return
+            self.adapt_settings = dict(paths, algorithm=alg, taps=taps, mu=mu, block_size=block,
+                                       domain=domain_var.get())
+            pipe = self.pipeline
+
+            def work(report):
+                x = imported['values'] if use_imported_x else pipe.offset(spec, progress=lambda f: report(0.1 * f))
+                sec = load_coefficients(paths['secondary']) if alg.startswith('Fx') else None
+                est = load_coefficients(paths['secondary_estimate']) if sec is not None and paths['secondary_estimate'] else None
+                filt = AdaptiveFilter(taps, mu, alg.lower(), block_size=block, domain=domain, secondary_path=sec,
+                                      secondary_estimate=est, history=max(1, len(x) // 500))
+                if use_imported_d:
+                    d = imported['values']
+                else:
+                    primary = StreamingFIR(load_coefficients(paths['primary']))
+                    d = np.empty(len(x))
+                    for i in range(0, len(x), DEFAULT_BLOCK_SIZE):
+                        d[i:i + DEFAULT_BLOCK_SIZE] = primary.process(x[i:i + DEFAULT_BLOCK_SIZE])
+                y, e = filt.run(x, d, progress=lambda f: report(0.1 + 0.8 * f))
+                d = np.asarray(d[:len(e)], dtype=float)
+                saved = save_adaptive_weights(paths['save'], filt, sr) if paths['save'] else None
+                # error power of the last history interval relative to d over the same samples
+                mse = filt.error_history
+                K = filt.history_interval
+                gain = None
+                if mse.size:
+                    end = mse.size * K
+                    pd = float(np.mean(np.square(d[end - K:end])))
+                    if pd > 0 and mse[-1] > 0:
+                        gain = 10 * np.log10(pd / mse[-1])
+                return (filt, gain, saved, EnvelopePyramid(d, progress=lambda f: report(0.9 + 0.05 * f)),
+                        EnvelopePyramid(e, progress=lambda f: report(0.95 + 0.05 * f)))
+
+            def done(result):
+                filt, gain, saved, d_pyr, e_pyr = result
+                self.adaptive_result = {'d': d_pyr.data, 'e': e_pyr.data, 'sample_rate': sr, 'title': filt.describe()}
+                self.ax.clear()
+                self._set_traces([(d_pyr, 'Desired d', {'alpha': 0.6}, False), (e_pyr, 'Error e', {}, False)])
+                self.ax.legend()
+                self.ax.set_xlabel('Sample')
+                title = filt.describe()
+                if gain is not None:
+                    title += ', final error %.1f dB below d' % gain
+                self.ax.set_title(title, fontsize='small')
+                self.canvas.draw()
+                if saved:
+                    messagebox.showinfo('Adaptive filter', 'Saved %d weights to %s' % (filt.taps, saved))
+
+            if self._start_job('Adaptive filter', work, done):
+                dlg.destroy()
+
+        ttk.Button(btn_row, text='Run', command=do_run).pack(side='right', padx=6)
+        ttk.Button(btn_row, text='Cancel', command=dlg.destroy).pack(side='right')
+
+    def on_psd(self):
+        """Welch PSD of the selected source in the Spectrum tab, accumulated block by block.
+
+        Current signal: analog, quantized and the quantization error, streamed from the
+        generator (or the cached preview). Imported file: streamed from disk (iter_file_blocks),
+        so multi-GB files are never loaded whole. Adaptive filter: d, the estimate d - e and e,
+        as in timeNpsdAnalysis.m. MSE / relative error go to the line above the plot.
+        """
+        if Figure is None:
+            messagebox.showwarning('Spectrum', 'matplotlib not found; cannot show the spectrum')
+            return
+        try:
+            nperseg = int(self.psd_nperseg_var.get())
+            overlap = float(self.psd_overlap_var.get()) / 100.0
+            window = self.psd_window_var.get()
+            fmax = float(self.psd_fmax_var.get())
+            source = self.psd_source_var.get()
+            if source == 'Imported file':
+                imp = self.imported
+                sr = imp['sample_rate']
+            elif source == 'Adaptive filter':
+                res = self.adaptive_result
+                sr = res['sample_rate']
+            else:
+                spec = self.signal_spec()
+                total_bits = int(self.params['Total bits'].get())
+                frac_bits = int(self.params['Fractional bits'].get())
+                is_unsigned = (self.format_var.get() == 'Unsigned')
+                sr = float(self.sample_rate_var.get())
+            # validates the settings on the Tk thread
+            WelchPSD(nperseg, overlap, window, sample_rate=sr)
+        except Exception as e:
+            messagebox.showerror('Spectrum error', str(e))
+            return
+        pipe = self.pipeline
+
+        def work(report):
+            welch = WelchPSD(nperseg, overlap, window, sample_rate=sr)
+            stats = None
+            if source == 'Imported file':
+                labels = [os.path.basename(imp['path'])]
+                for blk in iter_file_blocks(imp['path'], progress=report, **imp['load']):
+                    welch.update(blk)
+            elif source == 'Adaptive filter':
+                labels = ['d', 'd - e', 'e']
+                stats = ErrorStats()
+                d, e = res['d'], res['e']
+                for i in range(0, len(e), DEFAULT_BLOCK_SIZE):
+                    db, eb = d[i:i + DEFAULT_BLOCK_SIZE], e[i:i + DEFAULT_BLOCK_SIZE]
+                    welch.update(np.column_stack((db, db - eb, eb)))
+                    stats.update(db, db - eb)
+                    report(min(1.0, (i + DEFAULT_BLOCK_SIZE) / float(len(e))))
+            else:
+                labels = ['Analog', 'Quantized', 'Quantization error']
+                stats = ErrorStats()
+                # previewed: read the cached signal instead of generating it again
+                vals = pipe.offset(spec) if pipe.keys(spec)['offset'] in pipe.cache else None
+                stream = job_stream(spec)
+                n = len(stream)
+
+                def blocks():
+                    if vals is not None:
+                        return (vals[i:i + DEFAULT_BLOCK_SIZE] for i in range(0, n, DEFAULT_BLOCK_SIZE))
+                    stream.reset()
+                    return iter(stream)
+                passes = 2 if is_unsigned else 1
+                lo = span = None
+                done_samples = 0
+                if is_unsigned:
+                    # unsigned scaling needs the range of the whole signal first
+                    lo, hi = np.inf, -np.inf
+                    for blk in blocks():
+                        lo, hi = min(lo, float(blk.min())), max(hi, float(blk.max()))
+                        done_samples += blk.size
+                        report(done_samples / float(passes * max(1, n)))
+                    span = hi - lo
+                for blk in blocks():
+                    q = quantize_reconstruct(blk, total_bits, frac_bits, is_unsigned, lo, span)
+                    welch.update(np.column_stack((blk, q, q - blk)))
+                    stats.update(blk, q)
+                    done_samples += blk.size
+                    report(done_samples / float(passes * max(1, n)))
+            f, p = welch.psd()
+            return labels, f, np.atleast_2d(p), welch, stats
+
+        def done(result):
+            labels, f, p, welch, stats = result
+            ax = self.psd_ax
+            ax.clear()
+            floor = np.finfo(float).tiny
+            for label, row in zip(labels, p):
+                ax.plot(f, 10 * np.log10(np.maximum(row, floor)), label=label, linewidth=1)
+            ax.set_xlim(0, min(fmax, sr / 2.0) if fmax > 0 else sr / 2.0)
+            ax.set_xlabel('Frequency (Hz)')
+            ax.set_ylabel('PSD (dB/Hz)')
+            ax.grid(True)
+            ax.legend(fontsize='small')
+            ax.set_title('Welch: %d-point %s, %g%% overlap, %d segments' % (
+                welch.nperseg, welch.window, 100.0 * overlap, welch.segments), fontsize='small')
+            text = '%s: %d samples' % (source, welch.samples)
+            if stats is not None:
+                text += ', ' + stats.describe()
+            self.psd_stats_var.set(text)
+            self.psd_canvas.draw()
+            self.view_tabs.select(1)
+
+        self._start_job('Spectrum', work, done)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Signal generator for FPGA stimulus. '
+                                     'Starts the GUI unless --batch is given.')
+    parser.add_argument('--batch', metavar='JOBS.json', help='run the jobs (or the spec with "outputs") in this '
+                        'JSON / TOML file headless')
+    parser.add_argument('--out', default='.', help='output directory for batch files (default: .)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes for batch mode (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=0, help='master seed for jobs without their own seed')
+    parser.add_argument('--profile', metavar='LOG.jsonl',
+                        help='record per-stage time / samples / peak memory of every batch job '
+                             'and append one JSON line per job to this file')
+    parser.add_argument('--memmap', action='store_true',
+                        help='write batch outputs by filling pre-sized files through np.memmap')
+    parser.add_argument('--fir-cache', metavar='DIR', default=FIR_CACHE_DIR,
+                        help='directory for designed FIR taps shared across runs and workers '
+                             '(default: $SIGGEN_FIR_CACHE, off if unset)')
+    args = parser.parse_args(argv)
+    set_fir_cache_dir(args.fir_cache)
+
+    if args.batch:
+        spec = load_spec(args.batch)
+        if isinstance(spec, dict) and 'outputs' in spec:
+            # 声明式规格：共享的阶段只运行一次（BatchPlan）
+            if args.memmap:
+                spec = dict(spec, defaults=dict(spec.get('defaults') or {}, memmap=True))
+            plan = BatchPlan(expand_spec(spec, args.out, args.seed))
+            print(plan.describe())
+            results = plan.run(workers=args.workers, profile=bool(args.profile))
+        else:
+            defaults, jobs = load_jobs(args.batch)
+            if args.memmap:
+                defaults = dict(defaults, memmap=True)
+            if args.profile:
+                defaults = dict(defaults, profile=True)
+            results = run_batch(jobs, args.out, defaults, workers=args.workers, master_seed=args.seed)
+        if args.profile:
+            with open(args.profile, 'a', encoding='utf-8') as f:
+                for res in results:
+                    f.write(json.dumps(dict(res, time=time.strftime('%Y-%m-%dT%H:%M:%S'))) + '\n')
+        for res in results:
+            chans = ' x %d channels' % res['channels'] if res.get('channels') else ''
+            print('%s: %d samples%s (seed %d)' % (', '.join(res.get('paths') or [res['path']]), res['samples'],
+                                                   chans, res['seed']))
+            if res.get('fir_path'):
+                print('  FIR output: %s (overflows: acc %d, out %d)' % (
+                    res['fir_path'], res['fir_overflows']['acc'], res['fir_overflows']['out']))
+        return
+
+    if tk is None:
+        parser.error('tkinter is not available; only --batch can run here')
     root = tk.Tk()
     app = SignalGeneratorApp(root)
     root.mainloop()
@@ -0,0 +1,88 @@
+"""BatchPlan (declarative spec, shared stages) against run_job of every expanded output."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import signal_generator_core as sg  # noqa: E402
+
+
+def make_spec(tmp_path):
+    np.save(str(tmp_path / 'h.npy'), np.hanning(33) / 16)
+    return {
+        'defaults': {'sample_rate': 48000, 'time': 0.2, 'amplitude': 0.25},
+        'signals': {
+            'bb': {'type': 'white_noise', 'lowcut': 200, 'highcut': 300, 'fir_order': 128},
+            'h': {'type': 'harmonic', 'base': 200, 'harmonics': 3, 'amplitude': 0.9},
+            'sq': {'type': 'square', 'frequency': 997.123, 'duty': 0.3},
+            'mc': {'type': 'multichannel', 'channels': [
+                {'type': 'sine', 'frequency': 300}, {'type': 'white_noise', 'lowcut': 100, 'highcut': 900}]},
+        },
+        'fixed_point': {'Q123': {'total_bits': 24, 'frac_bits': 23}, 'Q115': {'total_bits': 16, 'frac_bits': 15},
+                        'U12': {'total_bits': 12, 'frac_bits': 0, 'signed': False}},
+        'outputs': [
+            {'signal': ['bb', 'h', 'sq'], 'fixed_point': ['Q123', 'Q115', 'U12'], 'format': ['bin', 'hex']},
+            {'signal': 'bb', 'fixed_point': 'Q115', 'offset': 0.1, 'suffix': 'DC', 'byteorder': 'little'},
+            {'signal': 'mc', 'fixed_point': ['Q115', 'U12'], 'layout': 'separate'},
+            {'signal': 'mc', 'fixed_point': 'Q123', 'suffix': 'IL', 'format': 'hex'},
+            {'signal': 'bb', 'fixed_point': 'Q123', 'suffix': 'FIR',
+             'fir_sim': {'coefficients': str(tmp_path / 'h.npy'), 'acc_bits': 40}},
+        ]}
+
+
+def _files(res):
+    files = res.get('paths') or [res['path']]
+    return files + ([res['fir_path']] if res.get('fir_path') else [])
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _same_files(res, other_dir):
+    for f in _files(res):
+        assert _read(f) == _read(os.path.join(other_dir, os.path.basename(f))), f
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_plan_matches_run_job(tmp_path, memmap):
+    spec = make_spec(tmp_path)
+    spec['defaults']['memmap'] = memmap
+    jobs = sg.expand_spec(spec, str(tmp_path / 'plan'))
+    plan = sg.BatchPlan(jobs)
+    counts = plan.stage_counts()
+    # 同一信号的各个格式共享生成阶段
+    assert counts['generate'][0] < counts['generate'][1]
+    results = plan.run()
+    solo_dir = str(tmp_path / 'solo')
+    os.makedirs(solo_dir)
+    for job, res in zip(jobs, results):
+        solo = sg.run_job(dict(job, path=os.path.join(solo_dir, os.path.basename(job['path']))))
+        assert res['samples'] == solo['samples']
+        assert res.get('fir_overflows') == solo.get('fir_overflows')
+        _same_files(res, solo_dir)
+
+
+def test_plan_workers_give_the_same_files(tmp_path):
+    spec = make_spec(tmp_path)
+    one = sg.run_spec(spec, str(tmp_path / 'one'))[1]
+    two = sg.run_spec(spec, str(tmp_path / 'two'), workers=2)[1]
+    for a, b in zip(one, two):
+        assert a['group'] == b['group']
+        _same_files(a, str(tmp_path / 'two'))
+
+
+def test_plan_raw_outputs(tmp_path):
+    spec = {'defaults': {'sample_rate': 8000, 'samples': 5000},
+            'signals': {'s': {'type': 'sine', 'frequency': 440, 'amplitude': 0.5}},
+            'fixed_point': {'Q115': {'total_bits': 16, 'frac_bits': 15}},
+            'outputs': [{'signal': 's', 'fixed_point': 'Q115', 'offset': 0.1, 'format': ['csv', 'bin']}]}
+    jobs = sg.expand_spec(spec, str(tmp_path))
+    sg.BatchPlan(jobs).run()
+    job = [j for j in jobs if j['format'] == 'csv'][0]
+    ref = str(tmp_path / 'ref.csv')
+    sg.save_raw_csv(sg.job_stream(job).read_all(), ref)
+    assert _read(job['path']) == _read(ref)
@@ -0,0 +1,107 @@
+""".hex / .bin writers and readers: round-trips, byte layout, streaming vs memmap export."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import signal_generator_core as sg  # noqa: E402
+
+WIDTHS = [8, 12, 16, 24, 32, 40]
+
+
+def _codes(total_bits, num=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    u = rng.integers(0, 1 << total_bits, num, dtype=np.uint64)
+    u[:3] = [0, (1 << total_bits) - 1, 1 << (total_bits - 1)]
+    return u
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('total_bits', WIDTHS)
+def test_hex_matches_baseline_and_round_trips(tmp_path, total_bits):
+    u = _codes(total_bits)
+    path = str(tmp_path / 'x.hex')
+    assert sg.write_quantized([u[:1000], u[1000:]], path, 'hex', total_bits) == u.size
+    # 原始实现：每行 '{:0NX}'.format(v)
+    digits = (total_bits + 3) // 4
+    ref = ''.join(('{:0%dX}' % digits).format(int(v)) + os.linesep for v in u).encode('ascii')
+    assert _read(path) == ref
+    assert sg.make_hex_lines(u, total_bits) == ref.decode('ascii').split()
+    assert np.array_equal(sg.hex_decode(ref, total_bits), u)
+    assert np.array_equal(sg.hex_decode(ref.lower().replace(b'\n', b'\r\n'), total_bits), u)
+
+
+@pytest.mark.parametrize('byteorder', ['big', 'little'])
+@pytest.mark.parametrize('total_bits', WIDTHS)
+def test_bin_matches_baseline_and_round_trips(tmp_path, total_bits, byteorder):
+    u = _codes(total_bits)
+    path = str(tmp_path / 'x.bin')
+    sg.save_bin(u, total_bits, path, byteorder)
+    nbytes = (total_bits + 7) // 8
+    ref = b''.join(int(v).to_bytes(nbytes, byteorder=byteorder) for v in u)
+    assert _read(path) == ref
+    mapped = sg.MappedSamples(path, total_bits, signed=False, byteorder=byteorder)
+    assert len(mapped) == u.size
+    assert np.array_equal(mapped.uints(), u)
+    assert np.array_equal(mapped.uints(slice(5, 2000, 7)), u[5:2000:7])
+    assert np.array_equal(mapped.uints(np.array([2, 0, 1])), u[[2, 0, 1]])
+
+
+@pytest.mark.parametrize('total_bits', [24, 40])
+def test_little_endian_signed_memmap_import(tmp_path, total_bits):
+    frac = total_bits - 1
+    v = np.random.default_rng(3).uniform(-1.0, 1.0, 5000)
+    u = sg.quantize_signed(v, total_bits, frac, compact=True)
+    path = str(tmp_path / 'x.bin')
+    sg.save_bin(u, total_bits, path, 'little')
+    x = sg.load_samples(path, 'bin', total_bits, frac, signed=True, byteorder='little')
+    assert isinstance(x, sg.MappedSamples)
+    ref = sg.sign_extend(u, total_bits) / 2.0 ** frac
+    assert np.array_equal(x[:], ref)
+    assert np.array_equal(x[100:200], ref[100:200])
+    assert np.max(np.abs(x[:] - v)) <= 2.0 ** -total_bits
+
+
+@pytest.mark.parametrize('fmt', ['bin', 'hex'])
+@pytest.mark.parametrize('unsigned', [False, True])
+def test_memmap_export_matches_streaming(tmp_path, monkeypatch, fmt, unsigned):
+    # 小窗口：导出跨越多个 memmap 窗口
+    monkeypatch.setattr(sg, 'EXPORT_WINDOW_BYTES', 4096)
+    paths = []
+    for memmap in (False, True):
+        stream = sg.SineStream(20011, 0.8, 321.0, 0.2, 48000.0, block_size=1500)
+        path = str(tmp_path / ('%d.%s' % (memmap, fmt)))
+        assert sg.export_quantized_stream(stream, path, fmt, 24, 23, unsigned, 'little', memmap=memmap) == 20011
+        paths.append(path)
+    assert _read(paths[0]) == _read(paths[1])
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_quantized_writer_interleaves_and_truncates(tmp_path, memmap):
+    u = _codes(12, 200).reshape(-1, 2)
+    path = str(tmp_path / 'x.bin')
+    with sg.QuantizedWriter(path, 'bin', 12, 'big', count=250 if memmap else None) as w:
+        w.write(u[:40])
+        w.write(u[40:])
+    assert w.count == 200
+    assert _read(path) == sg.uints_to_bytes(u.reshape(-1), 12, 'big')
+
+
+def test_multichannel_layouts(tmp_path):
+    base = {'type': 'sine', 'amplitude': 0.5, 'offset': 0.0, 'sample_rate': 8000.0, 'samples': 5000}
+    chans = [dict(base, frequency=100.0), dict(base, frequency=300.0, phase=1.0)]
+    stream = sg.MultiChannelStream(chans, block_size=999)
+    data = stream.read_all()
+    inter, sep = str(tmp_path / 'i.hex'), str(tmp_path / 's.hex')
+    assert sg.export_quantized_stream(stream, inter, 'hex', 16, 15) == 5000
+    assert sg.export_quantized_stream(stream, sep, 'hex', 16, 15, layout='separate') == 5000
+    codes = sg.quantize_signed(data, 16, 15)
+    assert np.array_equal(sg.hex_decode(_read(inter), 16), codes.reshape(-1))
+    for c, p in enumerate(sg.channel_paths(sep, 2)):
+        assert np.array_equal(sg.hex_decode(_read(p), 16), codes[:, c])
@@ -0,0 +1,173 @@
+"""FixedPointFIR against exact integer arithmetic, AdaptiveFilter block splits, WelchPSD."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import signal_generator_core as sg  # noqa: E402
+
+
+def _splits(n, seed):
+    """Random chunk boundaries 0 < ... < n (chunks of 1 .. 300 samples)."""
+    rng = np.random.default_rng(seed)
+    cuts = np.cumsum(rng.integers(1, 300, n))
+    return np.concatenate(([0], cuts[cuts < n], [n]))
+
+
+def reference_fir(x, coef, acc_bits, shift, out_bits, rounding, overflow):
+    """Direct-form FIR in Python ints: (outputs, accumulator overflows, output overflows)."""
+    out, acc_over, out_over = [], 0, 0
+    alim, olim = 1 << (acc_bits - 1), 1 << (out_bits - 1)
+    for n in range(len(x)):
+        acc = sum(int(coef[k]) * int(x[n - k]) for k in range(len(coef)) if n - k >= 0)
+        if not -alim <= acc < alim:
+            acc_over += 1
+            acc = (acc + alim) % (2 * alim) - alim
+        q, r = divmod(acc, 1 << shift)
+        half = 1 << (shift - 1)
+        if rounding == 'round':
+            q += r >= half
+        elif rounding == 'convergent':
+            q += r > half or (r == half and q % 2 == 1)
+        if not -olim <= q < olim:
+            out_over += 1
+            q = max(-olim, min(olim - 1, q)) if overflow == 'saturate' else (q + olim) % (2 * olim) - olim
+        out.append(q)
+    return np.array(out, dtype=np.int64), acc_over, out_over
+
+
+@pytest.mark.parametrize('rounding', sg.FIXED_FIR_ROUNDING)
+@pytest.mark.parametrize('overflow', ['saturate', 'wrap'])
+@pytest.mark.parametrize('acc_bits', [48, 26])
+def test_fixed_fir_matches_integer_reference(rounding, overflow, acc_bits):
+    rng = np.random.default_rng(5)
+    x = rng.integers(-2 ** 15, 2 ** 15, 2000)
+    x[:50] = 2 ** 15 - 1  # 满幅输入，使输出饱和 / 回绕
+    coef = rng.integers(-2 ** 15, 2 ** 15, 9)
+    coef[0] = 2 ** 15 - 1
+    fir = sg.FixedPointFIR(coef, in_bits=16, in_frac=15, coef_bits=16, coef_frac=15, acc_bits=acc_bits,
+                           out_bits=16, out_frac=15, rounding=rounding, overflow=overflow,
+                           integer_coefficients=True)
+    ref, acc_over, out_over = reference_fir(x, coef, acc_bits, 15, 16, rounding, overflow)
+    cuts = _splits(x.size, 1)
+    y = np.concatenate([fir.process(x[a:b]) for a, b in zip(cuts[:-1], cuts[1:])])
+    assert np.array_equal(y, ref)
+    assert (fir.acc_overflows, fir.out_overflows) == (acc_over, out_over)
+    # 48 位累加器不会溢出，输出饱和 / 回绕；26 位时累加器回绕
+    assert (out_over > 0 and acc_over == 0) if acc_bits == 48 else acc_over > 0
+
+
+@pytest.mark.parametrize('rounding, expected', [
+    ('truncate', [-2, -2, -1, 0, 0, 1]), ('round', [-1, -1, 0, 0, 1, 2]), ('convergent', [-2, -1, 0, 0, 0, 2])])
+def test_shift_round_halves(rounding, expected):
+    # -1.5, -1.25, -0.5, 0.25, 0.5, 1.5 in units of 2^-2
+    assert list(sg.shift_round([-6, -5, -2, 1, 2, 6], 2, rounding)) == expected
+
+
+def test_fixed_fir_codes_round_trip():
+    h = np.hanning(17) / 9.0
+    fir = sg.FixedPointFIR(h, in_bits=24, in_frac=23, coef_bits=18, coef_frac=17, out_bits=24, out_frac=23)
+    assert np.array_equal(fir.coef, np.clip(np.round(h * 2 ** 17), -2 ** 17, 2 ** 17 - 1).astype(np.int64))
+    v = np.sin(np.arange(3000) * 0.01) * 0.9
+    u = sg.quantize_signed(v, 24, 23, compact=True)
+    codes = fir.process_codes(u)
+    fir.reset()
+    y = fir.process(sg.sign_extend(u, 24))
+    assert codes.dtype == sg.uint_dtype(24)
+    assert np.array_equal(sg.sign_extend(codes, 24), y)
+    # 与浮点卷积相差不超过系数量化和输出舍入的误差
+    assert np.max(np.abs(fir.to_values(y) - np.convolve(v, h)[:v.size])) < 1e-4
+
+
+ADAPTIVE_CASES = [
+    dict(algorithm='lms', mu=0.01),
+    dict(algorithm='nlms', mu=0.5, block_size=16),
+    dict(algorithm='lms', mu=0.002, block_size=32, domain='freq'),
+    dict(algorithm='nlms', mu=0.5, domain='freq'),
+    dict(algorithm='fxlms', mu=0.005, block_size=8, secondary_path=[0.0, 0.8, 0.3]),
+    dict(algorithm='fxnlms', mu=0.2, secondary_path=[0.0, 0.8, 0.3], secondary_estimate=[0.0, 0.7, 0.35]),
+]
+
+
+@pytest.mark.parametrize('kw', ADAPTIVE_CASES, ids=lambda kw: '%s-%s' % (kw['algorithm'], kw.get('domain', 'time')))
+def test_adaptive_filter_split_independence(kw):
+    rng = np.random.default_rng(2)
+    x = rng.standard_normal(3000)
+    d = np.convolve(x, [0.5, -0.3, 0.2, 0.1])[:x.size]
+    whole = sg.AdaptiveFilter(32, history=100, **kw)
+    y0, e0 = whole.process(x, d)
+    split = sg.AdaptiveFilter(32, history=100, **kw)
+    cuts = _splits(x.size, 3)
+    parts = [split.process(x[a:b], d[a:b]) for a, b in zip(cuts[:-1], cuts[1:])]
+    y1 = np.concatenate([p[0] for p in parts])
+    e1 = np.concatenate([p[1] for p in parts])
+    # 块内部的求和顺序随切分变化（FFT 与直接计算），只差舍入误差
+    np.testing.assert_allclose(y1, y0, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(e1, e0, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(split.weights, whole.weights, rtol=0, atol=1e-9)
+    assert split.position == whole.position == x.size
+    np.testing.assert_allclose(split.weight_history, whole.weight_history, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(split.error_history, whole.error_history, rtol=1e-9, atol=1e-15)
+
+
+def test_nlms_identifies_the_system():
+    h = np.array([0.5, -0.3, 0.2, 0.1, 0.0, -0.05])
+    x = np.random.default_rng(4).standard_normal(4000)
+    filt = sg.AdaptiveFilter(8, 0.5, 'nlms')
+    filt.process(x, np.convolve(x, h)[:x.size])
+    np.testing.assert_allclose(filt.weights, np.concatenate((h, [0.0, 0.0])), atol=1e-8)
+
+
+def direct_welch(x, nperseg, noverlap, window, nfft, fs):
+    hop = nperseg - noverlap
+    starts = range(0, x.size - nperseg + 1, hop)
+    p = np.mean([np.abs(np.fft.fft(x[s:s + nperseg] * window, nfft)) ** 2 for s in starts], axis=0)
+    p = p[:nfft // 2 + 1] / (fs * np.sum(window ** 2))
+    p[1:(nfft + 1) // 2] *= 2.0
+    return p
+
+
+@pytest.mark.parametrize('window, npfunc', [('hamming', np.hamming), ('hann', np.hanning),
+                                            ('rect', np.ones)])
+@pytest.mark.parametrize('nperseg, overlap, nfft', [(256, 0.5, None), (200, 0.25, 512), (255, 0.0, 255)])
+def test_welch_matches_direct_periodogram(window, npfunc, nperseg, overlap, nfft):
+    rng = np.random.default_rng(6)
+    x = rng.standard_normal(10000) + np.sin(np.arange(10000) * 0.3)
+    welch = sg.WelchPSD(nperseg, overlap, window, nfft, sample_rate=1000.0)
+    cuts = _splits(x.size, 7)
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        welch.update(x[a:b])
+    f, p = welch.psd()
+    n = nfft or nperseg
+    ref = direct_welch(x, nperseg, int(round(overlap * nperseg)), npfunc(nperseg), n, 1000.0)
+    assert np.array_equal(f, np.fft.rfftfreq(n, 1e-3))
+    np.testing.assert_allclose(p, ref, rtol=1e-10)
+
+
+def test_welch_channels_and_short_input():
+    x = np.random.default_rng(8).standard_normal((3000, 2))
+    welch = sg.WelchPSD(256, 0.5, 'hann')
+    welch.update(x)
+    _, p = welch.psd()
+    for c in range(2):
+        np.testing.assert_allclose(p[c], direct_welch(x[:, c], 256, 128, np.hanning(256), 256, 1.0), rtol=1e-10)
+    short = sg.WelchPSD(256)
+    short.update(x[:100, 0])
+    _, p = short.psd()
+    np.testing.assert_allclose(p, direct_welch(x[:100, 0], 100, 0, np.hamming(100), 100, 1.0), rtol=1e-10)
+    with pytest.raises(ValueError):
+        sg.WelchPSD(256).psd()
+
+
+def test_welch_matches_scipy_with_symmetric_window():
+    signal = pytest.importorskip('scipy.signal')
+    x = np.random.default_rng(9).standard_normal(20000)
+    welch = sg.WelchPSD(1024, 0.5, 'hamming', sample_rate=48000.0)
+    welch.update(x)
+    f, p = welch.psd()
+    f2, p2 = signal.welch(x, 48000.0, window=signal.get_window('hamming', 1024, fftbins=False),
+                          nperseg=1024, noverlap=512, detrend=False)
+    np.testing.assert_allclose(f, f2)
+    np.testing.assert_allclose(p, p2, rtol=1e-10)
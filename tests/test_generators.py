@@ -0,0 +1,133 @@
+"""PRBS, square wave and quantizers against the original per-sample algorithms."""
+import os
+import sys
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import signal_generator_core as sg  # noqa: E402
+
+
+def baseline_lfsr(order, seed, num):
+    """The original bit-by-bit Fibonacci LFSR of generate_prbs."""
+    mask = 0
+    for t in sg.LFSR_TAPS[order]:
+        mask |= 1 << t
+    if seed is None or int(seed) == 0:
+        reg = (1 << order) - 1
+    else:
+        reg = int(seed) & ((1 << order) - 1) or 1
+    out = np.empty(num, dtype=np.int8)
+    for i in range(num):
+        out[i] = reg & 1
+        fb = bin(reg & mask).count('1') & 1
+        reg = (reg >> 1) | (fb << (order - 1))
+        if reg == 0:
+            reg = (1 << order) - 1
+    return out
+
+
+def baseline_quantize_signed(values, total_bits, frac_bits):
+    ints = np.round(values * 2 ** frac_bits).astype(np.int64)
+    ints = np.clip(ints, -2 ** (total_bits - 1), 2 ** (total_bits - 1) - 1)
+    return (ints & ((1 << total_bits) - 1)).astype(np.uint64)
+
+
+def baseline_quantize_unsigned(values, total_bits):
+    shifted = values - values.min()
+    vmax = shifted.max()
+    if vmax == 0:
+        return np.zeros_like(shifted, dtype=np.uint64)
+    return np.round(shifted * ((2 ** total_bits - 1) / float(vmax))).astype(np.uint64)
+
+
+@pytest.mark.parametrize('order', sorted(sg.LFSR_TAPS))
+@pytest.mark.parametrize('seed', [None, 0, 1, 0x5A5A5A5B])
+def test_prbs_matches_bitwise_lfsr(order, seed):
+    num = 5000
+    ref = baseline_lfsr(order, seed, num)
+    assert np.array_equal(sg.generate_prbs(num, 0.5, seed, order), 0.5 * (2 * ref - 1))
+    # 跳跃到序列中间（GF(2) 矩阵幂）与逐位运行一致
+    assert np.array_equal(sg.generate_prbs(1000, 1.0, seed, order, start=3210), 2 * ref[3210:4210] - 1)
+
+
+@pytest.mark.parametrize('block_size', [1, 63, 64, 1000])
+def test_prbs_stream_blocks(block_size):
+    ref = baseline_lfsr(15, 12345, 70000)
+    stream = sg.PRBSStream(70000, 1.0, 12345, 15, block_size=block_size)
+    assert np.array_equal(np.concatenate(list(stream)), 2.0 * ref - 1)
+
+
+@pytest.mark.parametrize('frequency, duty, sample_rate', [
+    (1000.0, 0.5, 48000.0), (997.123, 0.3, 48000.0), (440.0, 0.25, 44100.0), (0.1, 0.5, 10.0)])
+def test_square_matches_exact_cycle_position(frequency, duty, sample_rate):
+    # 原始算法 (t * f) % 1 < duty，按精确有理数计算，不受浮点时间向量的误差影响
+    ratio = Fraction(repr(frequency)) / Fraction(repr(sample_rate))
+    d = Fraction(repr(duty))
+    num = 20000
+    ref = np.array([1.0 if (n * ratio) % 1 < d else -1.0 for n in range(num)])
+    assert np.array_equal(sg.generate_square(num, 1.0, frequency, duty, sample_rate), ref)
+    # 与原始浮点算法只在周期边界上可能差一个样本
+    t = np.arange(num) / sample_rate
+    old = np.where((t * frequency) % 1.0 < duty, 1.0, -1.0)
+    assert np.count_nonzero(old != ref) <= num // 100
+
+
+def test_square_far_into_the_signal():
+    stream = sg.SquareStream(10 ** 10 + 100, 1.0, 997.123, 0.3, 48000.0, block_size=100)
+    ratio = Fraction('997.123') / Fraction('48000.0')
+    start = 10 ** 10
+    ref = np.array([1.0 if ((start + n) * ratio) % 1 < Fraction('0.3') else -1.0 for n in range(100)])
+    assert np.array_equal(stream._generate(start, 100), ref)
+
+
+def _values(num=2 * sg.QUANT_CHUNK + 17, seed=1):
+    rng = np.random.default_rng(seed)
+    v = rng.uniform(-1.2, 1.2, num)
+    v[:6] = [-1.0, 1.0, 0.5, -0.5, 1.0 - 2.0 ** -30, 0.0]
+    return v
+
+
+@pytest.mark.parametrize('total_bits, frac_bits', [(8, 7), (12, 11), (16, 15), (24, 23), (32, 31), (40, 39),
+                                                   (16, 12)])
+def test_quantize_signed_matches_baseline(total_bits, frac_bits):
+    v = _values()
+    ref = baseline_quantize_signed(v, total_bits, frac_bits)
+    u = sg.quantize_signed(v, total_bits, frac_bits)
+    assert u.dtype == np.uint64 and np.array_equal(u, ref)
+    c = sg.quantize_signed(v, total_bits, frac_bits, compact=True)
+    assert c.dtype == sg.uint_dtype(total_bits) and np.array_equal(c, ref)
+    out = np.zeros(v.size, dtype=sg.uint_dtype(total_bits))
+    assert sg.quantize_signed(v, total_bits, frac_bits, out=out) is out
+    assert np.array_equal(out, ref)
+
+
+@pytest.mark.parametrize('total_bits', [8, 12, 16, 24, 32])
+def test_quantize_unsigned_matches_baseline(total_bits):
+    v = _values()
+    ref = baseline_quantize_unsigned(v, total_bits)
+    assert np.array_equal(sg.quantize_unsigned(v, total_bits), ref)
+    c = sg.quantize_unsigned(v, total_bits, compact=True)
+    assert c.dtype == sg.uint_dtype(total_bits) and np.array_equal(c, ref)
+    # 分块量化时传入整段信号的 vmin / span
+    lo, hi = sg.value_range(v)
+    blocks = [sg.quantize_unsigned(v[i:i + 1000], total_bits, vmin=lo, span=hi - lo, compact=True)
+              for i in range(0, v.size, 1000)]
+    assert np.array_equal(np.concatenate(blocks), ref)
+
+
+def test_quantize_unsigned_constant():
+    u = sg.quantize_unsigned(np.full(10, 0.3), 12, compact=True)
+    assert u.dtype == np.uint16 and not u.any()
+
+
+@pytest.mark.parametrize('unsigned', [False, True])
+def test_iter_quantized_matches_whole_array(unsigned):
+    stream = sg.SineStream(50000, 0.9, 1234.5, 0.1, 48000.0, offset=0.05, block_size=4096)
+    whole = stream.read_all()
+    stream.reset()
+    codes = np.concatenate(list(sg.iter_quantized(stream, 24, 23, unsigned)))
+    ref = baseline_quantize_unsigned(whole, 24) if unsigned else baseline_quantize_signed(whole, 24, 23)
+    assert np.array_equal(codes, ref)
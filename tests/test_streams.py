@@ -0,0 +1,24 @@
+"""Block-size independence of the signal streams (python -m pytest -q tests)."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import signal_generator_core as sg  # noqa: E402
+
+# 没有短公共周期的音调：method='auto' 选择振荡器组（bank）
+FREQS = [101.3, 257.77, 733.1, 1999.9, 3111.11]
+NUM = 3 * sg.MULTISINE_BANK_BLOCK + 1234
+
+
+@pytest.mark.parametrize('block_size', [1, 7, sg.MULTISINE_BANK_BLOCK - 1, sg.MULTISINE_BANK_BLOCK + 1, 65537])
+def test_multisine_bank_blocks_match_read_all(block_size):
+    whole = sg.MultisineStream(NUM, 0.9, FREQS, 48000.0)
+    assert whole.method == 'bank'
+    ref = whole.read_all()
+    stream = sg.MultisineStream(NUM, 0.9, FREQS, 48000.0, block_size=block_size)
+    blocks = np.concatenate(list(stream))
+    assert np.array_equal(blocks, ref)
+    assert np.array_equal(sg.quantize_signed(blocks, 24, 23), sg.quantize_signed(ref, 24, 23))
@@ -0,0 +1,261 @@
+"""
+Throughput / memory benchmarks for signal_generator_core.py.
+
+Times the generators, quantizers, writers and import parsers at several sizes, plus the cold
+import of the core and GUI modules in a fresh interpreter, and writes the results
+(samples/s, peak traced memory) to a JSON file. With --baseline the run is
+compared against an earlier result file and the script exits with status 1 if any case got
+slower (or hungrier) than the tolerance allows.
+
+Usage (from the repository root):
+
+    python utils/bench_signal_generator.py --out bench.json
+    python utils/bench_signal_generator.py --sizes 1e4 1e6 1e8 --only prbs
+    python utils/bench_signal_generator.py --baseline bench.json --tolerance 0.25
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import signal_generator_core as sg  # noqa: E402
+
+FS = 48000.0
+DEFAULT_SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+
+class Case:
+    """One benchmark: setup(n, tmp) -> state (untimed), run(state) (timed); max_n caps slow cases."""
+
+    def __init__(self, name, run, setup=None, max_n=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda n, tmp: n)
+        self.max_n = max_n
+
+
+def _signal(n):
+    return sg.generate_sine(n, 0.9, 1000.0, 0.0, FS)
+
+
+def _codes(n):
+    return sg.quantize_signed(_signal(n), 24, 23)
+
+
+def _sysid(n):
+    x = sg.generate_white_noise(n, 0.5, FS, 200.0, 2000.0, 101, seed=1)
+    return x, np.convolve(x, np.hanning(256))[:n]
+
+
+def _welch(x):
+    # streamed in 1 Mi-sample blocks, as the GUI's Spectrum tab does
+    w = sg.WelchPSD(8192, 0.5, 'hamming', sample_rate=FS)
+    for i in range(0, x.size, 1 << 20):
+        w.update(x[i:i + (1 << 20)])
+    return w.psd()
+
+
+def _write_file(kind):
+    def setup(n, tmp):
+        path = os.path.join(tmp, 'in_%d.%s' % (n, kind))
+        if kind == 'hex':
+            sg.save_hex(sg.hex_encode(_codes(n), 24), path)
+        elif kind == 'bin':
+            sg.save_bin(_codes(n), 24, path)
+        else:
+            sg.save_raw_csv(_signal(n), path)
+        return path
+    return setup
+
+
+def _out_path(ext):
+    def setup(n, tmp):
+        return os.path.join(tmp, 'out_%d.%s' % (n, ext)), _codes(n)
+    return setup
+
+
+def build_cases():
+    cases = [
+        Case('generate_sine', lambda n: sg.generate_sine(n, 0.9, 1000.0, 0.0, FS)),
+        Case('generate_square', lambda n: sg.generate_square(n, 0.9, 1000.0, 0.3, FS)),
+        # 1000 Hz repeats every 48 samples and is tabulated; 997.123 Hz repeats every 4.8e7 samples
+        # and takes the per-block integer path
+        Case('generate_square_long_period', lambda n: sg.generate_square(n, 0.9, 997.123, 0.3, FS)),
+    ]
+    for order in (7, 15, 23, 31):
+        cases.append(Case('generate_prbs_lfsr%d' % order,
+                          lambda n, o=order: sg.generate_prbs(n, 0.9, seed=1, order=o, mode='lfsr')))
+    cases += [
+        Case('generate_prbs_rng', lambda n: sg.generate_prbs(n, 0.9, seed=1, mode='rng')),
+        Case('generate_white_noise_fir101',
+             lambda n: sg.generate_white_noise(n, 0.5, FS, 200.0, 2000.0, 101, seed=1)),
+        Case('generate_white_noise_fir513',
+             lambda n: sg.generate_white_noise(n, 0.5, FS, 200.0, 2000.0, 513, seed=1)),
+        Case('generate_multisine_50tone',
+             lambda n: sg.generate_multisine(n, 0.9, np.arange(1, 51) * 100.0, FS)),
+        # bit-accurate 512-tap FIR (Q1.17 taps, 48-bit accumulator) on quantized codes
+        Case('fixed_fir_512tap', lambda st: st[0].process(st[1]),
+             lambda n, tmp: (sg.FixedPointFIR(np.hanning(512) / 256.0), sg.sign_extend(_codes(n), 24))),
+        # 512-tap system identification: frequency-domain NLMS and per-sample NLMS
+        Case('adaptive_nlms_fdaf_512tap', lambda st: sg.AdaptiveFilter(512, 0.5, 'nlms', domain='freq').run(*st),
+             lambda n, tmp: _sysid(n)),
+        Case('adaptive_nlms_sample_512tap', lambda st: sg.AdaptiveFilter(512, 0.5, 'nlms').run(*st),
+             lambda n, tmp: _sysid(n), max_n=10 ** 5),
+        Case('welch_psd_8192', lambda x: _welch(x), lambda n, tmp: _signal(n)),
+        Case('quantize_signed', lambda x: sg.quantize_signed(x, 24, 23), lambda n, tmp: _signal(n)),
+        Case('quantize_unsigned', lambda x: sg.quantize_unsigned(x, 24), lambda n, tmp: _signal(n)),
+        Case('make_hex_lines', lambda u: sg.make_hex_lines(u, 24), lambda n, tmp: _codes(n)),
+        Case('save_hex', lambda st: sg.save_hex(sg.make_hex_lines(st[1], 24), st[0]), _out_path('hex')),
+        Case('save_bin', lambda st: sg.save_bin(st[1], 24, st[0]), _out_path('bin')),
+        Case('import_hex', lambda p: sg.load_samples(p, 'hex', 24, 23), _write_file('hex')),
+        # .bin imports are lazy; decode everything so the parse is actually measured
+        Case('import_bin', lambda p: np.asarray(sg.load_samples(p, 'bin', 24, 23)[:]), _write_file('bin')),
+        # np.loadtxt is slow; keep the CSV case to sizes that finish in seconds
+        Case('import_csv', lambda p: sg.load_samples(p, 'csv'), _write_file('csv'), max_n=10 ** 6),
+    ]
+    return cases
+
+
+# 冷启动导入：新解释器中 import 的耗时（减去空解释器的启动时间）
+IMPORT_CASES = [('cold_import_core', 'signal_generator_core'), ('cold_import_gui', 'signal_generator_gui')]
+
+
+def _interpreter_seconds(code, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=ROOT)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run_import_case(name, module, repeat):
+    """Best-of-``repeat`` cold import time of ``module``; n=1, so samples_per_s is imports/s."""
+    seconds = max(1e-6, _interpreter_seconds('import ' + module, repeat) - _interpreter_seconds('pass', repeat))
+    return {'name': name, 'n': 1, 'seconds': seconds, 'samples_per_s': 1.0 / seconds, 'peak_bytes': 0}
+
+
+def run_case(case, n, tmp, repeat):
+    """Best-of-``repeat`` wall time plus the peak traced allocation of one extra run."""
+    state = case.setup(n, tmp)
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        case.run(state)
+        best = min(best, time.perf_counter() - t0)
+    # numpy reports its buffers to tracemalloc; measured separately so tracing does not skew timing
+    tracemalloc.start()
+    try:
+        case.run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del state
+    return {'name': case.name, 'n': n, 'seconds': best,
+            'samples_per_s': n / best if best > 0 else float('inf'), 'peak_bytes': int(peak)}
+
+
+def compare(results, baseline, tolerance, mem_tolerance):
+    """Return regression messages: throughput below (1 - tolerance) x baseline, or peak memory
+    above (1 + mem_tolerance) x baseline (plus 1 MiB slack)."""
+    base = {(r['name'], r['n']): r for r in baseline.get('results', [])}
+    problems = []
+    for r in results:
+        b = base.get((r['name'], r['n']))
+        if b is None:
+            continue
+        if r['samples_per_s'] < b['samples_per_s'] * (1.0 - tolerance):
+            problems.append('%s n=%d: %.3g samples/s vs baseline %.3g (%.0f%% slower)' % (
+                r['name'], r['n'], r['samples_per_s'], b['samples_per_s'],
+                100.0 * (1.0 - r['samples_per_s'] / b['samples_per_s'])))
+        if r['peak_bytes'] > b['peak_bytes'] * (1.0 + mem_tolerance) + (1 << 20):
+            problems.append('%s n=%d: peak %.1f MiB vs baseline %.1f MiB' % (
+                r['name'], r['n'], r['peak_bytes'] / 2.0 ** 20, b['peak_bytes'] / 2.0 ** 20))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark signal_generator_gui generators, '
+                                     'quantizers, writers and parsers.')
+    parser.add_argument('--sizes', nargs='+', type=float, default=DEFAULT_SIZES,
+                        help='sample counts, e.g. 1e4 1e6 1e8 (default: 1e4 .. 1e7)')
+    parser.add_argument('--only', nargs='+', metavar='TEXT', help='run cases whose name contains TEXT')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case, best is kept (default 3)')
+    parser.add_argument('--out', metavar='FILE.json', help='write results here')
+    parser.add_argument('--baseline', metavar='FILE.json', help='compare against an earlier --out file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed throughput loss vs baseline (default 0.25 = 25%%)')
+    parser.add_argument('--mem-tolerance', type=float, default=0.25,
+                        help='allowed peak memory growth vs baseline (default 0.25)')
+    args = parser.parse_args(argv)
+
+    cases = build_cases()
+    if args.only:
+        cases = [c for c in cases if any(t in c.name for t in args.only)]
+    sizes = [int(s) for s in args.sizes]
+
+    results = []
+    tmp = tempfile.mkdtemp(prefix='sg_bench_')
+    try:
+        for case in cases:
+            for n in sizes:
+                if case.max_n is not None and n > case.max_n:
+                    continue
+                r = run_case(case, n, tmp, max(1, args.repeat))
+                results.append(r)
+                print('%-28s n=%-10d %10.4f s  %12.4g samples/s  peak %8.1f MiB' % (
+                    r['name'], n, r['seconds'], r['samples_per_s'], r['peak_bytes'] / 2.0 ** 20))
+                sys.stdout.flush()
+                for f in os.listdir(tmp):
+                    os.remove(os.path.join(tmp, f))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for name, module in IMPORT_CASES:
+        if args.only and not any(t in name for t in args.only):
+            continue
+        r = run_import_case(name, module, max(3, args.repeat))
+        results.append(r)
+        print('%-28s %23.4f s' % (name, r['seconds']))
+
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.mem_tolerance)
+        if problems:
+            print('\nPERFORMANCE REGRESSIONS (%d):' % len(problems))
+            for p in problems:
+                print('  ' + p)
+            return 1
+        print('\nNo regressions against %s' % args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())